@@ -0,0 +1,120 @@
+"""
+Sinks for the debug artifacts (dot files of machines and controls) written
+while sentences and similarities are processed. The artifacts are rendered
+only if the sink is enabled; they can be written right away, or by a
+background thread, so that processing does not wait for the file system.
+"""
+
+import logging
+import os
+from Queue import Queue, Full
+from threading import Thread
+
+DISABLED, SYNC, BACKGROUND = 'disabled', 'sync', 'background'
+
+class ArtifactSink(object):
+    """Drops every artifact; the default."""
+    enabled = False
+
+    def write(self, file_name, render):
+        """
+        Writes an artifact.
+        @param file_name relative to the directory of the sink.
+        @param render called without arguments, returns the contents (a
+               str); only called if the sink is enabled.
+        """
+        pass
+
+    def flush(self):
+        """Waits until the artifacts written so far are written."""
+        pass
+
+    def close(self):
+        """Writes the artifacts not written yet."""
+        pass
+
+class SyncArtifactSink(ArtifactSink):
+    """Writes the artifacts under @p path as they come."""
+    enabled = True
+
+    def __init__(self, path='.'):
+        self.path = path
+
+    def write(self, file_name, render):
+        self._write_file(file_name, render())
+
+    def _write_file(self, file_name, contents):
+        file_name = os.path.join(self.path, file_name)
+        directory = os.path.dirname(file_name)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(file_name, 'w') as f:
+            f.write(contents)
+
+class BackgroundArtifactSink(SyncArtifactSink):
+    """
+    Renders the artifacts as they come, and writes them from a daemon
+    thread. At most @p queue_size artifacts wait to be written; when the
+    queue is full, artifacts are dropped rather than waited for. The
+    artifacts still in the queue are lost if the process exits before
+    close() (or, in a process that is killed, flush()) is called.
+    """
+    def __init__(self, path='.', queue_size=1000):
+        SyncArtifactSink.__init__(self, path)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._start()
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.queue = Queue(self.queue_size)
+        self.thread = Thread(target=self._writer)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, file_name, render):
+        if self.pid != os.getpid():
+            # threads do not survive fork(): a forked worker needs its own
+            self._start()
+        try:
+            self.queue.put_nowait((file_name, render()))
+        except Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                logging.warning(
+                    'artifact queue is full, dropping {0}'.format(file_name))
+
+    def _writer(self):
+        while True:
+            file_name, contents = self.queue.get()
+            try:
+                if file_name is not None:
+                    self._write_file(file_name, contents)
+            except Exception:
+                logging.exception('cannot write artifact {0}'.format(
+                    file_name))
+            finally:
+                self.queue.task_done()
+            if file_name is None:
+                return
+
+    def flush(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put((None, None))
+            self.thread.join()
+        if self.dropped:
+            logging.warning('{0} artifacts were dropped'.format(self.dropped))
+
+def create_sink(mode=DISABLED, path='.', queue_size=1000):
+    """Returns the ArtifactSink of @p mode."""
+    if mode == DISABLED:
+        return ArtifactSink()
+    elif mode == SYNC:
+        return SyncArtifactSink(path)
+    elif mode == BACKGROUND:
+        return BackgroundArtifactSink(path, queue_size)
+    raise ValueError('unknown artifact mode: {0}'.format(mode))
@@ -35,20 +35,31 @@ class AVM(object):
         return self.name
 
     def set_satisfaction(self, bool_str):
+        """
+        Sets the boolean expression of attribute names that satisfied()
+        evaluates instead of checking the required attributes. It is parsed
+        once, into a function that evaluates it.
+        """
         self.bool_str = bool_str
 
         boolOperand = Word(alphas + '_') | oneOf("True False")
-        self.bool_expr = operatorPrecedence( boolOperand,
+        grammar = operatorPrecedence( boolOperand,
             [
             ("not", 1, opAssoc.RIGHT, self.notop),
             ("or",  2, opAssoc.LEFT,  self.orop),
             ("and", 2, opAssoc.LEFT,  self.andop),
             ])
+        expr = grammar.parseString(bool_str)[0]
+        if isinstance(expr, basestring):
+            # a single operand is returned as it is
+            self.bool_expr = lambda: expr
+        else:
+            self.bool_expr = expr
 
     def satisfied(self):
         """Returns @c True, if all required arguments are filled in."""
         if self.bool_expr is not None:
-            return self.bool_expr.parseString(self.bool_str)[0]
+            return self.bool_expr()
         else:
             for value in self.__data.values():
                 if ((value[AVM.REQUIRED] == AVM.RREQ and value[AVM.VALUE] is None)
@@ -86,6 +97,14 @@ class AVM(object):
                 ret[k] = unicode(v)
         return ret
 
+    def copy(self):
+        """Returns a copy with its own values; the matchers are shared."""
+        avm = AVM(self.name)
+        avm.__data = dict((k, list(v)) for k, v in self.__data.iteritems())
+        if self.bool_str is not None:
+            avm.set_satisfaction(self.bool_str)
+        return avm
+
     def clear(self):
         keys = self.__data.keys()
         for key in keys:
@@ -108,43 +127,46 @@ class AVM(object):
         return u'{' + u', '.join(u'{0}: {1}'.format(key, self[key]) for key in self) + u'}'
     
     # -------------------------- bool functions for satisfied() ----------------
+    # The parse actions of set_satisfaction() compile each operation into a
+    # function. The operands are attribute names (filled if not None),
+    # 'True' and 'False' (both true, as bool() of the strings), or the
+    # functions of the nested operations. When an operation is evaluated,
+    # its nested operations are evaluated first, all of them, as they used
+    # to be while the expression was parsed; then the operands in order,
+    # until the result is decided.
+
+    def operand_value(self, a):
+        if a in ('True', 'False'):
+            return bool(a)
+        else:
+            return self[a] is not None
 
-    def andop(self, t):
+    def _compile_op(self, t, decisive):
+        """Compiles an and (@p decisive is False) or an or (True)."""
         args = t[0][0::2]
-        for a in args:
-            if isinstance(a,basestring):
-                if a in set(['True', 'False']):
-                    v = bool(a)
+        nested = [a for a in args if not isinstance(a, basestring)]
+
+        def evaluate():
+            values = iter([bool(a()) for a in nested])
+            for a in args:
+                if isinstance(a, basestring):
+                    v = self.operand_value(a)
                 else:
-                    v = self[a] is not None
-            else:
-                v = bool(a)
-            if not v:
-                return False
-        return True
+                    v = values.next()
+                if v == decisive:
+                    return decisive
+            return not decisive
+        return evaluate
+
+    def andop(self, t):
+        return self._compile_op(t, False)
 
     def orop(self, t):
-        args = t[0][0::2]
-        for a in args:
-            if isinstance(a,basestring):
-                if a in set(['True', 'False']):
-                    v = bool(a)
-                else:
-                    v = self[a] is not None
-            else:
-                v = bool(a)
-            if v:
-                return True
-        return False
+        return self._compile_op(t, True)
 
     def notop(self, t):
         arg = t[0][1]
-        if isinstance(arg,basestring):
-            if arg in set(['True', 'False']):
-                v = bool(arg)
-            else:
-                v = self[arg] is not None
+        if isinstance(arg, basestring):
+            return lambda: not self.operand_value(arg)
         else:
-            v = bool(arg)
-        return not v
-
+            return lambda: not arg()
@@ -0,0 +1,92 @@
+"""
+Runs Wrapper.run() on a corpus. The input has a sentence per line, in the
+JSON form of the format SentenceParser.parse() reads, e.g.
+
+    [[[["The", "the/ART"], ["snake", "snake/NOUN"]], "NP"],
+     ["ate", "eat/VERB<PAST>"]]
+
+The output has a JSON object per line, in the order of the input: the index
+of the line of the sentence (counted from 0, empty lines included), and the
+AVM dicts returned by SpreadingActivation.activation_loop() for it, or the
+error it raised.
+"""
+
+import argparse
+from ConfigParser import ConfigParser
+from itertools import count, izip, tee
+import json
+import logging
+import sys
+
+from pymachine.wrapper import Wrapper
+
+def read_sentences(stream):
+    """
+    Yields the (line index, sentence) pairs of @p stream; empty lines are
+    skipped, but counted.
+    """
+    for i, line in enumerate(stream):
+        line = line.strip()
+        if line:
+            yield i, json.loads(line)
+
+def write_results(results, stream, indices=None):
+    """
+    Writes the (results, error) pairs of Wrapper.run_many(), of the
+    sentences at @p indices (0, 1, ... by default).
+    """
+    if indices is None:
+        indices = count()
+    for i, (avms, error) in izip(indices, results):
+        if error is None:
+            record = {'sentence': i, 'avms': avms}
+        else:
+            record = {'sentence': i, 'error': error}
+        stream.write(json.dumps(record, default=unicode) + '\n')
+
+def run_corpus(wrapper, in_stream, out_stream, processes=None,
+               chunk_size=10):
+    """Runs the sentences of @p in_stream and writes their results."""
+    # only the sentences run_many() reads ahead are kept for the indices
+    for_indices, for_sentences = tee(read_sentences(in_stream))
+    write_results(
+        wrapper.run_many((sentence for _, sentence in for_sentences),
+                         processes=processes, chunk_size=chunk_size),
+        out_stream, (i for i, _ in for_indices))
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run the spreading activation on a corpus')
+    parser.add_argument('config', help='the config file of the Wrapper')
+    parser.add_argument('-i', '--input', default='-',
+                        help='JSON sentences, one per line; default: stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='default: stdout')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='default: the processes option of the config')
+    parser.add_argument('-c', '--chunk-size', type=int, default=10,
+                        help='sentences sent to a worker at a time')
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s : " +
+        "%(module)s (%(lineno)s) - %(levelname)s - %(message)s")
+    args = parse_args()
+    cfg = ConfigParser()
+    cfg.read(args.config)
+    wrapper = Wrapper(cfg)
+    in_stream = sys.stdin if args.input == '-' else open(args.input)
+    out_stream = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        run_corpus(wrapper, in_stream, out_stream, processes=args.processes,
+                   chunk_size=args.chunk_size)
+    finally:
+        wrapper.close()
+        out_stream.flush()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Similarity of all pairs of lemmas at once, as computed one pair at a time by
+WordSimilarity.lemma_similarity() with the (default) links_and_nodes type.
+
+The link and node sets of the machines (WordSimilarity.get_links_nodes())
+are encoded as rows of sparse 0-1 matrices over integer ids, so that the
+sizes of all the intersections needed for the Jaccard similarities are
+given by matrix products, computed for a block of lemmas at a time. Sparse
+products of the same encoding give the pairs of lemmas that can be similar
+at all (BatchSimilarity.candidates()).
+"""
+
+import logging
+
+import numpy
+from scipy.sparse import csr_matrix, hstack
+
+from pymachine.feature_store import Vocabulary
+
+CONTAINS_LINK_SIM = 0.35
+CONTAINS_NODE_SIM = 0.25
+
+def _sparse_rows(rows, n_columns):
+    """A 0-1 csr_matrix from a list of column id sets."""
+    indptr = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+    indptr[1:] = numpy.cumsum([len(row) for row in rows])
+    indices = numpy.fromiter(
+        (i for row in rows for i in sorted(row)), dtype=numpy.int32,
+        count=indptr[-1])
+    data = numpy.ones(len(indices), dtype=numpy.int32)
+    return csr_matrix((data, indices, indptr), shape=(len(rows), n_columns))
+
+def _jaccard(intersection, sizes1, sizes2):
+    """Jaccard similarities from the sizes of the intersections and of the
+    sets; 0 for pairs of empty sets."""
+    union = sizes1[:, None] + sizes2[None, :] - intersection
+    sim = numpy.zeros(intersection.shape)
+    nonzero = intersection > 0
+    sim[nonzero] = intersection[nonzero] / union[nonzero].astype(float)
+    return sim
+
+class BatchSimilarity(object):
+    """
+    Similarities of all pairs of @p lemmas, by blocks of rows. The rules of
+    WordSimilarity._links_and_nodes_similarity() are applied to every pair
+    of machines: 1 if one's printname is a link of the other (0-path),
+    otherwise the greatest of the containment score (0.35 if one's
+    printname is in the links of the other, 0.25 if in its nodes), the
+    Jaccard similarity of the links and that of the nodes, where only links
+    of entities (containing '@') are compared if either machine has such.
+    The similarity of two lemmas is the greatest similarity of their
+    machines, 1 for the same lemma.
+    """
+    def __init__(self, word_sim, lemmas, block_size=200):
+        """
+        @param word_sim a WordSimilarity, for its wrapper's definitions and
+               for get_links_nodes().
+        @param block_size the number of lemmas (rows) computed at a time.
+        """
+        self.word_sim = word_sim
+        self.lemmas = sorted(set(lemmas))
+        self.lemma_index = dict(
+            (lemma, i) for i, lemma in enumerate(self.lemmas))
+        self.block_size = block_size
+        self.encode()
+
+    def encode(self):
+        definitions = self.word_sim.wrapper.definitions
+        links, nodes, names = Vocabulary(), Vocabulary(), Vocabulary()
+        # machines are ordered by lemma: those of lemma i are the rows
+        # from machine_offsets[i] to machine_offsets[i + 1]
+        self.machine_offsets = [0]
+        machine_names = []
+        link_rows, node_rows, entity_rows = [], [], []
+        # machine -> the strings among its links and the printnames in its
+        # links and nodes, as contains() would find them
+        mentions = []
+        for lemma in self.lemmas:
+            for machine in definitions[lemma]:
+                machine_links, machine_nodes = \
+                    self.word_sim.get_links_nodes(machine)
+                machine_names.append(names.id(machine.printname()))
+                link_rows.append(set(links.id(l) for l in machine_links))
+                node_rows.append(set(nodes.id(n) for n in machine_nodes))
+                entity_rows.append(set(
+                    links.id(l) for l in machine_links if "@" in l))
+                mentions.append((
+                    set(l for l in machine_links if not isinstance(l, tuple)),
+                    set(name for l in machine_links for name in (
+                        l if isinstance(l, tuple) else (l,))),
+                    set(machine_nodes)))
+            self.machine_offsets.append(len(machine_names))
+        n_machines = len(machine_names)
+        logging.info('encoded {0} machines of {1} lemmas'.format(
+            n_machines, len(self.lemmas)))
+
+        self.links = _sparse_rows(link_rows, len(links))
+        self.nodes = _sparse_rows(node_rows, len(nodes))
+        self.entities = _sparse_rows(entity_rows, len(links))
+        # only the printnames of the machines can be mentioned
+        rows = [[], [], []]
+        for string_links, link_names, machine_nodes in mentions:
+            for row, mentioned in zip(
+                    rows, (string_links, link_names, machine_nodes)):
+                row.append(set(
+                    names[n] for n in mentioned if n in names))
+        self.string_links, self.link_names, self.node_names = [
+            _sparse_rows(row, len(names)) for row in rows]
+        self.printnames = _sparse_rows(
+            [[i] for i in machine_names], len(names))
+
+        self.link_sizes, self.node_sizes, self.entity_sizes = [
+            numpy.diff(m.indptr) for m in (self.links, self.nodes, self.entities)]
+        self.machine_offsets = numpy.array(self.machine_offsets)
+
+    def _mentioned(self, mentions, rows):
+        """Whether the printname of either machine of each pair in @p rows x
+        all machines is among the @p mentions of the other."""
+        return ((mentions[rows].dot(self.printnames.T) +
+                 self.printnames[rows].dot(mentions.T)).toarray() > 0)
+
+    def machine_sims(self, begin, end):
+        """
+        Returns the similarities of the machines @p begin to @p end and all
+        machines, and whether those are 0-paths.
+        """
+        rows = slice(begin, end)
+        zero_path = self._mentioned(self.string_links, rows)
+        contains_link = self._mentioned(self.link_names, rows)
+        contains_node = self._mentioned(self.node_names, rows)
+        sim = numpy.where(contains_link, CONTAINS_LINK_SIM, numpy.where(
+            contains_node, CONTAINS_NODE_SIM, 0.0))
+
+        link_sim = _jaccard(
+            self.links[rows].dot(self.links.T).toarray(),
+            self.link_sizes[rows], self.link_sizes)
+        node_sim = _jaccard(
+            self.nodes[rows].dot(self.nodes.T).toarray(),
+            self.node_sizes[rows], self.node_sizes)
+        entity_sim = _jaccard(
+            self.entities[rows].dot(self.entities.T).toarray(),
+            self.entity_sizes[rows], self.entity_sizes)
+        has_entities = self.entity_sizes > 0
+        entities = has_entities[rows][:, None] | has_entities[None, :]
+
+        sim = numpy.where(
+            entities, numpy.maximum(sim, entity_sim),
+            numpy.maximum(sim, numpy.maximum(link_sim, node_sim)))
+        sim[zero_path] = 1
+        return sim, zero_path
+
+    def blocks(self):
+        """
+        Yields (first, sims, zero_paths) for each block of lemmas:
+        sims[i, j] is the similarity of lemmas first + i and j, and
+        zero_paths[i, j] tells if it comes from a 0-path (or the lemmas are
+        the same), i.e. is the integer 1 in lemma_similarity().
+        """
+        offsets = self.machine_offsets
+        for first in xrange(0, len(self.lemmas), self.block_size):
+            last = min(first + self.block_size, len(self.lemmas))
+            begin, end = offsets[first], offsets[last]
+            sims, zero_paths = self.machine_sims(begin, end)
+            # max over the machines of each lemma, in both directions
+            sims = self._max_by_lemma(sims, offsets[:-1], 1)
+            sims = self._max_by_lemma(sims, offsets[first:last] - begin, 0)
+            zero_paths = self._max_by_lemma(
+                zero_paths.view(numpy.uint8), offsets[:-1], 1)
+            zero_paths = self._max_by_lemma(
+                zero_paths, offsets[first:last] - begin, 0)
+            # zero paths only count if they give the maximum
+            zero_paths = (zero_paths > 0) & (sims == 1)
+            for i in xrange(first, last):
+                sims[i - first, i] = 1
+                zero_paths[i - first, i] = True
+            yield first, sims, zero_paths
+
+    def candidates(self):
+        """
+        Yields (first, candidates) for each block of lemmas: candidates[i]
+        is the array of the lemmas that share a link or a node with lemma
+        first + i, or mention its printname or are mentioned by it in their
+        links or nodes (a contains() rule or a 0-path). The similarity of
+        the lemma and any other lemma is 0.
+        """
+        n_machines = self.machine_offsets[-1]
+        # lemmas x machines
+        machines = csr_matrix(
+            (numpy.ones(n_machines, dtype=numpy.int32),
+             numpy.arange(n_machines), self.machine_offsets),
+            shape=(len(self.lemmas), n_machines))
+        features = machines.dot(hstack([self.links, self.nodes]).tocsr())
+        mentions = machines.dot(self.link_names + self.node_names)
+        names = machines.dot(self.printnames)
+        for first in xrange(0, len(self.lemmas), self.block_size):
+            last = min(first + self.block_size, len(self.lemmas))
+            rows = slice(first, last)
+            joined = (features[rows].dot(features.T) +
+                      mentions[rows].dot(names.T) +
+                      names[rows].dot(mentions.T)).tocsr()
+            joined.eliminate_zeros()
+            yield first, [joined.indices[joined.indptr[i]:joined.indptr[i + 1]]
+                          for i in xrange(last - first)]
+
+    @staticmethod
+    def _max_by_lemma(matrix, offsets, axis):
+        """
+        Reduces the rows (@p axis 0) or columns (1) of @p matrix by maximum,
+        in groups starting at @p offsets. Empty groups (lemmas without
+        machines) give 0.
+        """
+        sizes = numpy.diff(numpy.append(offsets, matrix.shape[axis]))
+        nonempty = sizes > 0
+        shape = list(matrix.shape)
+        shape[axis] = len(offsets)
+        result = numpy.zeros(shape, dtype=matrix.dtype)
+        if nonempty.any():
+            reduced = numpy.maximum.reduceat(
+                matrix, offsets[nonempty], axis=axis)
+            if axis == 0:
+                result[nonempty] = reduced
+            else:
+                result[:, nonempty] = reduced
+        return result
+
+def format_sim(sim, zero_path):
+    """The similarity as lemma_similarity() returns and SimComparer writes
+    it: the integers 0 and 1 for no similarity and for 0-paths."""
+    if zero_path:
+        return u"1"
+    if sim == 0:
+        return u"0"
+    return u"{0}".format(float(sim))
@@ -1,10 +1,10 @@
 import logging
 import re
 from collections import defaultdict
-from itertools import permutations
+from itertools import chain
 from copy import deepcopy as copy
 
-from fst import FSA, FST
+from fst import FSA, FST, MatchMemo
 from matcher import KRPosMatcher
 from pymachine.machine import Machine
 from pymachine.control import KRPosControl
@@ -28,23 +28,75 @@ class Construction(object):
 
         self.type_ = type_
 
-    def check(self, seq):
+    def check(self, seq, memo=None):
+        """
+        Whether the control accepts @p seq. The frozen control is walked
+        without changing the active states of the control, so a
+        construction shared by LexiconSessions can be checked by several
+        threads at the same time.
+        @param memo a MatchMemo, to reuse the matcher outcomes of earlier
+               checks of the same machines.
+        """
         #don't create debug messages unless necessary, will slow down SA
         #logging.debug((u"Checking {0} construction for matching with " +
         #              u"{1} machines").format(self.name,
         #              u" ".join(unicode(m) for m in seq)).encode("utf-8"))
-        self.control.reset()
+        control = self.control.freeze()
+        states = control.init
         for machine in seq:
-            self.control.read(machine, dry_run=True)
-        return self.control.in_final()
+            states = control.step(states, machine, memo)
+        return states & control.final != 0
+
+    def matching_sequences(self, machines, max_length, memo=None):
+        """
+        Returns all sequences of at most @p max_length distinct machines from
+        @p machines that check() accepts, shorter ones first, each length in
+        the order of itertools.permutations(). Instead of replaying every
+        permutation, the frozen control is walked from its initial states:
+        prefixes are shared, each step is computed once per (states,
+        machine) and a prefix is dropped as soon as no final state can be
+        reached from it in the remaining steps.
+        @param memo a MatchMemo shared by the constructions checked on the
+               same machines; by default, one for this call.
+        """
+        control = self.control.freeze()
+        if memo is None:
+            memo = MatchMemo()
+        machines = list(machines)
+        used = [False] * len(machines)
+        prefix = []
+        by_length = [[] for _ in xrange(max_length)]
+        distances = {}
+
+        def extend(states):
+            depth = len(prefix)
+            remaining = max_length - depth - 1
+            for i, machine in enumerate(machines):
+                if used[i]:
+                    continue
+                new_states = control.step(states, machine, memo)
+                if new_states not in distances:
+                    distances[new_states] = control.distance(new_states)
+                distance = distances[new_states]
+                if distance is None or distance > remaining:
+                    continue
+                prefix.append(machine)
+                used[i] = True
+                if new_states & control.final:
+                    by_length[depth].append(tuple(prefix))
+                if remaining > 0:
+                    extend(new_states)
+                prefix.pop()
+                used[i] = False
+
+        if max_length > 0:
+            extend(control.init)
+        return list(chain(*by_length))
 
     def run(self, seq):
         """Shorthand for if check: act."""
-        # read the sequence first, and give it to the control
-        self.check(seq)
-
-        # if control got into acceptor state, do something
-        if self.control.in_final():
+        # if control gets into acceptor state on the sequence, do something
+        if self.check(seq):
             return self.act(seq)
         else:
             return None
@@ -126,71 +178,66 @@ class NPConstruction(Construction):
             seq = operator.act(seq)
         return seq
 
-class VerbConstruction(Construction):
-    """A default construction for verbs. It reads definitions, discovers
-    cases, and builds a control from it. After that, the act() will do the
-    linking process, eg. link the verb with other words, object, subject, etc.
-
-    Defines a single Machine as the "working area": the element in X that we
-    follow. An operator represents a relation in phi; however, typically we
-    only care about one element among the potentially infinite number of x's.
-    Hence, it is enough to maintain a single Machine as a placeholder for
-    this element.
+class VerbFrame(object):
     """
-    def __init__(self, name, lexicon, supp_dict, max_depth=3):
-        self.name = name
-        self.lexicon = lexicon
+    The argument frame of a verb: the matchers of the deep cases and
+    supplementary regexps found in its definition, and the transitions of
+    the hypercube control built from them. It only depends on the static
+    definition of the verb, so it is built once per lexicon and shared by the
+    VerbConstructions of the verb.
+    """
+    def __init__(self, definition, supp_dict, max_depth=3):
         self.supp_dict = supp_dict
         self.max_depth = max_depth
         self.matchers = {}
-        self.working_area = [Machine(None, KRPosControl('stem/VERB'))]
-        # indexing 0th element in static because that is the canonical machine
-        self.discover_arguments(lexicon.static[name][0])
-        control = self.generate_control()
-        self.case_pattern = re.compile("N(OUN|P)[^C]*CAS<([^>]*)>")
-        Construction.__init__(self, name, control)
-        self.activated = False
-        logging.info('VerbConstruction {0} created. Matchers: {1}'.format(
-            self.name, self.matchers))
-        logging.info('Control: {0}'.format(self.control))
-        f = open('control.dot', 'w')
-        f.write(self.control.to_dot())
-
-    def generate_control(self):
-        arguments = self.matchers.keys()
+        self.discover_arguments(definition)
+        self.arguments = self.matchers.keys()
+        self.generate_transitions()
+
+    @staticmethod
+    def get(lexicon, name, supp_dict, max_depth=3):
+        """Returns the frame of the verb @p name, cached in @p lexicon."""
+        key = (name, max_depth)
+        frame = lexicon.verb_frames.get(key)
+        if frame is None or frame.supp_dict is not supp_dict:
+            # indexing 0th element in static because that is the canonical
+            # machine
+            frame = VerbFrame(lexicon.static[name][0], supp_dict, max_depth)
+            lexicon.verb_frames[key] = frame
+            logging.info('VerbFrame {0} created. Matchers: {1}'.format(
+                name, frame.matchers))
+        return frame
+
+    def generate_transitions(self):
+        """
+        Generates the states and transitions of the control: state -> a list
+        of (matcher, output state, argument) triples, where argument is
+        @c None for the transition that reads the verb.
+        """
+        arguments = self.arguments
+        n_subsets = 1 << len(arguments)
 
         # this will be a hypercube
-        control = FST()
-
-        # zero state is for verb
-        control.add_state("0", is_init=True, is_final=False)
-
-        # inside states for the cube, except the last, accepting state
-        for i in xrange(1, pow(2, len(arguments))):
-            control.add_state(str(i), is_init=False, is_final=False)
-
-        # last node of the hypercube
-        control.add_state(
-            str(int(pow(2, len(arguments)))),
-            is_init=False, is_final=True)
+        # zero state is for verb; the last node is the accepting state
+        self.final_state = str(n_subsets)
+        self.states = [str(i) for i in xrange(n_subsets + 1)]
 
         # first transition
-        control.add_transition(KRPosMatcher("VERB"), [ExpandOperator(
-            self.lexicon, self.working_area)], "0", "1")
-
-        # count every transition as an increase in number of state
-        for path in permutations(arguments):
-            actual_state = 1
-            for arg in path:
-                increase = pow(2, arguments.index(arg))
-                new_state = actual_state + increase
-                control.add_transition(
-                    self.matchers[arg],
-                    [FillArgumentOperator(arg, self.working_area)],
-                    str(actual_state), str(new_state))
-
-                actual_state = new_state
-        return control
+        transitions = {"0": {KRPosMatcher("VERB"): ("1", None)}}
+
+        # the other states are 1 + the bit set of the arguments already
+        # read, and reading argument i adds 2^i; if two arguments have the
+        # same matcher, the one with the greater index is kept
+        for subset in xrange(n_subsets - 1):
+            edges = transitions[str(subset + 1)] = {}
+            for i, arg in enumerate(arguments):
+                if not subset & (1 << i):
+                    edges[self.matchers[arg]] = (
+                        str(subset + 1 + (1 << i)), arg)
+        self.transitions = dict(
+            (state, [(matcher, out_state, arg)
+                     for matcher, (out_state, arg) in edges.iteritems()])
+            for state, edges in transitions.iteritems())
 
     def discover_arguments(self, machine, depth=0):
         if depth > self.max_depth:
@@ -222,12 +269,76 @@ class VerbConstruction(Construction):
 
                 # recursive call
                 self.discover_arguments(part_machine, depth=depth+1)
+        if depth == 0:
+            del self.traversed
+
+class VerbConstruction(Construction):
+    """A default construction for verbs. It reads definitions, discovers
+    cases, and builds a control from it. After that, the act() will do the
+    linking process, eg. link the verb with other words, object, subject, etc.
+
+    Defines a single Machine as the "working area": the element in X that we
+    follow. An operator represents a relation in phi; however, typically we
+    only care about one element among the potentially infinite number of x's.
+    Hence, it is enough to maintain a single Machine as a placeholder for
+    this element.
 
-    def check(self, seq):
+    The arguments and the shape of the control come from the VerbFrame of
+    the verb, cached in the lexicon; a construction only has its own working
+    area, operators and control state.
+    """
+    case_pattern = re.compile("N(OUN|P)[^C]*CAS<([^>]*)>")
+
+    def __init__(self, name, lexicon, supp_dict, max_depth=3,
+                 artifacts=None):
+        """
+        @param artifacts an ArtifactSink for the dot file of the control;
+               by default, it is not written.
+        """
+        self.name = name
+        self.lexicon = lexicon
+        self.supp_dict = supp_dict
+        self.max_depth = max_depth
+        self.frame = VerbFrame.get(lexicon, name, supp_dict, max_depth)
+        self.matchers = self.frame.matchers
+        self.working_area = [Machine(None, KRPosControl('stem/VERB'))]
+        control = self.generate_control()
+        Construction.__init__(self, name, control)
+        self.activated = False
+        if artifacts is not None:
+            artifacts.write('control.dot', self.control.to_dot)
+
+    def generate_control(self):
+        """
+        Builds the control from the transitions of the frame, with the
+        operators of this construction.
+        """
+        frame = self.frame
+        control = FST()
+        for state in frame.states:
+            control.add_state(state, is_init=(state == "0"),
+                              is_final=(state == frame.final_state))
+        operators = dict(
+            (arg, [FillArgumentOperator(arg, self.working_area)])
+            for arg in frame.arguments)
+        operators[None] = [ExpandOperator(self.lexicon, self.working_area)]
+        for state, edges in frame.transitions.iteritems():
+            control.transitions[state] = dict(
+                (matcher, (out_state, operators[arg]))
+                for matcher, out_state, arg in edges)
+        return control
+
+    def matching_sequences(self, machines, max_length, memo=None):
+        if self.activated:
+            return []
+        return Construction.matching_sequences(
+            self, machines, max_length, memo)
+
+    def check(self, seq, memo=None):
         if self.activated:
             return False
         else:
-            res = Construction.check(self, seq)
+            res = Construction.check(self, seq, memo)
             if res:
                 logging.debug('check is True!')
             #logging.debug("Result of check is {0}".format(res) +
@@ -264,7 +375,11 @@ class AVMConstruction(Construction):
             state_num += 1
         return control
 
-    def check(self, seq):
+    def copy(self):
+        """Returns a construction of a copy of the AVM."""
+        return AVMConstruction(self.avm.copy())
+
+    def check(self, seq, memo=None):
         return True
 
     def act(self, seq):
@@ -3,7 +3,7 @@ control does syntax-related things"""
 
 import logging
 
-from hunmisc.utils.readkr import kr_to_dictionary as kr2dict
+from pymachine.kr import FeatStruct, parse_kr
 
 class Control(object):
     def __init__(self, machine=None):
@@ -37,7 +37,13 @@ class PosControl(Control):
 class KRPosControl(Control):
     def __init__(self, pos, machine=None):
         Control.__init__(self, machine)
-        self.kr = kr2dict(pos, True)
+        # shared with the other controls of the same code until changed
+        self.kr = parse_kr(pos, True)
+
+    def set_feature(self, key, value):
+        if isinstance(self.kr, FeatStruct):
+            self.kr = dict(self.kr)
+        self.kr[key] = value
 
     def to_debug_str(self):
         return self.__to_debug_str(0)
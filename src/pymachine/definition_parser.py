@@ -496,38 +496,293 @@ class DefinitionParser(object):
         self.unify(machine)
         return machine
 
-def read_defs(f, language_index=0, add_indices=False, loop_to_defendum=True):
-    def_parser = DefinitionParser()
+class FastDefinitionParser(DefinitionParser):
+    """
+    A hand-written parser for the same grammar as DefinitionParser, with the
+    same output. The pyparsing grammar picks the longest match among the
+    alternatives of expression, binexpr, unexpr and argexpr (the first one on
+    ties), trying each of them from scratch. Here every rule is a method that
+    is evaluated at most once per input position, and the lexical rules
+    (Word, Combine) are single regular expressions.
+    """
+    def init_parser(self):
+        def chars(s):
+            return '[{0}]+'.format(re.escape(s))
+
+        disambig_id = '(?:{0}{1})?'.format(re.escape(id_sep), chars(nums))
+        self.whitespace_re = re.compile('[ \t\n\r]*')
+        self.unary_word_re = re.compile(
+            '-?' + chars(string.lowercase + "_" + nums) + disambig_id)
+        self.binary_word_re = re.compile(
+            chars(string.uppercase + "_" + nums) + disambig_id)
+        # (prefix, word) pairs of the grouped unaries
+        self.prefixed_unaries = [
+            (deep_pre, re.compile(chars(string.uppercase))),
+            (DefinitionParser.langspec_pre,
+             re.compile(chars(string.uppercase + "_"))),
+            (avm_pre, re.compile(chars(string.ascii_letters + "_"))),
+            (enc_pre, re.compile(chars(alphanums + "_-")))]
+
+    def parse(self, s):
+        self.s = s
+        self.memo = {}
+        res = self._definition(0)
+        if res is None:
+            raise pyparsing.ParseException(s, 0, "Expected definition")
+        end = self._skip(res[0])
+        if end != len(s):
+            raise pyparsing.ParseException(s, end, "Expected end of text")
+        return res[1]
+
+    # Every rule takes the position to start at and returns the position
+    # after the match and the list of tokens, or None if it does not match.
+
+    def _skip(self, pos):
+        return self.whitespace_re.match(self.s, pos).end()
+
+    def _literal(self, lit, pos):
+        pos = self._skip(pos)
+        if self.s.startswith(lit, pos):
+            return pos + len(lit), [lit]
+        return None
+
+    def _regex(self, regex, pos):
+        m = regex.match(self.s, self._skip(pos))
+        if m is None:
+            return None
+        return m.end(), [m.group()]
+
+    def _sequence(self, pos, *rules):
+        """@param rules rule methods or literals, matched one after the
+        other."""
+        tokens = []
+        for rule in rules:
+            if type(rule) in DefinitionParser._str:
+                res = self._literal(rule, pos)
+            else:
+                res = rule(pos)
+            if res is None:
+                return None
+            pos, rule_tokens = res
+            tokens.extend(rule_tokens)
+        return pos, tokens
+
+    def _longest(self, pos, *alternatives):
+        """The longest match of @p alternatives, each a tuple of rules, as
+        one group."""
+        best = None
+        for alternative in alternatives:
+            res = self._sequence(pos, *alternative)
+            if res is not None and (best is None or res[0] > best[0]):
+                best = res
+        if best is None:
+            return None
+        return best[0], [best[1]]
+
+    def _memoized(self, rule, pos):
+        key = rule, pos
+        if key not in self.memo:
+            self.memo[key] = getattr(self, rule)(pos)
+        return self.memo[key]
+
+    def _definition(self, pos):
+        # D -> E | E, D
+        res = self._expression(pos)
+        if res is None:
+            return None
+        pos, tokens = res[0], list(res[1])
+        while True:
+            res = self._sequence(pos, self.clause_sep, self._expression)
+            if res is None:
+                return pos, [tokens]
+            pos = res[0]
+            # the separator is not part of the output
+            tokens.extend(res[1][1:])
+
+    def _expression(self, pos):
+        return self._memoized('_expression_', pos)
+
+    def _expression_(self, pos):
+        return self._longest(
+            pos,
+            (self._unexpr,),
+            (self._binexpr,),
+            (self._unary, self.lp, self._expression, self.rp),
+            (self.left_defa, self._expression, self.right_defa))
+
+    def _binexpr(self, pos):
+        return self._memoized('_binexpr_', pos)
+
+    def _binexpr_(self, pos):
+        return self._longest(
+            pos,
+            (self._argexpr, self._binary),
+            (self._binary, self._argexpr),
+            (self._argexpr, self._binary, self._argexpr),
+            (self._binary, self.lb, self._expression, self.part_sep,
+             self._expression, self.rb))
+
+    def _unexpr(self, pos):
+        return self._memoized('_unexpr_', pos)
+
+    def _unexpr_(self, pos):
+        return self._longest(
+            pos,
+            (self._unary,),
+            (self._unary, self.lb, self._definition, self.rb),
+            (self._unary, self.lp, self._unary, self.rp))
+
+    def _argexpr(self, pos):
+        return self._memoized('_argexpr_', pos)
+
+    def _argexpr_(self, pos):
+        return self._longest(
+            pos,
+            (self._unexpr,),
+            (self.lb, self._definition, self.rb),
+            (self.left_defa, self._argexpr, self.right_defa),
+            (self.prime,))
+
+    def _unary(self, pos):
+        return self._memoized('_unary_', pos)
+
+    def _unary_(self, pos):
+        # the first matching alternative, not the longest
+        res = self._regex(self.unary_word_re, pos)
+        if res is not None:
+            return res
+        for prefix, word_re in self.prefixed_unaries:
+            res = self._literal(prefix, pos)
+            if res is not None:
+                word = self._regex(word_re, res[0])
+                if word is not None:
+                    return word[0], [[prefix] + word[1]]
+        res = self._sequence(pos, self.left_defa, self._unary,
+                             self.right_defa)
+        if res is not None:
+            return res[0], [res[1]]
+        return None
+
+    def _binary(self, pos):
+        res = self._regex(self.binary_word_re, pos)
+        if res is not None:
+            return res
+        res = self._sequence(pos, deep_pre, 'REL')
+        if res is not None:
+            return res[0], [res[1]]
+        return None
+
+def _parse_def_line(def_parser, line, language_index, add_indices,
+                    loop_to_defendum):
+    """
+    Parses a line of a definition file for read_defs().
+    @return a (machine, level, message) triple. @c machine is @c None if the
+            line yields no definition; @c message, if not @c None, is to be
+            logged at @c level.
+    """
+    fields = line.strip('\n').split('\t')
+    if len(fields) != 9:
+        return None, logging.WARNING, \
+            "Wrong number of fields ({}) in {}".format(len(fields), fields)
+    forms_in_langs = fields[:4]
+    id_, dv, pos, def_, comment = fields[4:]
+    if not def_:
+        return None, None, None
+    logging.debug("Parsing: {0}".format(line))
+    printname = forms_in_langs[language_index]
+    try:
+        m = def_parser.parse_into_machines(printname, id_, def_,
+                                           add_indices, loop_to_defendum)
+    except pyparsing.ParseException, pe:
+        return None, logging.ERROR, 'Cannot parse {}/{}: {}\n{}'.format(
+            printname, id_, def_, pe)
+    if m.partitions[0] == []:
+        return None, logging.DEBUG, \
+            'dropping empty definition of ' + m.printname()
+    return m, None, None
+
+
+# the parsers of a pool worker process, by the value of fast_parser
+_pool_def_parsers = {}
+
+
+def _parse_def_chunk(args):
+    """
+    Parses a chunk of lines in a pool worker process. An exception is
+    returned along with the lines parsed before it, and raised again by the
+    parent when it gets there.
+    """
+    lines, language_index, add_indices, loop_to_defendum, fast_parser = args
+    if fast_parser not in _pool_def_parsers:
+        _pool_def_parsers[fast_parser] = (
+            FastDefinitionParser() if fast_parser else DefinitionParser())
+    def_parser = _pool_def_parsers[fast_parser]
+    results = []
+    try:
+        for line in lines:
+            results.append(_parse_def_line(def_parser, line, language_index,
+                                           add_indices, loop_to_defendum))
+    except Exception, e:
+        return results, e
+    return results, None
+
+
+def _unchunk(chunk_results):
+    for results, exception in chunk_results:
+        for result in results:
+            yield result
+        if exception is not None:
+            raise exception
+
+
+def _merge_defs(results):
+    """Logs the messages and yields the definitions of read_defs(), in the
+    order of the lines."""
     d = defaultdict(set)
-    for line in f:
-        fields = line.strip('\n').split('\t')
-        if len(fields) != 9:
-            logging.warning(
-                "Wrong number of fields ({}) in {}".format(len(fields), fields))
+    for m, level, message in results:
+        if message is not None:
+            logging.log(level, message)
+        if m is None:
             continue
-        forms_in_langs = fields[:4] 
-        id_, dv, pos, def_, comment = fields[4:]
-        if not def_:
+        pn = m.printname()
+        if pn in d:
             continue
-        logging.debug("Parsing: {0}".format(line))
-        printname = forms_in_langs[language_index]
-        try:
-            m = def_parser.parse_into_machines(printname, id_, def_,
-                                               add_indices, loop_to_defendum)
-            if m.partitions[0] == []:
-                logging.debug('dropping empty definition of '+m.printname())
-                continue
-            pn = m.printname()
-            if pn in d:
-                continue
-                # logging.warning('duplicate pn: {0}, machines: {1}, {2}'.format(
-                #    pn, d[pn], "{0}:{1}".format(m, m.partitions)))
-            d[pn].add(m)
-            logging.debug('\n'+m.to_debug_str())
-            yield pn, d[pn]
-        except pyparsing.ParseException, pe:
-            logging.error('Cannot parse {}/{}: {}\n{}'.format(printname, id_,
-                                                              def_, pe))
+            # logging.warning('duplicate pn: {0}, machines: {1}, {2}'.format(
+            #    pn, d[pn], "{0}:{1}".format(m, m.partitions)))
+        d[pn].add(m)
+        logging.debug('\n'+m.to_debug_str())
+        yield pn, d[pn]
+
+
+def read_defs(f, language_index=0, add_indices=False, loop_to_defendum=True,
+              fast_parser=False, pool=None, chunk_size=500):
+    """
+    Returns an iterator over the (printname, set of machines) pairs of the
+    definitions in @p f. Only the first definition of a printname is kept.
+    @param fast_parser use FastDefinitionParser instead of the pyparsing
+                       grammar. The two build the same machines.
+    @param pool a multiprocessing.Pool. If given, the lines are read at once
+                and parsed in chunks of @p chunk_size lines by the pool; the
+                chunks are submitted before this function returns, so the
+                definitions of several files can be parsed at the same time.
+                The results and the log messages come in the same order as
+                without a pool.
+    """
+    if pool is None:
+        if fast_parser:
+            def_parser = FastDefinitionParser()
+        else:
+            def_parser = DefinitionParser()
+        results = (_parse_def_line(def_parser, line, language_index,
+                                   add_indices, loop_to_defendum)
+                   for line in f)
+    else:
+        lines = list(f)
+        chunks = [(lines[i:i + chunk_size], language_index, add_indices,
+                   loop_to_defendum, fast_parser)
+                  for i in xrange(0, len(lines), chunk_size)]
+        results = _unchunk(pool.imap(_parse_def_chunk, chunks))
+    return _merge_defs(results)
 
 
 def parse_args(): 
@@ -0,0 +1,122 @@
+"""
+Word vectors of a restricted vocabulary, for SimComparer: only the vectors
+of the evaluated words are read from a (large) word2vec model, and kept in
+a cache, an .npy matrix with a vocabulary file next to it (<file>.vocab)
+and a key (<file>.key) telling what model and words it was made of. Later
+runs memory-map the matrix of the cache.
+"""
+
+import codecs
+import hashlib
+import json
+import logging
+import mmap
+import os
+
+import numpy
+
+
+class Embedding(object):
+    """
+    The vectors of @p words, by row of @p vectors; with the methods of a
+    gensim Word2Vec model SimComparer uses.
+    """
+    def __init__(self, words, vectors):
+        self.words = words
+        self.index = dict((word, i) for i, word in enumerate(words))
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __getitem__(self, word):
+        return self.vectors[self.index[word]]
+
+    def similarity(self, w1, w2):
+        """The cosine similarity of two words, as gensim computes it."""
+        def unitvec(vector):
+            norm = numpy.sqrt(numpy.dot(vector, vector))
+            return vector / norm if norm else vector
+        return numpy.dot(unitvec(self[w1]), unitvec(self[w2]))
+
+    @staticmethod
+    def read_word2vec(file_name, vocabulary):
+        """
+        Reads the vectors of the words of @p vocabulary from the binary
+        word2vec model @p file_name; the rest are skipped.
+        """
+        wanted = dict((word.encode('utf-8'), word) for word in vocabulary)
+        words, vectors = [], []
+        with open(file_name, 'rb') as f:
+            n_words, dim = map(int, f.readline().split())
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = dim * numpy.dtype(numpy.float32).itemsize
+            # after the header
+            position = data.find('\n') + 1
+            for _ in xrange(n_words):
+                end = data.find(' ', position)
+                word = data[position:end].lstrip('\n')
+                position = end + 1 + size
+                if word in wanted:
+                    words.append(wanted[word])
+                    vectors.append(numpy.frombuffer(
+                        data[end + 1:position], dtype=numpy.float32))
+        finally:
+            data.close()
+        logging.warning('read {0} of {1} vectors from {2}'.format(
+            len(words), n_words, file_name))
+        return Embedding(words, numpy.array(vectors, dtype=numpy.float32)
+                         .reshape(len(words), dim))
+
+    @staticmethod
+    def from_model(model, vocabulary):
+        """The vectors of the words of @p vocabulary in a gensim model."""
+        words = sorted(word for word in vocabulary if word in model)
+        return Embedding(words, numpy.array(
+            [model[word] for word in words], dtype=numpy.float32))
+
+    def save(self, file_name, key):
+        # numpy.save() of a file name would add .npy to it
+        with open(file_name, 'wb') as f:
+            numpy.save(f, self.vectors)
+        with codecs.open(file_name + '.vocab', 'w', 'utf-8') as f:
+            for word in self.words:
+                f.write(u'{0}\n'.format(word))
+        # the key is written last: the cache is only valid with it
+        with open(file_name + '.key', 'w') as f:
+            json.dump(key, f)
+
+    @staticmethod
+    def load(file_name):
+        """Loads a cache, with the vectors memory-mapped."""
+        with codecs.open(file_name + '.vocab', encoding='utf-8') as f:
+            words = [line.rstrip(u'\n') for line in f]
+        return Embedding(words, numpy.load(file_name, mmap_mode='r'))
+
+    @staticmethod
+    def cached(file_name, model_file, model_type, vocabulary, build):
+        """
+        Returns the vectors of @p vocabulary from the cache @p file_name
+        (an .npy file), or, if the cache was not made of the same model and
+        words, from an Embedding made by @p build(), which is cached first.
+        """
+        key = {
+            'model': os.path.abspath(model_file),
+            'model_type': model_type,
+            'model_size': os.path.getsize(model_file),
+            'model_mtime': os.path.getmtime(model_file),
+            'words': hashlib.sha1(u'\n'.join(
+                sorted(vocabulary)).encode('utf-8')).hexdigest()}
+        if os.path.exists(file_name + '.key'):
+            with open(file_name + '.key') as f:
+                if json.load(f) == key:
+                    logging.warning('loading vectors from {0}'.format(
+                        file_name))
+                    return Embedding.load(file_name)
+            os.remove(file_name + '.key')
+        build().save(file_name, key)
+        return Embedding.load(file_name)
@@ -0,0 +1,279 @@
+"""
+The link and node sets of the machines of the definitions, as used by
+WordSimilarity._links_and_nodes_similarity(), precomputed in one pass over
+the definitions. Links and nodes are interned as integer ids, so that each
+machine is a row of frozensets of ids, and the printnames mentioned by the
+links and nodes of the machines are indexed, so that the contains() checks
+and 0-paths are lookups instead of scans of the sets.
+
+A store can be saved next to the lexicon (see Wrapper.reset_lexicon()).
+Rows are attached to the machines of the definitions again on loading, by
+lemma and by the digest of each machine; the store is only used if the
+definitions have the fingerprint it was built from.
+"""
+
+from collections import defaultdict
+import cPickle
+import logging
+
+from pymachine.sim_cache import definitions_fingerprint, machine_digest
+from pymachine.utils import MachineTraverser
+
+# hypernyms are followed this deep for the links of a machine
+MAX_DEPTH = 5
+
+class Vocabulary(dict):
+    """Maps hashable items to consecutive integer ids."""
+    def id(self, item):
+        if item not in self:
+            self[item] = len(self)
+        return self[item]
+
+def links_nodes(machine):
+    """
+    Returns the links and the nodes of @p machine: the printnames of its
+    hypernyms (of the non-uppercase ones and of =AGT) and of theirs, up to
+    MAX_DEPTH, the (subject, object) pairs of the binary relations the
+    machine takes part in, and the printnames of all machines reachable
+    from it.
+    """
+    links, nodes = set(), set()
+    for link, node in _links_nodes(machine, 0, set()):
+        if link is not None:
+            links.add(link)
+        if node is not None:
+            nodes.add(node)
+    return links, nodes
+
+def _links_nodes(machine, depth, seen):
+    if machine in seen or depth > MAX_DEPTH:
+        return
+    seen.add(machine)
+    for hypernym in machine.partitions[0]:
+        name = hypernym.printname()
+        if name == '=AGT' or not name.isupper():
+            yield name, None
+        for link, node in _links_nodes(hypernym, depth + 1, seen):
+            yield link, node
+
+    for link, node in binary_links_nodes(machine):
+        yield link, node
+
+    for node in MachineTraverser.get_nodes(machine):
+        yield None, node
+
+def binary_links_nodes(machine):
+    """The links and nodes from the binary relations (machines with
+    partitions 1 and 2) @p machine is an argument of."""
+    for parent, partition in machine.parents:
+        parent_pn = parent.printname()
+        if partition == 0:
+            continue
+        elif partition == 1:
+            links = set([(parent_pn, other.printname())
+                        for other in parent.partitions[2]])
+            nodes = [m.printname() for m in parent.partitions[2]]
+        elif partition == 2:
+            links = set([(other.printname(), parent_pn)
+                        for other in parent.partitions[1]])
+            nodes = [m.printname() for m in parent.partitions[1]]
+        else:
+            raise Exception(
+                'machine {0} has more than 3 partitions!'.format(machine))
+
+        for link in links:
+            yield link, None
+        for node in nodes:
+            yield None, node
+
+def _jaccard(set1, set2):
+    """utils.jaccard() of two sets: the integer 0 if they are disjoint."""
+    intersection = len(set1 & set2)
+    if not intersection:
+        return 0
+    return float(intersection) / (len(set1) + len(set2) - intersection)
+
+class FeatureStore(object):
+    """
+    The links and nodes of machines, by row. Rows are numbered in the order
+    the machines are added; @c rows maps the machines to their rows.
+    """
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.links = Vocabulary()
+        self.nodes = Vocabulary()
+        # id -> link, id -> node
+        self.link_values = []
+        self.node_values = []
+        # row -> printname, link ids, node ids and ids of entity links
+        self.printnames = []
+        self.link_rows = []
+        self.node_rows = []
+        self.entity_rows = []
+        # printname -> the rows whose links (strings, or names in pairs)
+        # mention it, and those whose nodes do
+        self.link_index = defaultdict(set)
+        self.node_index = defaultdict(set)
+        # lemma -> (digests of the machines, their rows), sorted by digest;
+        # the digests are None if machines with the same digest have
+        # different features, as they cannot be told apart on loading
+        self.lemma_rows = {}
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.printnames)
+
+    def __contains__(self, machine):
+        return machine in self.rows
+
+    @staticmethod
+    def build(definitions, get_links_nodes=links_nodes, fingerprint=None):
+        """
+        Returns the store of all machines of @p definitions (a dict of sets
+        of machines by lemma).
+        @param get_links_nodes the function giving the (links, nodes) of a
+               machine.
+        @param fingerprint the definitions_fingerprint() of the
+               definitions, computed if not given.
+        """
+        if fingerprint is None:
+            fingerprint = definitions_fingerprint(definitions)
+        store = FeatureStore(fingerprint)
+        for lemma in sorted(definitions):
+            digests, rows = [], []
+            for digest, machine in sorted(
+                    ((machine_digest(m), m) for m in definitions[lemma]),
+                    key=lambda pair: pair[0]):
+                digests.append(digest)
+                rows.append(store.add(machine, *get_links_nodes(machine)))
+            if store.ambiguous(digests, rows):
+                digests = None
+            store.lemma_rows[lemma] = (digests, rows)
+        logging.info('feature store of {0} machines, {1} links, {2} nodes'
+                     .format(len(store), len(store.links), len(store.nodes)))
+        return store
+
+    def add(self, machine, links, nodes):
+        """Adds a row for @p machine with its @p links and @p nodes; returns
+        the row."""
+        row = len(self.printnames)
+        self.rows[machine] = row
+        self.printnames.append(machine.printname())
+        self.link_rows.append(self._ids(links, self.links, self.link_values))
+        self.node_rows.append(self._ids(nodes, self.nodes, self.node_values))
+        self.entity_rows.append(frozenset(
+            self.links[l] for l in links if "@" in l))
+        for link in links:
+            for name in (link if isinstance(link, tuple) else (link,)):
+                self.link_index[name].add(row)
+        for node in nodes:
+            self.node_index[node].add(row)
+        return row
+
+    @staticmethod
+    def _ids(items, vocabulary, values):
+        ids = []
+        for item in items:
+            i = vocabulary.id(item)
+            if i == len(values):
+                values.append(item)
+            ids.append(i)
+        return frozenset(ids)
+
+    def ambiguous(self, digests, rows):
+        """Whether some of @p rows with the same digest have different
+        features."""
+        features = {}
+        for digest, row in zip(digests, rows):
+            row_features = (self.link_rows[row], self.node_rows[row])
+            if features.setdefault(digest, row_features) != row_features:
+                return True
+        return False
+
+    def links_nodes(self, row):
+        """The sets of links and nodes of @p row."""
+        return (set(self.link_values[i] for i in self.link_rows[row]),
+                set(self.node_values[i] for i in self.node_rows[row]))
+
+    def contains_link(self, row, name):
+        """Whether a link of @p row is @p name or a pair with @p name in
+        it."""
+        return row in self.link_index.get(name, ())
+
+    def contains_node(self, row, name):
+        return row in self.node_index.get(name, ())
+
+    def has_link(self, row, name):
+        """Whether @p name itself is a link of @p row (a 0-path)."""
+        link_id = self.links.get(name)
+        return link_id is not None and link_id in self.link_rows[row]
+
+    def similarity(self, row1, row2, exclude_nodes=False,
+                   no_contain_score=False):
+        """WordSimilarity._links_and_nodes_similarity() of the machines of
+        @p row1 and @p row2."""
+        sim = 0
+        pn1, pn2 = self.printnames[row1], self.printnames[row2]
+        if not no_contain_score:
+            if (self.contains_link(row1, pn2) or
+                    self.contains_link(row2, pn1)):
+                sim = 0.35
+            elif (not exclude_nodes) and (self.contains_node(row1, pn2) or
+                                          self.contains_node(row2, pn1)):
+                sim = 0.25
+        if self.has_link(row2, pn1) or self.has_link(row1, pn2):
+            return 1
+        entities1, entities2 = self.entity_rows[row1], self.entity_rows[row2]
+        if entities1 or entities2:
+            return max(sim, _jaccard(entities1, entities2))
+        sim = max(sim, _jaccard(self.link_rows[row1], self.link_rows[row2]))
+        if not exclude_nodes:
+            node_sim = _jaccard(self.node_rows[row1], self.node_rows[row2])
+            if node_sim > sim:
+                sim = node_sim
+        return sim
+
+    def save(self, file_name):
+        state = dict(self.__dict__)
+        # machines are attached again on loading
+        del state['rows']
+        state['link_index'] = dict(self.link_index)
+        state['node_index'] = dict(self.node_index)
+        with open(file_name, 'wb') as f:
+            cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(file_name, definitions, fingerprint=None):
+        """
+        Loads the store saved to @p file_name and attaches its rows to the
+        machines of @p definitions. Returns @c None if the store was built
+        from other definitions (those with another @p fingerprint, which is
+        computed if not given).
+        """
+        with open(file_name, 'rb') as f:
+            state = cPickle.load(f)
+        if fingerprint is None:
+            fingerprint = definitions_fingerprint(definitions)
+        if state['fingerprint'] != fingerprint:
+            logging.warning(
+                'feature store {0} is of other definitions, ignored'.format(
+                    file_name))
+            return None
+        store = FeatureStore()
+        store.__dict__.update(state)
+        store.link_index = defaultdict(set, store.link_index)
+        store.node_index = defaultdict(set, store.node_index)
+        for lemma, (digests, rows) in store.lemma_rows.iteritems():
+            if digests is None:
+                continue
+            machines = sorted(
+                ((machine_digest(m), m) for m in definitions.get(lemma, ())),
+                key=lambda pair: pair[0])
+            if [digest for digest, _ in machines] != digests:
+                logging.warning(
+                    u'machines of {0} changed, not in the feature store'
+                    .format(lemma))
+                continue
+            for (_, machine), row in zip(machines, rows):
+                store.rows[machine] = row
+        return store
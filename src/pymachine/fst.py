@@ -6,6 +6,114 @@ from pymachine.machine import Machine
 from matcher import Matcher
 from avm import AVM
 
+def _states_of(bits):
+    """Yields the states (integers) in the bit set @p bits."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class MatchMemo(object):
+    """
+    Matcher outcomes by (matcher, machine), and the steps of frozen controls
+    by (control, states, machine). They are only valid while the machines
+    do not change: a memo is meant for checking the sequences of a sentence,
+    and has to be cleared when a construction acts on its machines.
+    """
+    def __init__(self):
+        self.matches = {}
+        self.steps = {}
+
+    def match(self, matcher, machine):
+        key = (matcher, machine)
+        try:
+            return self.matches[key]
+        except KeyError:
+            result = self.matches[key] = matcher.match(machine)
+            return result
+
+    def clear(self):
+        self.matches.clear()
+        self.steps.clear()
+
+def _match(matcher, machine):
+    return matcher.match(machine)
+
+class FrozenFSA(object):
+    """
+    The compiled form of an FSA (or FST), built by FSA.freeze(): validated
+    once, with the states numbered, sets of states represented as bit sets
+    (ints) and the transitions of each state in a tuple of (matcher, output
+    bit, operators) triples, in the order the FSA iterates them.
+    """
+    def __init__(self, fsa):
+        fsa.check_states()
+        self.state_names = sorted(fsa.states)
+        index = dict((state, i) for i, state in enumerate(self.state_names))
+        self.init = self.bits(fsa.init_states, index)
+        self.final = self.bits(fsa.final_states, index)
+        # an FST takes the first matching transition of a state, and stays
+        # in its states if none matches
+        self.first_match = isinstance(fsa, FST)
+        edges = []
+        for state in self.state_names:
+            state_edges = []
+            for matcher, out_state in fsa.transitions.get(
+                    state, {}).iteritems():
+                operators = ()
+                if isinstance(out_state, tuple):
+                    out_state, operators = out_state
+                state_edges.append((matcher, 1 << index[out_state], operators))
+            edges.append(tuple(state_edges))
+        self.edges = tuple(edges)
+        # the length of the shortest path to a final state; None if there is
+        # no path
+        distances = fsa.distances_to_final()
+        self.distances = tuple(
+            distances.get(state) for state in self.state_names)
+
+    @staticmethod
+    def bits(states, index):
+        bits = 0
+        for state in states:
+            bits |= 1 << index[state]
+        return bits
+
+    def names(self, bits):
+        """The names of the states in @p bits."""
+        return set(self.state_names[i] for i in _states_of(bits))
+
+    def distance(self, bits):
+        """The length of the shortest path from @p bits to a final state;
+        @c None if there is none."""
+        distances = [self.distances[i] for i in _states_of(bits)
+                     if self.distances[i] is not None]
+        return min(distances) if distances else None
+
+    def step(self, states, machine, memo=None):
+        """Returns the states reached from @p states by reading @p machine."""
+        if memo is not None:
+            key = (self, states, machine)
+            new_states = memo.steps.get(key)
+            if new_states is not None:
+                return new_states
+            match = memo.match
+        else:
+            match = _match
+        new_states = 0
+        for state in _states_of(states):
+            for matcher, out_bit, _ in self.edges[state]:
+                if match(matcher, machine):
+                    new_states |= out_bit
+                    if self.first_match:
+                        break
+        if self.first_match and not new_states:
+            # HACK no sink right now
+            new_states = states
+        if memo is not None:
+            memo.steps[key] = new_states
+        return new_states
+
 class FSA(object):
     def __init__(self):
         self.states = set()
@@ -13,7 +121,9 @@ class FSA(object):
         self.init_states = set()
         self.final_states = set()
         self.transitions = defaultdict(dict)
-        self.active_states = None
+        # the active states, as a bit set of the frozen control
+        self.active = None
+        self.frozen = None
 
     def __str__(self):
         return "{0}\nstates: {1}\ntransitions: {2}\ninitial states: {3}\
@@ -46,6 +156,7 @@ class FSA(object):
 
     def add_state(self, state, is_init=False, is_final=False):
         self.states.add(state)
+        self.thaw()
         if is_init:
             self.set_init(state)
         if is_final:
@@ -63,12 +174,14 @@ class FSA(object):
             raise ValueError("state to be init has to be in states already")
         else:
             self.init_states.add(state)
+            self.thaw()
 
     def set_final(self, state):
         if state not in self.states:
             raise ValueError("state to be final has to be in states already")
         else:
             self.final_states.add(state)
+            self.thaw()
 
     def add_transition(self, matcher, input_state, output_state):
         if input_state not in self.states or output_state not in self.states:
@@ -76,6 +189,7 @@ class FSA(object):
         if not isinstance(matcher, Matcher):
             raise TypeError("transition's matcher has to be of type Matcher")
         self.transitions[input_state][matcher] = output_state
+        self.thaw()
 
     def check_states(self):
         if len(self.states) == 0:
@@ -85,34 +199,74 @@ class FSA(object):
         if len(self.final_states) == 0:
             raise Exception("No final/acceptor states in the FSA")
 
+    def freeze(self):
+        """
+        Returns the FrozenFSA of the automaton, compiled on the first call
+        after a change.
+        @note Changes made to @c transitions directly, not via
+              add_transition(), are not seen after the first read.
+        """
+        if self.frozen is None:
+            self.frozen = FrozenFSA(self)
+        return self.frozen
+
+    def thaw(self):
+        """Drops the frozen form and the active states after a change."""
+        self.frozen = None
+        self.active = None
+
+    @property
+    def active_states(self):
+        if self.active is None:
+            return None
+        return self.freeze().names(self.active)
+
     def init_active_states(self):
-        self.active_states = set(self.init_states)
+        self.active = self.freeze().init
 
     def reset(self):
         self.init_active_states()
 
     def in_final(self):
-        return len(self.active_states & self.final_states) > 0
+        return (self.active or 0) & self.freeze().final != 0
 
-    def read_machine(self, machine, dry_run=False):
-        self.check_states()
-        if self.active_states is None:
-            self.init_active_states()
-        new_active_states = set()
-        for active_state in self.active_states:
-            for transition, out_state in (
-                    self.transitions[active_state].iteritems()):
+    def distances_to_final(self):
+        """
+        Returns the length of the shortest path from each state to a final
+        state. States from which no final state is reachable are left out.
+        """
+        reverse = defaultdict(set)
+        for state1, edges in self.transitions.iteritems():
+            for state2 in edges.itervalues():
+                if isinstance(state2, tuple):
+                    state2 = state2[0]
+                reverse[state2].add(state1)
+        distances = dict((state, 0) for state in self.final_states)
+        queue = list(self.final_states)
+        while queue:
+            state2 = queue.pop(0)
+            for state1 in reverse[state2]:
+                if state1 not in distances:
+                    distances[state1] = distances[state2] + 1
+                    queue.append(state1)
+        return distances
 
-                if transition.match(machine):
-                    new_active_states.add(out_state)
-        self.active_states = new_active_states
+    def read_machine(self, machine, dry_run=False, memo=None):
+        frozen = self.freeze()
+        if self.active is None:
+            self.active = frozen.init
+        self.active = frozen.step(self.active, machine, memo)
 
-    def read(self, what, dry_run=False):
+    def read(self, what, dry_run=False, memo=None):
+        """
+        Reads a machine, an AVM, or an iterable thereof.
+        @param memo a MatchMemo for the matcher outcomes.
+        """
         if isinstance(what, Machine) or isinstance(what, AVM):
-            self.read_machine(what, dry_run=dry_run)
+            self.read_machine(what, dry_run=dry_run, memo=memo)
         elif isinstance(what, Iterable):
             for what_ in what:
-                self.read(what_, dry_run=dry_run)
+                self.read(what_, dry_run=dry_run, memo=memo)
 
 class FST(FSA):
     def __init__(self):
@@ -124,29 +278,24 @@ class FST(FSA):
         if not isinstance(matcher, Matcher):
             raise TypeError("transition's matcher has to be of type Matcher")
         self.transitions[input_state][matcher] = (output_state, operators)
+        self.thaw()
 
-    def read_machine(self, machine, dry_run=False):
+    def read_machine(self, machine, dry_run=False, memo=None):
+        if dry_run:
+            return FSA.read_machine(self, machine, memo=memo)
         #This is called so often, it should not create debug messages
-        if not dry_run:
-            logging.debug('FST reading machine: {}'.format(machine))
-        #logging.debug("FST.read_machine() called with {0}".format(machine))
-        self.check_states()
-        if self.active_states is None:
-            self.init_active_states()
-        new_active_states = set()
-        #logging.debug("Old active: {0}".format(self.active_states))
-        for active_state in self.active_states:
-            for transition, (out_state, operators) in (
-                    self.transitions[active_state].iteritems()):
-
+        logging.debug('FST reading machine: {}'.format(machine))
+        frozen = self.freeze()
+        if self.active is None:
+            self.active = frozen.init
+        new_active = 0
+        for active_state in _states_of(self.active):
+            for transition, out_bit, operators in frozen.edges[active_state]:
                 if transition.match(machine):
-                    #logging.info('FST: matching transitions: {}'.format(
-                    #    transition))
-                    if not dry_run:
-                        for op in operators:
-                            logging.debug('running operator: {}'.format(op))
-                            op.act(machine)
-                    new_active_states.add(out_state)
+                    for op in operators:
+                        logging.debug('running operator: {}'.format(op))
+                        op.act(machine)
+                    new_active |= out_bit
 
                     """TODO we now assume that there's only one edge from each
                     state matching any given machine"""
@@ -154,6 +303,5 @@ class FST(FSA):
                     break
 
         # HACK no sink right now
-        if len(new_active_states) > 0:
-            self.active_states = new_active_states
-        #logging.debug("New active: {0}".format(self.active_states))
+        if new_active:
+            self.active = new_active
@@ -0,0 +1,88 @@
+"""
+Parsed KR codes. The same codes are read over and over (for every token and
+every rule), so they are parsed once and shared as immutable feature
+structures; controls copy them when they change a feature. Patterns are
+compiled into a flat sequence of (path, value) tests.
+"""
+
+from hunmisc.utils.readkr import kr_to_dictionary
+
+class FeatStruct(dict):
+    """An immutable dict of features; the values are strings or
+    FeatStructs."""
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FeatStruct is immutable, copy it to change it")
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (FeatStruct, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+def freeze(features):
+    """Returns @p features (nested dicts) as a FeatStruct."""
+    if isinstance(features, FeatStruct):
+        return features
+    return FeatStruct(
+        (key, freeze(value) if isinstance(value, dict) else value)
+        for key, value in features.iteritems())
+
+_parsed = {}
+
+def parse_kr(kr, *args):
+    """
+    Returns the FeatStruct of the KR code @p kr, parsed only once.
+    @param args passed on to kr_to_dictionary().
+    """
+    key = (kr,) + args
+    features = _parsed.get(key)
+    if features is None:
+        features = _parsed[key] = freeze(kr_to_dictionary(kr, *args))
+    return features
+
+# the value of the tests that only need the feature to be present
+ANY = object()
+
+def compile_pattern(pattern):
+    """
+    Compiles @p pattern for match_pattern(): into a (tests, key, pattern)
+    triple, where tests is a tuple of (feature, value) pairs, and key is
+    the embedded feature structure the compiled pattern goes down into (or
+    @c None). A feature in the pattern must be present; unless its value
+    starts with '@' (a Greek letter, i.e. a variable), it must also be
+    equal. At the first embedded feature structure, the pattern goes down
+    into it and the rest of the features on that level are not tested, as
+    KRPosMatcher always did.
+    """
+    tests = []
+    for key in pattern:
+        value = pattern[key]
+        if isinstance(value, dict):
+            tests.append((key, ANY))
+            return tuple(tests), key, compile_pattern(value)
+        elif isinstance(value, basestring) and value[:1] == '@':
+            tests.append((key, ANY))
+        else:
+            tests.append((key, value))
+    return tuple(tests), None, None
+
+def match_pattern(compiled, features):
+    """Whether @p features match the compiled pattern."""
+    while True:
+        tests, key, compiled = compiled
+        if not isinstance(features, dict):
+            # only an empty pattern matches something else
+            return not tests
+        for feature, value in tests:
+            actual = features.get(feature, ANY)
+            if actual is ANY or (value is not ANY and actual != value):
+                return False
+        if key is None:
+            return True
+        features = features[key]
@@ -6,7 +6,7 @@ import copy
 from pymachine.machine import Machine
 from pymachine.control import ConceptControl
 from pymachine.construction import Construction, AVMConstruction
-from pymachine.constants import id_sep
+from pymachine.constants import avm_pre, id_sep
 
 class Lexicon:
     """THE machine repository."""
@@ -23,6 +23,11 @@ class Lexicon:
         # AVM name -> construction. Not used by default, have to be added to
         # self.constructions first via activation
         self.avm_constructions = {}
+        # (printname, max depth) -> VerbFrame, built on demand from static
+        self.verb_frames = {}
+        # The definitions activate() can activate, built on demand from
+        # static: (printname, index in static) keys, in the order of static
+        self.activatable = None
 #        self.create_elvira_machine()
         self.clear_active()
 
@@ -54,6 +59,9 @@ class Lexicon:
         while keeping prior links (parent links).
         @note We assume that a machine is added to the static graph only once.
         """
+        # the activation index and the verb frames are rebuilt when needed
+        self.activatable = None
+        self.verb_frames = {}
         if isinstance(what, Machine):
             self.__add_static_recursive(what)
         # Call for each item in an iterable
@@ -474,6 +482,19 @@ class Lexicon:
                 avm_construction not in self.constructions):
             self.constructions.append(avm_construction)
 
+    def __build_activatable(self):
+        """Builds the index of the definitions activate() can activate."""
+        self.activatable = []
+        for printname, static_machines in self.static.iteritems():
+            for i, static_machine in enumerate(static_machines):
+                children = list(chain(*static_machine.partitions))
+                # unicode(machine), what activate() used to look up in
+                # active, is never a key of it: only the definitions with
+                # nothing but AVM children can be activated
+                if children and all(m.printname().startswith(avm_pre)
+                                    for m in children):
+                    self.activatable.append((printname, i))
+
     def activate(self):
         """Finds and returns the machines that should be activated by the
         machines already active. These machines are automatically added
@@ -482,24 +503,18 @@ class Lexicon:
         When exactly a machine should be activated is still up for
         consideration; however, currently this method returns a machine if
         all non-primitive machines on its partitions are active."""
+        if self.activatable is None:
+            self.__build_activatable()
         activated = []
 
-        for printname, static_machines in self.static.iteritems():
-            for static_machine in static_machines:
-                if printname in self.active:
-                    continue
-                has_machine = False
-                for machine in chain(*static_machine.partitions):
-                    has_machine = True
-                    if (not unicode(machine).startswith(u'#') and
-                            unicode(machine) not in self.active):
-                        break
-                else:
-                    if has_machine:
-                        m = Machine(printname,
-                                    copy.copy(static_machine.control))
-                        self.add_active(m)
-                        activated.append(m)
+        # the first static machine of a printname is activated
+        for printname, i in self.activatable:
+            if printname in self.active:
+                continue
+            static_machine = self.static[printname][i]
+            m = Machine(printname, copy.copy(static_machine.control))
+            self.add_active(m)
+            activated.append(m)
         return activated
 
     def is_expanded(self, m):
@@ -546,6 +561,15 @@ class Lexicon:
             if c in self.avm_constructions.values():
                 self.constructions.remove(c)
 
+    def session(self):
+        """
+        Returns a LexiconSession for processing a sentence on top of this
+        lexicon, which must be finalized and is not changed by the session.
+        """
+        if self.activatable is None:
+            self.__build_activatable()
+        return LexiconSession(self)
+
     def test_static_graph_building():
         """Tests the static graph building procedure."""
         pass
@@ -572,3 +596,73 @@ class Lexicon:
             return self.get_machine(printname, second=True)  # sanity check
 
         return cands[0]
+
+class LexiconSession(Lexicon):
+    """
+    A per-request layer over a finalized Lexicon. The static graph, the AVM
+    constructions, the verb frames and the activation index are shared; the
+    active machines, their expansion state, the added constructions and the
+    machines created by get_machine() belong to the session. Sessions of the
+    same lexicon can thus process sentences at the same time, and are simply
+    dropped afterwards instead of clear_active().
+
+    @note The constructions of the lexicon are shared, except for AVM
+          constructions, which are copied so that each session fills its own
+          AVMs. The shared ones (the chunk constructions) are safe to use
+          from several threads: check() does not change their control, and
+          they act through their operators, on the machines of the session.
+    """
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self.static = lexicon.static
+        self.static_disambig = lexicon.static_disambig
+        self.avm_constructions = lexicon.avm_constructions
+        self.verb_frames = lexicon.verb_frames
+        self.activatable = lexicon.activatable
+        # printname -> machine, for the words get_machine() did not find
+        self.new_machines = {}
+        self.clear_active()
+
+    def add_static(self, what):
+        raise TypeError("the static graph cannot be changed in a session")
+
+    def finalize_static(self):
+        raise TypeError("the static graph cannot be changed in a session")
+
+    def session(self):
+        return self.lexicon.session()
+
+    def wake_avm_construction(self, avm_name):
+        """
+        Adds a copy of an AVM construction from @c avm_constructions to
+        @c constructions, unless it is already awake.
+        """
+        avm_construction = self.avm_constructions.get(avm_name[1:])
+        if avm_construction is not None and not any(
+                c.avm.name == avm_construction.avm.name
+                for c in self.constructions if c.type_ == Construction.AVM):
+            self.constructions.append(avm_construction.copy())
+
+    def clear_active(self):
+        """Resets the session to the state it was created in."""
+        self.active = {}
+        self.constructions = [
+            c.copy() if c.type_ == Construction.AVM else c
+            for c in self.lexicon.constructions]
+
+    def get_machine(self, printname, second=False):
+        if printname == 'have':
+            logging.debug('have is changed to HAS')
+            return self.get_machine("HAS")
+
+        if printname in self.active:
+            return self.active[printname].keys()[0]
+
+        cands = self.get_static_machine(printname)
+        if cands:
+            return cands[0]
+        # unknown words are not added to the shared static graph
+        if printname not in self.new_machines:
+            self.new_machines[printname] = Machine(
+                printname, ConceptControl())
+        return self.new_machines[printname]
@@ -7,7 +7,256 @@ from pymachine.control import Control
 from constants import deep_pre, avm_pre, enc_pre
 
 
+# an element removed from a large partition, until the partition is compacted
+_HOLE = object()
+
+
+class Partition(list):
+    """
+    A partition of a machine: a list that also keeps the positions of its
+    elements, so that membership tests and remove() take constant time
+    while the order of the elements is kept. remove() leaves a hole in
+    the list in place of the element; holes are skipped by iteration, and
+    the list is compacted when there are more holes than elements, or
+    before the elements are accessed by position. The positions are only
+    kept for partitions longer than @c INDEX_FROM; for shorter ones
+    scanning the list is faster.
+
+    The holes are only hidden by the methods of Partition: the list is
+    not to be passed to C functions that read it directly (such as
+    json.dumps() or slice assignment), but copied with list() first.
+    """
+    __slots__ = ('positions', 'holes')
+    INDEX_FROM = 8
+
+    def __init__(self, iterable=()):
+        list.__init__(self, iterable)
+        self.positions = None
+        self.holes = 0
+
+    def __reduce__(self):
+        return (Partition, (list(self),))
+
+    def _index(self):
+        """
+        The positions of the elements, by element: the position of an
+        element, or the list of its positions in increasing order if it is
+        in the partition more than once.
+        """
+        if self.positions is None and len(self) > Partition.INDEX_FROM:
+            self.positions = {}
+            for i, what in enumerate(list.__iter__(self)):
+                if what is not _HOLE:
+                    self._add_position(what, i)
+        return self.positions
+
+    def _add_position(self, what, i):
+        where = self.positions.get(what)
+        if where is None:
+            self.positions[what] = i
+        elif isinstance(where, list):
+            where.append(i)
+        else:
+            self.positions[what] = [where, i]
+
+    def _pop_position(self, what):
+        """Returns the first position of @p what and forgets it."""
+        where = self.positions[what]
+        if not isinstance(where, list):
+            del self.positions[what]
+            return where
+        i = where.pop(0)
+        if len(where) == 1:
+            self.positions[what] = where[0]
+        return i
+
+    def _compact(self):
+        if self.holes:
+            list.__setslice__(self, 0, list.__len__(self), [
+                what for what in list.__iter__(self) if what is not _HOLE])
+            self.holes = 0
+            self.positions = None
+        return self
+
+    def _changed(self):
+        """Called after the list was changed by a method of list."""
+        self.positions = None
+
+    def __len__(self):
+        return list.__len__(self) - self.holes
+
+    def __iter__(self):
+        if not self.holes:
+            return list.__iter__(self)
+        return (what for what in list.__iter__(self) if what is not _HOLE)
+
+    def __reversed__(self):
+        return list.__reversed__(self._compact())
+
+    def __contains__(self, what):
+        positions = self._index()
+        if positions is None:
+            return list.__contains__(self, what)
+        return what in positions
+
+    def append(self, what):
+        if self.positions is not None:
+            self._add_position(what, list.__len__(self))
+        list.append(self, what)
+
+    def remove(self, what):
+        positions = self._index()
+        if positions is None:
+            list.remove(self, what)
+            return
+        if what not in positions:
+            raise ValueError("Partition.remove(x): x not in partition")
+        i = self._pop_position(what)
+        if i == list.__len__(self) - 1:
+            list.pop(self)
+        else:
+            list.__setitem__(self, i, _HOLE)
+            self.holes += 1
+            if self.holes > len(self):
+                self._compact()
+
+    def pop(self, i=-1):
+        what = list.pop(self._compact(), i)
+        self._changed()
+        return what
+
+    def insert(self, i, what):
+        list.insert(self._compact(), i, what)
+        self._changed()
+
+    def extend(self, iterable):
+        for what in iterable:
+            self.append(what)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def __getitem__(self, i):
+        return list.__getitem__(self._compact(), i)
+
+    def __getslice__(self, i, j):
+        return list.__getslice__(self._compact(), i, j)
+
+    def __setitem__(self, i, what):
+        list.__setitem__(self._compact(), i, what)
+        self._changed()
+
+    def __delitem__(self, i):
+        list.__delitem__(self._compact(), i)
+        self._changed()
+
+    def __setslice__(self, i, j, sequence):
+        list.__setslice__(self._compact(), i, j, sequence)
+        self._changed()
+
+    def __delslice__(self, i, j):
+        list.__delslice__(self._compact(), i, j)
+        self._changed()
+
+    def __imul__(self, n):
+        list.__imul__(self._compact(), n)
+        self._changed()
+        return self
+
+    def sort(self, *args, **kwargs):
+        list.sort(self._compact(), *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self._compact())
+        self._changed()
+
+    def index(self, what, *args):
+        return list.index(self._compact(), what, *args)
+
+    def count(self, what):
+        return list.count(self._compact(), what)
+
+    def __repr__(self):
+        return list.__repr__(self._compact())
+
+    # list methods that read the other list directly see no holes either
+
+    def __add__(self, other):
+        return list.__add__(self._compact(), _compacted(other))
+
+    def __radd__(self, other):
+        return list.__add__(other, self._compact())
+
+    def __mul__(self, n):
+        return list.__mul__(self._compact(), n)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return list.__eq__(self._compact(), _compacted(other))
+
+    def __ne__(self, other):
+        return list.__ne__(self._compact(), _compacted(other))
+
+    def __lt__(self, other):
+        return list.__lt__(self._compact(), _compacted(other))
+
+    def __le__(self, other):
+        return list.__le__(self._compact(), _compacted(other))
+
+    def __gt__(self, other):
+        return list.__gt__(self._compact(), _compacted(other))
+
+    def __ge__(self, other):
+        return list.__ge__(self._compact(), _compacted(other))
+
+
+def _compacted(other):
+    if isinstance(other, Partition):
+        return other._compact()
+    return other
+
+
+class Partitions(list):
+    """The list of the partitions of a machine. Lists put into it are
+    converted to Partitions."""
+    __slots__ = ()
+
+    def __init__(self, partitions=()):
+        list.__init__(self, (Partition(p) for p in partitions))
+
+    def __reduce__(self):
+        return (Partitions, ([list(p) for p in self],))
+
+    def __setitem__(self, i, partition):
+        if isinstance(i, slice):
+            list.__setitem__(self, i, (Partition(p) for p in partition))
+        else:
+            list.__setitem__(self, i, Partition(partition))
+
+    def __setslice__(self, i, j, partitions):
+        self[max(0, i):max(0, j):] = partitions
+
+    def append(self, partition):
+        list.append(self, Partition(partition))
+
+    def insert(self, i, partition):
+        list.insert(self, i, Partition(partition))
+
+    def extend(self, partitions):
+        list.extend(self, (Partition(p) for p in partitions))
+
+    def __iadd__(self, partitions):
+        self.extend(partitions)
+        return self
+
+
 class Machine(object):
+    # no per-instance __dict__: there can be millions of machines
+    __slots__ = ('printname_', '_partitions', 'control', 'parents')
+
     def __init__(self, name, control=None, part_num=3):
         if not name:
             logging.warning('empty printname! replacing with "???"')
@@ -19,6 +268,29 @@ class Machine(object):
         self.set_control(control)
         self.parents = set()
 
+    def _get_partitions(self):
+        return self._partitions
+
+    def _set_partitions(self, partitions):
+        self._partitions = Partitions(partitions)
+
+    partitions = property(_get_partitions, _set_partitions)
+
+    def __getstate__(self):
+        return (self.printname_, self._partitions, self.control, self.parents)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # pickled before Machine had __slots__, with the __dict__ of
+            # the machine as its state
+            self.printname_ = state['printname_']
+            self.partitions = state['partitions']
+            self.control = state['control']
+            self.parents = state['parents']
+        else:
+            (self.printname_, self._partitions, self.control,
+             self.parents) = state
+
     def __repr__(self):
         return str(self)
 
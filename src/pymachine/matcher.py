@@ -1,9 +1,8 @@
 import re
 import logging
 
-from hunmisc.utils.readkr import kr_to_dictionary as kr_to_dict
-
 from control import ConceptControl
+from pymachine.kr import compile_pattern, match_pattern, parse_kr
 
 class Matcher(object):
     def __init__(self, string, exact=False):
@@ -140,27 +139,13 @@ class KRPosMatcher(Matcher):
 
     def __init__(self, pattern):
         if isinstance(pattern, str) or isinstance(pattern, unicode):
-            self.pattern = kr_to_dict("stem/" + pattern)
+            self.pattern = parse_kr("stem/" + pattern)
         elif isinstance(pattern, dict):
             self.pattern = pattern
         else:
             raise Exception("No allowed type for pattern")
+        self.tests = compile_pattern(self.pattern)
 
-    def _subset(self, small, large):
-        for key in small:
-            if key not in large:
-                return False    
-            else:
-                if type(small[key]) == dict:
-                    return self._subset(small[key], large[key])
-                else:  
-                    if small[key] != large[key]:
-                        #@ denotes a Greek character (matching everything). 
-                        if len(small[key]) == 0 or small[key][0] != '@':
-                            return False
-        return True             
- 
     def _match(self, machine):
-        res = self._subset(self.pattern, machine.control.kr)
-        return res
+        return match_pattern(self.tests, machine.control.kr)
 
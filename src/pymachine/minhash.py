@@ -0,0 +1,128 @@
+"""
+Approximate nearest lemmas by links_and_nodes similarity: MinHash signatures
+of the link and node sets of the machines (from the FeatureStore), banded
+for locality sensitive hashing. Lemmas whose machines share a band with a
+machine of the queried lemma are the candidates, together with those
+connected to it by a contains() rule (found in the indexes of the store);
+candidates are re-ranked by the exact similarity.
+
+Machines with Jaccard similarity s share a band with probability
+1 - (1 - s ** band_size) ** (n_hashes / band_size): fewer rows per band give
+more candidates, i.e. better recall for more exact similarities to compute.
+"""
+
+from collections import defaultdict
+import heapq
+
+import numpy
+
+from pymachine.feature_store import FeatureStore
+
+# the Mersenne prime 2 ** 31 - 1 of the universal hash functions
+PRIME = (1 << 31) - 1
+
+
+class MinHashIndex(object):
+    """The LSH index of the machines of the definitions of a
+    WordSimilarity."""
+    def __init__(self, word_sim, n_hashes=128, band_size=2, seed=0):
+        """
+        @param n_hashes the length of the signatures.
+        @param band_size the number of signature values in a band; the
+               number of bands is n_hashes / band_size.
+        """
+        if n_hashes % band_size:
+            raise ValueError('n_hashes has to be a multiple of band_size')
+        self.word_sim = word_sim
+        self.definitions = word_sim.wrapper.definitions
+        self.features = word_sim.features
+        if self.features is None:
+            self.features = FeatureStore.build(
+                self.definitions, word_sim.get_links_nodes, fingerprint='')
+        self.band_size = band_size
+        rnd = numpy.random.RandomState(seed)
+        self.a = rnd.randint(1, PRIME, size=n_hashes).astype(numpy.int64)
+        self.b = rnd.randint(0, PRIME, size=n_hashes).astype(numpy.int64)
+        self.index()
+
+    def signature(self, row):
+        """The MinHash signature of the links and nodes of @p row (links
+        and nodes have even and odd ids); @c None if it has neither."""
+        features = self.features
+        ids = [2 * i for i in features.link_rows[row]]
+        ids.extend(2 * i + 1 for i in features.node_rows[row])
+        if not ids:
+            return None
+        ids = numpy.array(ids, dtype=numpy.int64)
+        return ((self.a[:, None] * ids[None, :] + self.b[:, None]) %
+                PRIME).min(axis=1)
+
+    def bands(self, signature):
+        for i in xrange(0, len(signature), self.band_size):
+            yield i, signature[i:i + self.band_size].tostring()
+
+    def index(self):
+        # row -> lemma, (band, values) -> lemmas, printname -> lemmas
+        self.lemmas = {}
+        self.buckets = defaultdict(set)
+        self.lemmas_by_name = defaultdict(set)
+        rows = self.features.rows
+        for lemma, machines in self.definitions.iteritems():
+            for machine in machines:
+                row = rows.get(machine)
+                if row is None:
+                    # not in a store loaded for other definitions
+                    continue
+                self.lemmas[row] = lemma
+                self.lemmas_by_name[machine.printname()].add(lemma)
+                signature = self.signature(row)
+                if signature is not None:
+                    for band in self.bands(signature):
+                        self.buckets[band].add(lemma)
+
+    def candidates(self, lemma):
+        """The lemmas sharing a band with a machine of @p lemma, or
+        connected to one of them by a contains() rule or a 0-path."""
+        features = self.features
+        candidates = set()
+        for machine in self.definitions[lemma]:
+            row = features.rows.get(machine)
+            if row is None:
+                continue
+            signature = self.signature(row)
+            if signature is not None:
+                for band in self.bands(signature):
+                    candidates.update(self.buckets.get(band, ()))
+            # machines mentioning this one...
+            name = machine.printname()
+            for index in (features.link_index, features.node_index):
+                candidates.update(
+                    self.lemmas[r] for r in index.get(name, ())
+                    if r in self.lemmas)
+            # ...and the ones it mentions
+            for i in features.link_rows[row]:
+                link = features.link_values[i]
+                for name in (link if isinstance(link, tuple) else (link,)):
+                    candidates.update(self.lemmas_by_name.get(name, ()))
+            for i in features.node_rows[row]:
+                candidates.update(
+                    self.lemmas_by_name.get(features.node_values[i], ()))
+        candidates.discard(lemma)
+        return candidates
+
+    def similarity(self, lemma1, lemma2):
+        """The exact links_and_nodes similarity of two lemmas, as in
+        WordSimilarity.lemma_similarity()."""
+        sim = max(self.word_sim._links_and_nodes_similarity(m1, m2)
+                  for m1 in self.definitions[lemma1]
+                  for m2 in self.definitions[lemma2])
+        return sim if sim >= 0 else 0
+
+    def query(self, lemma, k=20):
+        """
+        Returns the (similarity, lemma) pairs of (at most) the @p k lemmas
+        most similar to @p lemma among the candidates, most similar first.
+        """
+        return heapq.nlargest(k, (
+            (self.similarity(lemma, candidate), candidate)
+            for candidate in self.candidates(lemma)))
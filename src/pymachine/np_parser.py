@@ -1,6 +1,11 @@
-import sys
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import heappop, heappush
+from itertools import count
 import logging
+import sys
 
+from fst import MatchMemo
 import matcher
 from pymachine.machine import Machine
 
@@ -14,44 +19,131 @@ def parse_rule(rule):
             matchers.append(pattermatch)
     return matchers
 
+def _category(matcher):
+    """
+    Returns the category (the value of CAT) that a KRPosMatcher requires,
+    or @c None if it accepts more than one.
+    """
+    tests, _, _ = matcher.tests
+    for feature, value in tests:
+        if feature == 'CAT' and isinstance(value, basestring):
+            return value
+    return None
+
+def _machine_category(machine):
+    kr = getattr(machine.control, 'kr', None)
+    if isinstance(kr, dict):
+        category = kr.get('CAT')
+        if isinstance(category, basestring):
+            return category
+    return None
+
+class ChunkParser(object):
+    """
+    Runs chunk constructions (NPConstructions) on chunks bottom-up, in one
+    pass. Each rewrite is the one the old restart loop would have found
+    first: the longest matching span, the rightmost of those, the first
+    rule in order. The matching (span, rule) pairs are kept on an agenda in
+    that order; after a rewrite, only the spans that contain the new
+    machines (or join its two sides) are checked, and each only against
+    the rules indexed under the categories of its machines.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.max_length = max([len(r.matchers) for r in self.rules] or [0])
+        # indices of the rules that require a category at each position,
+        # by those categories; the others by the length of their rhs
+        self.by_categories = defaultdict(list)
+        self.by_length = defaultdict(list)
+        for i, rule in enumerate(self.rules):
+            categories = tuple(
+                _category(m) if type(m) == matcher.KRPosMatcher
+                else None for m in rule.matchers)
+            if None in categories:
+                self.by_length[len(categories)].append(i)
+            else:
+                self.by_categories[categories].append(i)
+        self.candidate_cache = {}
+
+    def candidates(self, categories):
+        """The indices of the rules that may match machines of
+        @p categories, in order."""
+        if categories not in self.candidate_cache:
+            self.candidate_cache[categories] = sorted(
+                self.by_categories.get(categories, []) +
+                self.by_length.get(len(categories), []))
+        return self.candidate_cache[categories]
+
+    def parse(self, chunk):
+        """Rewrites @p chunk in place and returns it."""
+        new_cell = count().next
+        # every machine in the chunk is a cell; a rewrite replaces cells
+        # with new ones. Labels order the cells: the new cells take over
+        # the labels of the replaced ones, so labels never need shifting.
+        cells = [new_cell() for _ in chunk]
+        labels = range(len(chunk))
+        agenda = []
+        # matcher outcomes, until a rewrite changes the machines
+        memo = MatchMemo()
+
+        def add_spans(first, last):
+            """Puts the matches of the spans that overlap chunk[first:last]
+            (or contain the boundary at @p first if it is empty) on the
+            agenda."""
+            for length in xrange(1, self.max_length + 1):
+                for begin in xrange(max(0, first - length + 1),
+                                    min(last, len(chunk) - length + 1)):
+                    part = chunk[begin:begin + length]
+                    categories = tuple(_machine_category(m) for m in part)
+                    for rule_i in self.candidates(categories):
+                        if self.rules[rule_i].check(part, memo):
+                            heappush(agenda, (
+                                -length, -labels[begin], rule_i,
+                                tuple(cells[begin:begin + length])))
+
+        add_spans(0, len(chunk))
+        while agenda:
+            _, label, rule_i, span = heappop(agenda)
+            begin = bisect_left(labels, -label)
+            end = begin + len(span)
+            if tuple(cells[begin:end]) != span:
+                # a rewrite has replaced some of the span
+                continue
+            rule = self.rules[rule_i]
+            logging.info("applied rule " + rule.name)
+            memo.clear()
+            try:
+                c_res = rule.act(chunk[begin:end])
+            except ValueError:
+                # the restart loop caught this as its own break signal, and
+                # stopped; so do we
+                break
+            if c_res is None:
+                continue
+            chunk[begin:end] = c_res
+            cells[begin:end] = [new_cell() for _ in c_res]
+            if len(c_res) <= len(span):
+                labels[begin:end] = labels[begin:begin + len(c_res)]
+                add_spans(begin, begin + len(c_res))
+            else:
+                # no labels to take over, start over
+                labels = range(len(chunk))
+                del agenda[:]
+                add_spans(0, len(chunk))
+        return chunk
+
+_chunk_parser = None
+
 def parse_chunk(chunk):
     # HACK local import to avoid import circle
     from np_grammar import np_rules
     # Chunk constructions are run here to form the phrase machines.
-    change = True
-    while change:
-        change = False
-        try:
-            for length in xrange(len(chunk), 0, -1):
-                for begin, end in _subsequence_index(chunk, length):
-                    part = chunk[begin:end]
-#                    print begin, end, part
-#                    for m in part:
-#                        print m.control.kr
-                    for c in np_rules:
-                        if c.check(part):
-                            logging.info("applied rule " + c.name)
-                            c_res = c.act(part)
-                            if c_res is not None:
-                                change = True
-                                chunk[begin:end] = c_res  # c_res should contain a single machine here (?)
-                                raise ValueError  # == break outer
-        except ValueError:
-            pass
-    return chunk
-
-def _subsequence_index(seq, length):
-    """
-    Returns the start and end indices of all subsequences of @p seq of length
-    @p length as an iterator.
-    """
-    l = len(seq)
-    if l < length:
-        return
-#    for begin in xrange(0, l - length + 1):
-    for begin in xrange(l - length, -1, -1):
-        yield begin, begin + length
-    return
+    # the parser only keeps the rules and their index: threads can share it
+    global _chunk_parser
+    parser = _chunk_parser
+    if parser is None or parser.rules != np_rules:
+        parser = _chunk_parser = ChunkParser(np_rules)
+    return parser.parse(chunk)
 
 def test_on_something():
     from sentence_parser import SentenceParser
@@ -52,7 +52,7 @@ class FeatChangeOperator(Operator):
         if not isinstance(seq[0].control, KRPosControl):
             raise TypeError("Input machine of FeatChangeOperator can only " +
                             "have KRPosControl as its control")
-        seq[0].control.kr[self.key] = self.value
+        seq[0].control.set_feature(self.key, self.value)
         return [seq[0]]
 
 class FeatCopyOperator(Operator):
@@ -80,8 +80,8 @@ class FeatCopyOperator(Operator):
                             "with KRPosControl as their controls.")
         for key in self.keys:
             try:
-                seq[self.to_m].control.kr[key] = \
-                    seq[self.from_m].control.kr[key]
+                seq[self.to_m].control.set_feature(
+                    key, seq[self.from_m].control.kr[key])
             except KeyError:
                 pass
         return seq
@@ -1,3 +1,5 @@
+import logging
+
 from pymachine.machine import Machine
 from pymachine.control import KRPosControl as Control
 
@@ -27,7 +29,7 @@ class SentenceParser:
             else:
                 # token
                 token = token_or_chunk#[0]
-                print 'token:', token
+                logging.debug(u'token: {0}'.format(token))
                 _, analysis = token
                 machines.append([Machine(analysis.split("/")[0], Control(analysis))])
         return machines
@@ -0,0 +1,159 @@
+"""
+A persistent cache of lemma similarities: a sqlite file, with a bounded
+in-memory LRU in front of it. Entries are keyed by the pair of lemmas, the
+similarity type and a fingerprint of the definitions they were computed
+from, so that a changed lexicon does not reuse stale similarities.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import sqlite3
+
+class LRUCache(object):
+    """A dict of at most @p max_size items, dropping the least recently
+    used first."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+def _unicode(s):
+    return s if isinstance(s, unicode) else s.decode('utf-8')
+
+def machine_digest(machine):
+    """A sha1 digest of the printname of @p machine, and of the printnames of
+    its children and parents."""
+    parts = [[_unicode(child.printname_) for child in part]
+             for part in machine.partitions]
+    parents = sorted((_unicode(parent.printname_), i)
+                     for parent, i in machine.parents)
+    return hashlib.sha1(repr(
+        (_unicode(machine.printname_), parts, parents))).digest()
+
+def definitions_fingerprint(definitions):
+    """
+    Returns a hex digest of the definitions (a dict of sets of machines):
+    of the printnames of the machines of each headword, and of the
+    printnames of the children and parents of every machine reachable from
+    them.
+    """
+    lemma_digest = hashlib.sha1()
+    machine_digests = []
+    seen = set()
+    for lemma in sorted(definitions):
+        lemma_digest.update(_unicode(lemma).encode('utf-8') + '\0')
+        for name in sorted(_unicode(m.printname_)
+                           for m in definitions[lemma]):
+            lemma_digest.update(name.encode('utf-8') + '\1')
+        stack = list(definitions[lemma])
+        while stack:
+            machine = stack.pop()
+            if machine in seen:
+                continue
+            seen.add(machine)
+            machine_digests.append(machine_digest(machine))
+            for part in machine.partitions:
+                stack.extend(part)
+            stack.extend(parent for parent, _ in machine.parents)
+    digest = hashlib.sha1(lemma_digest.digest())
+    for md in sorted(machine_digests):
+        digest.update(md)
+    return digest.hexdigest()
+
+class SimCache(object):
+    """
+    Similarities of lemma pairs by similarity type. Similarities are
+    symmetric, so the pair is stored in sorted order.
+    """
+    def __init__(self, file_name=None, fingerprint='', max_size=100000,
+                 commit_every=1000):
+        """
+        @param file_name the sqlite file; if @c None, nothing is persisted.
+        @param fingerprint identifies the lexicon, see
+               definitions_fingerprint().
+        @param max_size the number of similarities kept in memory.
+        @param commit_every new similarities are written to the file in
+               batches of this size.
+        """
+        self.fingerprint = fingerprint
+        self.lru = LRUCache(max_size)
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.file_name = file_name
+        self.db = None
+        if file_name is not None:
+            self.db = sqlite3.connect(file_name, timeout=60)
+            # no type for sim: 0 and 1 are kept as integers
+            self.db.execute("""CREATE TABLE IF NOT EXISTS sims (
+                lemma1 TEXT, lemma2 TEXT, sim_type TEXT, fingerprint TEXT,
+                sim, PRIMARY KEY (lemma1, lemma2, sim_type, fingerprint))""")
+            self.db.commit()
+            logging.info('using similarity cache {0}'.format(file_name))
+
+    @staticmethod
+    def key(lemma1, lemma2, sim_type):
+        lemma1, lemma2 = sorted((_unicode(lemma1), _unicode(lemma2)))
+        return lemma1, lemma2, sim_type
+
+    def get(self, lemma1, lemma2, sim_type):
+        """Returns the similarity, or @c None if it is not cached."""
+        key = self.key(lemma1, lemma2, sim_type)
+        sim = self.lru.get(key)
+        if sim is None and self.db is not None:
+            row = self.db.execute(
+                """SELECT sim FROM sims WHERE lemma1 = ? AND lemma2 = ? AND
+                sim_type = ? AND fingerprint = ?""",
+                key + (self.fingerprint,)).fetchone()
+            if row is not None:
+                sim = row[0]
+                self.lru.put(key, sim)
+        return sim
+
+    def put(self, lemma1, lemma2, sim_type, sim):
+        key = self.key(lemma1, lemma2, sim_type)
+        self.lru.put(key, sim)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sims VALUES (?, ?, ?, ?, ?)",
+                key + (self.fingerprint, sim))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.commit()
+
+    def commit(self):
+        if self.db is not None and self.uncommitted:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def reopen(self):
+        """Connects to the file again, in a process forked after the cache
+        was created: a connection must not be used by two processes.
+        Uncommitted similarities are left to the parent process."""
+        if self.db is not None:
+            self.db = sqlite3.connect(self.file_name, timeout=60)
+            self.uncommitted = 0
+
+    def close(self):
+        if self.db is not None:
+            self.commit()
+            self.db.close()
+            self.db = None
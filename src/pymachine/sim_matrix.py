@@ -0,0 +1,164 @@
+"""
+Similarities of all pairs of a vocabulary, as the upper triangle (without
+the diagonal) of a dense float32 matrix, stored row by row in an .npy file
+that is memory-mapped. The words, in the order of the rows, are in a
+vocabulary file next to it (<file>.vocab, one word per line in utf-8).
+Missing similarities are NaN.
+"""
+
+import codecs
+
+import numpy
+from numpy.lib.format import open_memmap
+from scipy.stats import t as t_distribution
+
+
+class SimMatrix(object):
+    def __init__(self, file_name, words, sims):
+        self.file_name = file_name
+        self.words = words
+        self.index = dict((word, i) for i, word in enumerate(words))
+        self.sims = sims
+
+    @staticmethod
+    def create(file_name, words):
+        """A new matrix of the similarities of @p words, all missing."""
+        words = list(words)
+        with codecs.open(file_name + '.vocab', 'w', 'utf-8') as f:
+            for word in words:
+                f.write(u'{0}\n'.format(word))
+        n = len(words)
+        if n < 2:
+            # there is nothing to memory-map in a matrix without pairs
+            sims = numpy.zeros(0, dtype=numpy.float32)
+            with open(file_name, 'wb') as f:
+                numpy.save(f, sims)
+        else:
+            sims = open_memmap(file_name, mode='w+', dtype=numpy.float32,
+                               shape=(n * (n - 1) // 2,))
+            sims[:] = numpy.nan
+        return SimMatrix(file_name, words, sims)
+
+    @staticmethod
+    def open(file_name, mode='r'):
+        with codecs.open(file_name + '.vocab', encoding='utf-8') as f:
+            words = [line.rstrip(u'\n') for line in f]
+        if len(words) < 2:
+            return SimMatrix(file_name, words, numpy.load(file_name))
+        return SimMatrix(file_name, words, open_memmap(file_name, mode=mode))
+
+    def __len__(self):
+        return len(self.words)
+
+    def row_offset(self, i):
+        """The offset of the similarity of words i and i + 1."""
+        n = len(self.words)
+        return i * (2 * n - i - 1) // 2
+
+    def row(self, i):
+        """The similarities of word i and the words after it."""
+        offset = self.row_offset(i)
+        return self.sims[offset:offset + len(self.words) - i - 1]
+
+    def offset(self, word1, word2):
+        i, j = sorted((self.index[word1], self.index[word2]))
+        if i == j:
+            raise ValueError(u'no similarity of {0} and itself'.format(word1))
+        return self.row_offset(i) + j - i - 1
+
+    def __getitem__(self, pair):
+        return self.sims[self.offset(*pair)]
+
+    def __setitem__(self, pair, sim):
+        self.sims[self.offset(*pair)] = numpy.nan if sim is None else sim
+
+    def flush(self):
+        if isinstance(self.sims, numpy.memmap):
+            self.sims.flush()
+
+
+class WordPairs(object):
+    """
+    The pairs (w1, w2) of the words w1 < w2 of a vocabulary, in the order
+    of the similarities of a SimMatrix of the sorted vocabulary; generated
+    when iterated, not kept in memory.
+    """
+    def __init__(self, words):
+        self.words = sorted(set(words))
+        self.index = dict((word, i) for i, word in enumerate(self.words))
+
+    def __len__(self):
+        n = len(self.words)
+        return n * (n - 1) // 2
+
+    def __iter__(self):
+        words = self.words
+        for i, w1 in enumerate(words):
+            for j in xrange(i + 1, len(words)):
+                yield w1, words[j]
+
+    def __contains__(self, pair):
+        w1, w2 = pair
+        return w1 < w2 and w1 in self.index and w2 in self.index
+
+    def slice(self, begin, end):
+        """Generates the pairs from the @p begin th to the one before the
+        @p end th, in order."""
+        words = self.words
+        n = len(words)
+        # the row of the begin th pair, and the offset of its first pair
+        i, offset = 0, 0
+        while i < n - 1 and offset + n - i - 1 <= begin:
+            offset += n - i - 1
+            i += 1
+        j = i + 1 + begin - offset
+        for _ in xrange(max(0, min(end, len(self)) - begin)):
+            if j == n:
+                i += 1
+                j = i + 1
+            yield words[i], words[j]
+            j += 1
+
+
+def pearson(sims1, sims2, chunk_size=1 << 22):
+    """
+    Returns the number of pairs and the Pearson correlation of two arrays
+    of similarities (such as the @c sims of two SimMatrix objects of the
+    same words) with its two-tailed p-value, as scipy's pearsonr() does.
+    Pairs where either similarity is NaN are left out. The arrays are read
+    @p chunk_size values at a time, twice: for the means, and for the
+    centered sums. The correlation and the p-value are NaN if there are
+    fewer than two pairs, or either array is constant.
+    """
+    def chunks():
+        for begin in xrange(0, len(sims1), chunk_size):
+            x = numpy.asarray(sims1[begin:begin + chunk_size], numpy.float64)
+            y = numpy.asarray(sims2[begin:begin + chunk_size], numpy.float64)
+            valid = ~(numpy.isnan(x) | numpy.isnan(y))
+            yield x[valid], y[valid]
+
+    n, sum_x, sum_y = 0, 0.0, 0.0
+    for x, y in chunks():
+        n += len(x)
+        sum_x += x.sum()
+        sum_y += y.sum()
+    if n < 2:
+        return n, (numpy.nan, numpy.nan)
+    mean_x, mean_y = sum_x / n, sum_y / n
+    sum_xx, sum_yy, sum_xy = 0.0, 0.0, 0.0
+    for x, y in chunks():
+        x -= mean_x
+        y -= mean_y
+        sum_xx += numpy.dot(x, x)
+        sum_yy += numpy.dot(y, y)
+        sum_xy += numpy.dot(x, y)
+    if sum_xx == 0 or sum_yy == 0:
+        return n, (numpy.nan, numpy.nan)
+    r = max(min(sum_xy / numpy.sqrt(sum_xx * sum_yy), 1.0), -1.0)
+    if abs(r) == 1.0:
+        p = 0.0
+    else:
+        df = n - 2
+        t = r * numpy.sqrt(df / ((1.0 - r) * (1.0 + r)))
+        p = 2 * t_distribution.sf(abs(t), df)
+    return n, (r, p)
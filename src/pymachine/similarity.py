@@ -1,20 +1,89 @@
+from bisect import bisect_right
 from collections import defaultdict
 from ConfigParser import ConfigParser
+import hashlib
+from itertools import chain, islice, izip
+import json
 import logging
+from multiprocessing import Pool
+import os
 
 from gensim.models import Word2Vec
 from nltk.corpus import stopwords as nltk_stopwords
+import numpy
 from scipy.stats.stats import pearsonr
 
+from pymachine.batch_similarity import BatchSimilarity, format_sim
+from pymachine.embedding import Embedding
+from pymachine.feature_store import FeatureStore, binary_links_nodes, links_nodes  # nopep8
+from pymachine.minhash import MinHashIndex
+from pymachine.sim_cache import SimCache
+from pymachine import sim_matrix
+from pymachine.sim_matrix import SimMatrix, WordPairs
 from pymachine.utils import average, harmonic_mean, jaccard, min_jaccard, MachineGraph, MachineTraverser, my_max  # nopep8
 from pymachine.wrapper import Wrapper as MachineWrapper
 assert jaccard, min_jaccard  # silence pyflakes
 
+# the SimComparer of the shard worker processes, see
+# SimComparer.get_sharded_machine_sims()
+_pool_comparer = None
+
+def _init_shard_worker():
+    _pool_comparer.sim_wrapper.sim_cache.reopen()
+
+def _run_shard(shard):
+    _pool_comparer.run_shard(shard)
+    # the workers are terminated without closing the artifact sink
+    _pool_comparer.sim_wrapper.wrapper.artifacts.flush()
+    return shard
+
+def _read_checkpoint(file_name):
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name) as f:
+        return json.load(f)
+
+def _pairs_digest(pairs):
+    """The digest of a shard of pairs, computed a pair at a time."""
+    digest = hashlib.sha1()
+    for w1, w2 in pairs:
+        digest.update(u'{0}\t{1}\n'.format(w1, w2).encode('utf-8'))
+    return digest.hexdigest()
+
+def _count_lines(file_name):
+    if not os.path.exists(file_name):
+        return 0
+    with open(file_name) as f:
+        return sum(1 for _ in f)
+
+def _write_checkpoint(file_name, checkpoint):
+    """Replaces the checkpoint at once, so that a crash leaves either the
+    old or the new one."""
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(file_name + '.tmp', file_name)
+
 class WordSimilarity():
-    def __init__(self, wrapper):
+    # the FeatureStore of the definitions
+    features = None
+    # the MinHashIndex of most_similar()
+    minhash_index = None
+
+    def __init__(self, wrapper, sim_cache=None):
+        """
+        @param sim_cache a SimCache of lemma similarities; by default, one
+               that is kept in memory only.
+        @note the links and nodes of all definitions are computed here,
+              unless the wrapper has loaded them with the lexicon.
+        """
         self.wrapper = wrapper
-        self.lemma_sim_cache = {}
+        self.sim_cache = sim_cache if sim_cache is not None else SimCache()
         self.links_nodes_cache = {}
+        if wrapper.features is None:
+            wrapper.features = FeatureStore.build(wrapper.definitions)
+        self.features = wrapper.features
         self.stopwords = set(nltk_stopwords.words('english'))
 
     def log(self, string):
@@ -24,59 +93,22 @@ class WordSimilarity():
     def get_links_nodes(self, machine, use_cache=True):
         if use_cache and machine in self.links_nodes_cache:
             return self.links_nodes_cache[machine]
-        self.seen_for_links = set()
-        links = set()
-        nodes = set()
-        for link, node in self._get_links_nodes(machine, depth=0):
-            if link is not None:
-                links.add(link)
-            if node is not None:
-                nodes.add(node)
+        row = self._row(machine)
+        if row is not None:
+            links, nodes = self.features.links_nodes(row)
+        else:
+            links, nodes = links_nodes(machine)
         self.links_nodes_cache[machine] = (links, nodes)
         return links, nodes
 
-    def _get_links_nodes(self, machine, depth):
-        if machine in self.seen_for_links or depth > 5:
-            return
-        self.seen_for_links.add(machine)
-        for hypernym in machine.partitions[0]:
-            name = hypernym.printname()
-            if name == '=AGT' or not name.isupper():
-            #    if depth == 0 and name not in ("lack", "to"):  # TMP!!!
-                yield name, None
-
-            for link, node in self._get_links_nodes(hypernym, depth=depth+1):
-                yield link, node
-
-        for link, node in self.get_binary_links_nodes(machine):
-            yield link, node
-
-        for node in MachineTraverser.get_nodes(machine):
-            yield None, node
-
     def get_binary_links_nodes(self, machine):
-        for parent, partition in machine.parents:
-            parent_pn = parent.printname()
-            #if not parent_pn.isupper() or partition == 0:
-            if partition == 0:
-                #haven't seen it yet but possible
-                continue
-            elif partition == 1:
-                links = set([(parent_pn, other.printname())
-                            for other in parent.partitions[2]])
-                nodes = [m.printname() for m in parent.partitions[2]]
-            elif partition == 2:
-                links = set([(other.printname(), parent_pn)
-                            for other in parent.partitions[1]])
-                nodes = [m.printname() for m in parent.partitions[1]]
-            else:
-                raise Exception(
-                    'machine {0} has more than 3 partitions!'.format(machine))
+        return binary_links_nodes(machine)
 
-            for link in links:
-                yield link, None
-            for node in nodes:
-                yield None, node
+    def _row(self, machine):
+        """The row of @p machine in the feature store, if there is one."""
+        if self.features is None:
+            return None
+        return self.features.rows.get(machine)
 
     def link_similarity(self, links1, links2):
         pass
@@ -148,6 +180,10 @@ class WordSimilarity():
     def _links_and_nodes_similarity(self, machine1, machine2,
                                     exclude_nodes=False,
                                     no_contain_score=False):
+        row1, row2 = self._row(machine1), self._row(machine2)
+        if row1 is not None and row2 is not None:
+            return self.features.similarity(
+                row1, row2, exclude_nodes, no_contain_score)
         sim = 0
         links1, nodes1 = self.get_links_nodes(machine1)
         links2, nodes2 = self.get_links_nodes(machine2)
@@ -197,8 +233,9 @@ class WordSimilarity():
         return sim
 
     def lemma_similarity(self, lemma1, lemma2, sim_type):
-        if (lemma1, lemma2) in self.lemma_sim_cache:
-            return self.lemma_sim_cache[(lemma1, lemma2)]
+        cached = self.sim_cache.get(lemma1, lemma2, sim_type)
+        if cached is not None:
+            return cached
         elif lemma1 == lemma2:
             return 1
         self.log(u'lemma1: {0}, lemma2: {1}'.format(lemma1, lemma2))
@@ -213,22 +250,32 @@ class WordSimilarity():
 
         sim, (machine1, machine2) = pairs_by_sim[0]
 
-        draw_graphs = True  # use with caution
-        if draw_graphs and not self.wrapper.batch:
-            graph = MachineGraph.create_from_machines(
-                [machine1, machine2])  # , max_depth=1)
-            f = open('graphs/{0}_{1}.dot'.format(lemma1, lemma2), 'w')
-            f.write(graph.to_dot().encode('utf-8'))
+        if not self.wrapper.batch:
+            self.wrapper.artifacts.write(
+                u'graphs/{0}_{1}.dot'.format(lemma1, lemma2),
+                lambda: MachineGraph.create_from_machines(
+                    [machine1, machine2]).to_dot().encode('utf-8'))
 
         sim = sim if sim >= 0 else 0
-        self.lemma_sim_cache[(lemma1, lemma2)] = sim
-        self.lemma_sim_cache[(lemma2, lemma1)] = sim
+        self.sim_cache.put(lemma1, lemma2, sim_type, sim)
         return sim
 
+    def most_similar(self, lemma, k=20, **index_params):
+        """
+        Returns the (similarity, lemma) pairs of the @p k lemmas most
+        similar to @p lemma by links_and_nodes similarity, most similar
+        first. Lemmas are found approximately, by a MinHashIndex built on
+        the first call with @p index_params (n_hashes, band_size, seed);
+        similarities are exact.
+        """
+        if self.minhash_index is None:
+            self.minhash_index = MinHashIndex(self, **index_params)
+        return self.minhash_index.query(lemma, k)
+
 class SentenceSimilarity():
-    def __init__(self, machine_wrapper):
+    def __init__(self, machine_wrapper, sim_cache=None):
         self.wrapper = machine_wrapper
-        self.word_sim = WordSimilarity(machine_wrapper)
+        self.word_sim = WordSimilarity(machine_wrapper, sim_cache)
 
     def process_line(self, line, parser, sen_filter, fallback_sim):
         fields = line.decode('latin1').strip().split('\t')
@@ -264,8 +311,20 @@ class SimComparer():
         self.get_machine_sim(batch)
 
     def get_vec_sim(self):
+        """
+        Loads the vector model. If the cache option of the vectors section
+        is set, only the vectors of the words of the word_file are loaded,
+        and kept in that file (see pymachine.embedding) for later runs.
+        """
         model_fn = self.config.get('vectors', 'model')
         model_type = self.config.get('vectors', 'model_type')
+        cache = self.get_config('vectors', 'cache', '')
+        if cache:
+            self.vec_model = Embedding.cached(
+                cache, model_fn, model_type, self.read_words(),
+                lambda: self.read_vectors(model_fn, model_type))
+            logging.warning('{0} vectors loaded'.format(len(self.vec_model)))
+            return
         logging.warning('Loading model: {0}'.format(model_fn))
         if model_type == 'word2vec':
             self.vec_model = Word2Vec.load_word2vec_format(model_fn,
@@ -276,56 +335,449 @@ class SimComparer():
             raise Exception('Unknown LSA model format')
         logging.warning('Model loaded: {0}'.format(model_fn))
 
+    def read_vectors(self, model_fn, model_type):
+        """The Embedding of the words of the word_file in the model."""
+        words = self.read_words()
+        if model_type == 'word2vec':
+            return Embedding.read_word2vec(model_fn, words)
+        elif model_type == 'gensim':
+            return Embedding.from_model(Word2Vec.load(model_fn), words)
+        else:
+            raise Exception('Unknown LSA model format')
+
     def vec_sim(self, w1, w2):
         if w1 in self.vec_model and w2 in self.vec_model:
             return self.vec_model.similarity(w1, w2)
         return None
 
+    def close(self):
+        """Writes the debug artifacts of the machine wrapper not written
+        yet."""
+        self.sim_wrapper.wrapper.close()
+
     def get_machine_sim(self, batch):
         wrapper = MachineWrapper(
             self.config_file, include_longman=True, batch=batch)
-        self.sim_wrapper = WordSimilarity(wrapper)
+        self.sim_wrapper = WordSimilarity(
+            wrapper, self.get_sim_cache(wrapper))
+
+    def get_sim_cache(self, wrapper):
+        """
+        The sim_cache option of the machine section is the file of the
+        similarity cache, next to the config file by default; if it is
+        empty, similarities are only cached in memory. The cache is of the
+        fingerprint of the feature store of the definitions, which is built
+        here if the wrapper has not loaded one.
+        """
+        file_name = self.get_config(
+            'machine', 'sim_cache', self.config_file + '.simcache')
+        if not file_name:
+            return SimCache()
+        if wrapper.features is None:
+            wrapper.features = FeatureStore.build(wrapper.definitions)
+        return SimCache(
+            file_name, wrapper.features.fingerprint,
+            max_size=int(self.get_config('machine', 'sim_cache_size',
+                                         100000)))
 
     def sim(self, w1, w2):
         return self.sim_wrapper.word_similarity(w1, w2, -1, -1)
 
-    def get_words(self):
-        self.words = set((
+    def read_words(self):
+        return set((
             line.strip().decode("utf-8") for line in open(
                 self.config.get('words', 'word_file'))))
+
+    def get_words(self):
+        self.words = self.read_words()
         logging.warning('read {0} words'.format(len(self.words)))
 
     def get_machine_sims(self):
-        sim_file = self.config.get('machine', 'sim_file')
+        """
+        Computes the similarities of sorted_word_pairs and writes them to
+        the sim_file. The similarities of all pairs are computed at once by
+        BatchSimilarity, unless the sim_engine option of the machine section
+        is "scalar", in which case sim() is called for each pair, or "join",
+        in which case sim() is only called for the pairs that
+        BatchSimilarity.candidates() finds, and the rest are 0. If the
+        sim_shards option is set, sim() is called for each pair in that
+        many resumable shards, see get_sharded_machine_sims().
+
+        If the sim_matrix option is set, the similarities are written to a
+        SimMatrix in that file instead, which is also the machine_sims.
+        """
         self.machine_sims = {}
-        out = open(sim_file, 'w')
-        count = 0
-        for w1, w2 in self.sorted_word_pairs:
+        matrix_file = self.get_config('machine', 'sim_matrix', '')
+        if matrix_file:
+            out = self.machine_sims = SimMatrix.create(
+                matrix_file, sorted(self.non_oov))
+        else:
+            out = open(self.config.get('machine', 'sim_file'), 'w')
+        n_shards = int(self.get_config('machine', 'sim_shards', 0))
+        engine = self.get_config('machine', 'sim_engine', 'batch')
+        if n_shards:
+            self.get_sharded_machine_sims(
+                out, matrix_file or self.config.get('machine', 'sim_file'),
+                n_shards)
+        elif engine == 'scalar':
+            self.get_scalar_machine_sims(out)
+        elif engine == 'join':
+            self.get_join_machine_sims(out)
+        else:
+            self.get_batch_machine_sims(out)
+        if matrix_file:
+            out.flush()
+        else:
+            out.close()
+
+    def get_config(self, section, option, default):
+        if self.config.has_option(section, option):
+            return self.config.get(section, option)
+        return default
+
+    def write_machine_sim(self, out, w1, w2, sim, sim_str=None):
+        """Writes the similarity to @p out, a file or a SimMatrix; in the
+        latter, a missing similarity is 0, as in machine_sims."""
+        if sim is None:
+            logging.warning(
+                u"sim is None for non-ooovs: {0} and {1}".format(w1, w2))
+            logging.warning("treating as 0 to avoid problems")
+        if isinstance(out, SimMatrix):
+            out[w1, w2] = 0 if sim is None else sim
+            return
+        self.machine_sims[(w1, w2)] = 0 if sim is None else sim
+        if sim_str is None:
+            sim_str = u"{0}".format(sim)
+        out.write(u"{0}_{1}\t{2}\n".format(w1, w2, sim_str).encode('utf-8'))
+
+    def get_scalar_machine_sims(self, out):
+        for count, (w1, w2) in enumerate(self.sorted_word_pairs):
             if count % 100000 == 0:
                 logging.warning("{0} pairs done".format(count))
-            sim = self.sim(w1, w2)
-            if sim is None:
-                logging.warning(
-                    u"sim is None for non-ooovs: {0} and {1}".format(w1, w2))
-                logging.warning("treating as 0 to avoid problems")
-                self.machine_sims[(w1, w2)] = 0
+            self.write_machine_sim(out, w1, w2, self.sim(w1, w2))
+        self.sim_wrapper.sim_cache.commit()
+
+    def get_batch(self):
+        """The lemmas of the words, and the BatchSimilarity of them."""
+        wrapper = self.sim_wrapper.wrapper
+        lemmas = dict(
+            (word, wrapper.get_lemma(word, existing_only=True,
+                                     stem_first=True))
+            for word in self.non_oov)
+        batch = BatchSimilarity(
+            self.sim_wrapper,
+            [lemma for lemma in lemmas.itervalues() if lemma is not None],
+            block_size=int(self.get_config('machine', 'sim_block_size', 200)))
+        return lemmas, batch
+
+    def whole_rows(self, out, words):
+        """
+        Whether @p out is a SimMatrix of all pairs of @p words (the sorted
+        words of sorted_word_pairs), that can be written a row at a time.
+        """
+        return (isinstance(out, SimMatrix) and out.words == words and
+                len(self.sorted_word_pairs) == len(out.sims))
+
+    def get_lemma_rows(self, out, lemmas, batch):
+        """
+        For writing the rows of the SimMatrix @p out by lemma: returns the
+        index of the lemma of each word of the matrix (-1 for those without
+        one) and the indices of the words by the index of their lemma. The
+        rows of the words without a lemma are written here, as 0.
+        """
+        lemma_indices = numpy.empty(len(out), dtype=numpy.int64)
+        rows_by_lemma = defaultdict(list)
+        for i, word in enumerate(out.words):
+            if lemmas[word] is None:
+                lemma_indices[i] = -1
+                out.row(i)[:] = 0
             else:
-                self.machine_sims[(w1, w2)] = sim
-            count += 1
-            out.write(
-                u"{0}_{1}\t{2}\n".format(w1, w2, sim).encode('utf-8'))
+                lemma_indices[i] = batch.lemma_index[lemmas[word]]
+                rows_by_lemma[lemma_indices[i]].append(i)
+        return lemma_indices, rows_by_lemma
+
+    def get_batch_pairs(self, out):
+        """
+        Returns the BatchSimilarity of the lemmas of the words, the pairs
+        by the index of the lemma of their first word, as (w1, w2, index of
+        the lemma of w2) triples, and the number of pairs written already
+        (those with a word without a lemma).
+        """
+        lemmas, batch = self.get_batch()
+        pairs_by_row = defaultdict(list)
+        count = 0
+        for w1, w2 in self.sorted_word_pairs:
+            lemma1, lemma2 = lemmas.get(w1), lemmas.get(w2)
+            if lemma1 is None or lemma2 is None:
+                self.write_machine_sim(out, w1, w2, None)
+                count += 1
+            else:
+                pairs_by_row[batch.lemma_index[lemma1]].append(
+                    (w1, w2, batch.lemma_index[lemma2]))
+        return batch, pairs_by_row, count
+
+    def get_batch_machine_sims(self, out):
+        if self.whole_rows(out, sorted(self.non_oov)):
+            return self.get_batch_machine_sim_rows(out)
+        batch, pairs_by_row, count = self.get_batch_pairs(out)
+        for first, sims, zero_paths in batch.blocks():
+            for row in xrange(len(sims)):
+                for w1, w2, j in pairs_by_row.pop(first + row, ()):
+                    if count % 100000 == 0:
+                        logging.warning("{0} pairs done".format(count))
+                    sim, zero_path = sims[row, j], zero_paths[row, j]
+                    self.write_machine_sim(
+                        out, w1, w2, 1 if zero_path else float(sim),
+                        format_sim(sim, zero_path))
+                    count += 1
+
+    def get_batch_machine_sim_rows(self, out):
+        """get_batch_machine_sims() into a SimMatrix of all pairs, a row at
+        a time, without a list of the pairs."""
+        lemmas, batch = self.get_batch()
+        lemma_indices, rows_by_lemma = self.get_lemma_rows(out, lemmas, batch)
+        for first, sims, zero_paths in batch.blocks():
+            logging.warning("{0} of {1} lemmas done".format(
+                first, len(batch.lemmas)))
+            for row in xrange(len(sims)):
+                # the last column, -1, is the 0 of the words without a lemma
+                sims_of_words = numpy.append(sims[row], 0)[lemma_indices]
+                for i in rows_by_lemma.get(first + row, ()):
+                    out.row(i)[:] = sims_of_words[i + 1:]
+
+    def get_sharded_machine_sims(self, out, sim_file, n_shards):
+        """
+        Computes the similarities of sorted_word_pairs by sim(), in
+        @p n_shards shards of consecutive pairs in sorted order, run by a
+        pool of sim_processes processes (one for each shard by default).
+        Each shard is written to its own file, sim_file.<shard>, and its
+        progress to sim_file.<shard>.checkpoint every sim_checkpoint pairs:
+        a stopped run can be started again, finished shards are skipped and
+        the others go on from their last checkpoint. In the end the shards
+        are merged into @p out, the sim_file or a SimMatrix; they are kept,
+        so that running again only merges them.
+        """
+        global _pool_comparer
+        # the shards are ranges of the indices of the pairs
+        self.pairs = self.sorted_word_pairs
+        if not isinstance(self.pairs, WordPairs):
+            self.pairs = sorted(self.pairs)
+        n_pairs = len(self.pairs)
+        self.shards = [
+            (n_pairs * i // n_shards, n_pairs * (i + 1) // n_shards)
+            for i in xrange(n_shards)]
+        self.shard_file = sim_file + '.{0}'
+        self.checkpoint_every = int(
+            self.get_config('machine', 'sim_checkpoint', 10000))
+        processes = int(self.get_config(
+            'machine', 'sim_processes', n_shards))
+        # the workers start from what is in the cache now
+        self.sim_wrapper.sim_cache.commit()
+        _pool_comparer = self
+        if processes <= 1:
+            for shard in xrange(n_shards):
+                _run_shard(shard)
+        else:
+            pool = Pool(processes, _init_shard_worker)
+            try:
+                for shard in pool.imap_unordered(
+                        _run_shard, xrange(n_shards)):
+                    logging.warning("shard {0} done".format(shard))
+            finally:
+                pool.terminate()
+                pool.join()
+
+        # a shard file that does not match its checkpoint (e.g. one that was
+        # changed or cut short since) is run again from the start
+        for shard, (begin, end) in enumerate(self.shards):
+            file_name = self.shard_file.format(shard)
+            if _count_lines(file_name) == end - begin:
+                continue
+            logging.warning(
+                "{0} does not have {1} lines, running it again".format(
+                    file_name, end - begin))
+            if os.path.exists(file_name + '.checkpoint'):
+                os.remove(file_name + '.checkpoint')
+            self.run_shard(shard)
+            if _count_lines(file_name) != end - begin:
+                raise ValueError("{0} does not have {1} lines".format(
+                    file_name, end - begin))
+
+        matrix = isinstance(out, SimMatrix)
+        for shard in xrange(n_shards):
+            with open(self.shard_file.format(shard)) as shard_out:
+                for (w1, w2), line in izip(self.shard_pairs(shard),
+                                           shard_out):
+                    sim = line.rstrip('\n').rsplit('\t', 1)[1]
+                    sim = 0 if sim == 'None' else float(sim)
+                    if matrix:
+                        out[w1, w2] = sim
+                    else:
+                        out.write(line)
+                        self.machine_sims[(w1, w2)] = sim
+
+    def shard_pairs(self, shard, skip=0):
+        """Generates the pairs of @p shard in order, from the @p skip th
+        on."""
+        begin, end = self.shards[shard]
+        if isinstance(self.pairs, WordPairs):
+            return self.pairs.slice(begin + skip, end)
+        return islice(self.pairs, begin + skip, end)
+
+    def run_shard(self, shard):
+        """
+        Writes the similarities of the pairs of @p shard to its file, from
+        its checkpoint on: the number of pairs written and the size of the
+        file when they were, for the pairs with the same digest.
+        """
+        begin, end = self.shards[shard]
+        n_pairs = end - begin
+        file_name = self.shard_file.format(shard)
+        digest = _pairs_digest(self.shard_pairs(shard))
+        checkpoint = _read_checkpoint(file_name + '.checkpoint')
+        if checkpoint is None or checkpoint['digest'] != digest:
+            checkpoint = {'digest': digest, 'pairs': 0, 'offset': 0}
+        # the file of an empty shard is (re)created empty
+        if checkpoint['pairs'] == n_pairs and n_pairs > 0:
+            return
+        out = open(file_name, 'r+' if checkpoint['offset'] else 'w')
+        out.seek(checkpoint['offset'])
+        out.truncate()
+        for count, (w1, w2) in enumerate(
+                self.shard_pairs(shard, checkpoint['pairs']),
+                checkpoint['pairs']):
+            self.write_machine_sim(out, w1, w2, self.sim(w1, w2))
+            if (count + 1) % self.checkpoint_every == 0 or \
+                    count + 1 == n_pairs:
+                out.flush()
+                os.fsync(out.fileno())
+                self.sim_wrapper.sim_cache.commit()
+                checkpoint['pairs'], checkpoint['offset'] = \
+                    count + 1, out.tell()
+                _write_checkpoint(file_name + '.checkpoint', checkpoint)
+                logging.warning("shard {0}: {1} of {2} pairs done".format(
+                    shard, count + 1, n_pairs))
         out.close()
 
+    def get_join_machine_sims(self, out):
+        if self.whole_rows(out, sorted(self.non_oov)):
+            return self.get_join_machine_sim_rows(out)
+        batch, pairs_by_row, count = self.get_batch_pairs(out)
+        evaluated = 0
+        for first, candidates in batch.candidates():
+            for row in xrange(len(candidates)):
+                row_candidates = set(candidates[row])
+                row_candidates.add(first + row)
+                for w1, w2, j in pairs_by_row.pop(first + row, ()):
+                    if count % 100000 == 0:
+                        logging.warning("{0} pairs done".format(count))
+                    if j in row_candidates:
+                        self.write_machine_sim(out, w1, w2, self.sim(w1, w2))
+                        evaluated += 1
+                    else:
+                        self.write_machine_sim(out, w1, w2, 0)
+                    count += 1
+        logging.warning("similarity computed for {0} of {1} pairs".format(
+            evaluated, count))
+        self.sim_wrapper.sim_cache.commit()
+
+    def get_join_machine_sim_rows(self, out):
+        """get_join_machine_sims() into a SimMatrix of all pairs, a row at a
+        time, without a list of the pairs."""
+        lemmas, batch = self.get_batch()
+        _, rows_by_lemma = self.get_lemma_rows(out, lemmas, batch)
+        words = out.words
+        evaluated = 0
+        for first, candidates in batch.candidates():
+            logging.warning("{0} of {1} lemmas done".format(
+                first, len(batch.lemmas)))
+            for row in xrange(len(candidates)):
+                rows = rows_by_lemma.get(first + row)
+                if not rows:
+                    continue
+                row_candidates = set(candidates[row])
+                row_candidates.add(first + row)
+                columns = sorted(chain(*(
+                    rows_by_lemma.get(j, ()) for j in row_candidates)))
+                for i in rows:
+                    sims = numpy.zeros(len(words) - i - 1, dtype=numpy.float32)
+                    for j in columns[bisect_right(columns, i):]:
+                        sim = self.sim(words[i], words[j])
+                        sims[j - i - 1] = 0 if sim is None else sim
+                        evaluated += 1
+                    out.row(i)[:] = sims
+        logging.warning("similarity computed for {0} of {1} pairs".format(
+            evaluated, len(out.sims)))
+        self.sim_wrapper.sim_cache.commit()
+
     def get_vec_sims(self):
-        sim_file = self.config.get('vectors', 'sim_file')
-        out = open(sim_file, 'w')
+        """
+        Computes the similarities of the vectors of sorted_word_pairs and
+        writes them to the sim_file of the vectors section, or to the
+        SimMatrix in sim_matrix if that option is set. The cosine
+        similarities are computed as products of the normalized vectors, for
+        blocks of sim_block_size words at a time, unless the sim_engine
+        option is "scalar", in which case vec_sim() is called for each
+        pair. A SimMatrix is also the vec_sims.
+        """
         self.vec_sims = {}
-        for w1, w2 in self.sorted_word_pairs:
-            vec_sim = self.vec_sim(w1, w2)
+        matrix_file = self.get_config('vectors', 'sim_matrix', '')
+        if matrix_file:
+            out = self.vec_sims = SimMatrix.create(
+                matrix_file, sorted(self.non_oov))
+        else:
+            out = open(self.config.get('vectors', 'sim_file'), 'w')
+        if self.get_config('vectors', 'sim_engine', 'batch') == 'scalar':
+            for w1, w2 in self.sorted_word_pairs:
+                self.write_vec_sim(out, w1, w2, self.vec_sim(w1, w2))
+        else:
+            self.get_batch_vec_sims(out)
+        if matrix_file:
+            out.flush()
+        else:
+            out.close()
+
+    def write_vec_sim(self, out, w1, w2, vec_sim):
+        if isinstance(out, SimMatrix):
+            out[w1, w2] = vec_sim
+        else:
             self.vec_sims[(w1, w2)] = vec_sim
             out.write(
                 u"{0}_{1}\t{2}\n".format(w1, w2, vec_sim).encode('utf-8'))
-        out.close()
+
+    def get_batch_vec_sims(self, out):
+        # the words of sorted_word_pairs
+        words = sorted(word for word in self.non_oov if word in self.vec_model)
+        index = dict((word, i) for i, word in enumerate(words))
+        vectors = numpy.array([self.vec_model[word] for word in words],
+                              dtype=numpy.float32)
+        norms = numpy.sqrt((vectors * vectors).sum(axis=1))
+        nonzero = norms > 0
+        vectors[nonzero] /= norms[nonzero, None]
+
+        # the rows of a matrix of all pairs of the same words are written
+        # at once; otherwise pairs are written by the index of their first
+        # word, as (w1, w2, index of w2) triples (the first word is the
+        # smaller, and so is its index)
+        rows = (isinstance(out, SimMatrix) and out.words == words and
+                len(self.sorted_word_pairs) == len(out.sims))
+        pairs_by_row = defaultdict(list)
+        for w1, w2 in () if rows else self.sorted_word_pairs:
+            if w1 in index and w2 in index:
+                pairs_by_row[index[w1]].append((w1, w2, index[w2]))
+            else:
+                self.write_vec_sim(out, w1, w2, None)
+
+        block_size = int(self.get_config('vectors', 'sim_block_size', 1000))
+        for first in xrange(0, len(words), block_size):
+            # the similarities of the block and the words from its first on
+            sims = vectors[first:first + block_size].dot(vectors[first:].T)
+            for row in xrange(len(sims)):
+                if rows:
+                    out.row(first + row)[:] = sims[row, row + 1:]
+                    continue
+                for w1, w2, j in pairs_by_row.pop(first + row, ()):
+                    self.write_vec_sim(out, w1, w2, sims[row, j - first])
 
     def get_sims(self):
         self.get_words()
@@ -346,21 +798,29 @@ class SimComparer():
             'kept {0} words after discarding those not in machine sim'.format(
                 len(self.non_oov)))
 
-        self.sorted_word_pairs = set()
-        for w1 in self.non_oov:
-            for w2 in self.non_oov:
-                if w1 != w2 and w1 == sorted([w1, w2])[0]:
-                    self.sorted_word_pairs.add((w1, w2))
+        self.sorted_word_pairs = WordPairs(self.non_oov)
 
         self.get_machine_sims()
         self.get_vec_sims()
 
     def compare(self):
-        sims = [self.machine_sims[pair] for pair in self.sorted_word_pairs]
-        vec_sims = [self.vec_sims[pair] for pair in self.sorted_word_pairs]
-
-        pearson = pearsonr(sims, vec_sims)
-        print "compared {0} distance pairs.".format(len(sims))
+        """
+        Prints the Pearson correlation of the machine and vector
+        similarities; if both are SimMatrix objects of the same words, it
+        is computed from their files, see sim_matrix.pearson().
+        """
+        if (isinstance(self.machine_sims, SimMatrix) and
+                isinstance(self.vec_sims, SimMatrix) and
+                self.machine_sims.words == self.vec_sims.words):
+            n_pairs, pearson = sim_matrix.pearson(
+                self.machine_sims.sims, self.vec_sims.sims)
+        else:
+            sims = [self.machine_sims[pair]
+                    for pair in self.sorted_word_pairs]
+            vec_sims = [self.vec_sims[pair]
+                        for pair in self.sorted_word_pairs]
+            n_pairs, pearson = len(sims), pearsonr(sims, vec_sims)
+        print "compared {0} distance pairs.".format(n_pairs)
         print "Pearson-correlation: {0}".format(pearson)
 
 def main():
@@ -373,8 +833,11 @@ def main():
         config_file = sys.argv[1]
         batch = bool(int(sys.argv[2]))
         comparer = SimComparer(config_file, batch=batch)
-        comparer.get_sims()
-        comparer.compare()
+        try:
+            comparer.get_sims()
+            comparer.compare()
+        finally:
+            comparer.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,393 @@
+"""
+Binary snapshots of the static graph of a finalized Lexicon.
+
+A snapshot is a flat file of little-endian arrays: a string table of the
+printnames, the nodes (machines) with their printname, number of
+partitions and control, the edges of the partitions (source, target,
+partition, in order), the parent links, and the static and static_disambig
+tables of the lexicon. It is read through mmap, so processes loading the
+same snapshot share its pages, and machines are only built when they are
+reached: a machine's partitions and parents are filled in on first access.
+
+Constructions are not saved; they have to be added to the loaded lexicon.
+"""
+
+from array import array
+import cPickle
+import logging
+import mmap
+import struct
+import sys
+
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine, Partitions
+
+MAGIC = 'PYMLEXSN'
+VERSION = 1
+
+# (name, struct type code) of the sections, in the order they are stored;
+# 's' sections are raw bytes
+SECTIONS = [
+    ('strings', 's'),           # utf-8 encoded strings, concatenated
+    ('string_offsets', 'I'),    # S + 1 offsets into strings
+    ('string_unicode', 'B'),    # 1 if the string was unicode, 0 if str
+    ('control_classes', 'I'),   # string ids of 'module.Class' names
+    ('node_names', 'I'),        # N string ids of printname_
+    ('node_part_nums', 'H'),    # N partition counts
+    ('node_controls', 'H'),     # N control class indices, 0 for None
+    ('control_offsets', 'I'),   # N + 1 offsets into control_data
+    ('control_data', 's'),      # pickled attributes of the controls
+    ('edge_offsets', 'I'),      # N + 1 offsets into the edge arrays
+    ('edge_targets', 'I'),      # E node ids
+    ('edge_parts', 'H'),        # E partition indices
+    ('parent_offsets', 'I'),    # N + 1 offsets into the parent arrays
+    ('parent_sources', 'I'),    # P node ids
+    ('parent_parts', 'H'),      # P partition indices
+    ('static_names', 'I'),      # K string ids of the keys of static
+    ('static_offsets', 'I'),    # K + 1 offsets into static_nodes
+    ('static_nodes', 'I'),      # node ids
+    ('disambig_names', 'I'),    # D string ids of keys of static_disambig
+    ('disambig_offsets', 'I'),  # D + 1 offsets into disambig_values
+    ('disambig_values', 'I'),   # string ids
+]
+
+# magic, version, then (offset, byte length) of each section
+HEADER = struct.Struct('<8sI' + 'QQ' * len(SECTIONS))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotWriter(object):
+    """Collects the tables of a snapshot from a lexicon."""
+    def __init__(self, lexicon):
+        self.strings = []
+        self.string_ids = {}
+        self.nodes = []
+        self.node_ids = {}
+        self.control_classes = [None]
+        self.control_class_ids = {None: 0}
+        self.collect_nodes(lexicon)
+        self.tables = self.build_tables(lexicon)
+
+    def string_id(self, s):
+        key = type(s), s
+        if key not in self.string_ids:
+            self.string_ids[key] = len(self.strings)
+            self.strings.append(s)
+        return self.string_ids[key]
+
+    def node_id(self, machine):
+        if machine not in self.node_ids:
+            self.node_ids[machine] = len(self.nodes)
+            self.nodes.append(machine)
+        return self.node_ids[machine]
+
+    def collect_nodes(self, lexicon):
+        """Numbers the machines reachable from static, in order."""
+        for machines in lexicon.static.itervalues():
+            for machine in machines:
+                self.node_id(machine)
+        i = 0
+        while i < len(self.nodes):
+            machine = self.nodes[i]
+            for part in machine.partitions:
+                for child in part:
+                    self.node_id(child)
+            for parent, _ in machine.parents:
+                self.node_id(parent)
+            i += 1
+
+    def control_class_id(self, control):
+        cls = None if control is None else type(control)
+        if cls not in self.control_class_ids:
+            self.control_class_ids[cls] = len(self.control_classes)
+            self.control_classes.append(cls)
+        return self.control_class_ids[cls]
+
+    def build_tables(self, lexicon):
+        t = dict((name, array(code)) for name, code in SECTIONS
+                 if code != 's')
+        control_data = []
+        control_length = 0
+        t['control_offsets'].append(0)
+        t['edge_offsets'].append(0)
+        t['parent_offsets'].append(0)
+        for machine in self.nodes:
+            t['node_names'].append(self.string_id(machine.printname_))
+            t['node_part_nums'].append(len(machine.partitions))
+            control = machine.control
+            t['node_controls'].append(self.control_class_id(control))
+            if control is not None:
+                attrs = dict((k, v) for k, v in control.__dict__.iteritems()
+                             if k != 'machine')
+                if attrs:
+                    data = cPickle.dumps(attrs, 2)
+                    control_data.append(data)
+                    control_length += len(data)
+            t['control_offsets'].append(control_length)
+
+            for part_i, part in enumerate(machine.partitions):
+                for child in part:
+                    t['edge_targets'].append(self.node_ids[child])
+                    t['edge_parts'].append(part_i)
+            t['edge_offsets'].append(len(t['edge_targets']))
+
+            for parent, part_i in machine.parents:
+                t['parent_sources'].append(self.node_ids[parent])
+                t['parent_parts'].append(part_i)
+            t['parent_offsets'].append(len(t['parent_sources']))
+
+        t['static_offsets'].append(0)
+        for name, machines in lexicon.static.iteritems():
+            t['static_names'].append(self.string_id(name))
+            t['static_nodes'].extend(self.node_ids[m] for m in machines)
+            t['static_offsets'].append(len(t['static_nodes']))
+
+        t['disambig_offsets'].append(0)
+        for name, names in lexicon.static_disambig.iteritems():
+            t['disambig_names'].append(self.string_id(name))
+            t['disambig_values'].extend(self.string_id(n) for n in names)
+            t['disambig_offsets'].append(len(t['disambig_values']))
+
+        for cls in self.control_classes[1:]:
+            t['control_classes'].append(self.string_id(
+                '{0}.{1}'.format(cls.__module__, cls.__name__)))
+
+        # the string table is complete only now
+        encoded = []
+        length = 0
+        t['string_offsets'].append(0)
+        for s in self.strings:
+            is_unicode = isinstance(s, unicode)
+            data = s.encode('utf-8') if is_unicode else s
+            encoded.append(data)
+            length += len(data)
+            t['string_offsets'].append(length)
+            t['string_unicode'].append(int(is_unicode))
+
+        t['strings'] = ''.join(encoded)
+        t['control_data'] = ''.join(control_data)
+        return t
+
+    def write(self, f):
+        blobs = []
+        for name, code in SECTIONS:
+            table = self.tables[name]
+            if code != 's':
+                if sys.byteorder != 'little':
+                    table = array(code, table)
+                    table.byteswap()
+                table = table.tostring()
+            blobs.append(table)
+        directory = []
+        offset = HEADER.size
+        for blob in blobs:
+            directory += [offset, len(blob)]
+            offset += len(blob)
+        f.write(HEADER.pack(MAGIC, VERSION, *directory))
+        for blob in blobs:
+            f.write(blob)
+
+
+def save_lexicon(lexicon, file_name):
+    """Writes the static graph of @p lexicon to @p file_name."""
+    writer = SnapshotWriter(lexicon)
+    logging.info('saving {0} machines, {1} edges to {2}'.format(
+        len(writer.nodes), len(writer.tables['edge_targets']), file_name))
+    with open(file_name, 'wb') as f:
+        writer.write(f)
+
+
+class Section(object):
+    """A read-only view of an array in the snapshot."""
+    def __init__(self, buf, offset, length, code):
+        self.buf = buf
+        self.offset = offset
+        self.code = code
+        self.item_size = struct.calcsize(code)
+        self.length = length / self.item_size
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return struct.unpack_from(
+            '<' + self.code, self.buf, self.offset + i * self.item_size)[0]
+
+    def range(self, begin, end):
+        """Items @p begin to @p end as a tuple."""
+        return struct.unpack_from(
+            '<{0}{1}'.format(end - begin, self.code), self.buf,
+            self.offset + begin * self.item_size)
+
+    def bytes(self, begin, end):
+        return self.buf[self.offset + begin:self.offset + end]
+
+
+class Snapshot(object):
+    """An open snapshot file. Machines are built on demand by machine()."""
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buf) < HEADER.size:
+            raise SnapshotError('not a lexicon snapshot: ' + file_name)
+        header = HEADER.unpack_from(self.buf, 0)
+        if header[0] != MAGIC:
+            raise SnapshotError('not a lexicon snapshot: ' + file_name)
+        if header[1] != VERSION:
+            raise SnapshotError(
+                'snapshot version {0} of {1} is not supported'.format(
+                    header[1], file_name))
+        for i, (name, code) in enumerate(SECTIONS):
+            offset, length = header[2 + 2 * i:4 + 2 * i]
+            setattr(self, name, Section(
+                self.buf, offset, length, 'B' if code == 's' else code))
+        self.machines = {}
+        self.control_classes = [None] + [
+            self.load_class(self.string(i))
+            for i in self.control_classes.range(0, len(self.control_classes))]
+
+    @staticmethod
+    def load_class(name):
+        module, _, cls = name.rpartition('.')
+        return getattr(__import__(module, fromlist=[cls]), cls)
+
+    def string(self, i):
+        begin, end = self.string_offsets.range(i, i + 2)
+        s = self.strings.bytes(begin, end)
+        if self.string_unicode[i]:
+            return s.decode('utf-8')
+        return s
+
+    def control(self, node):
+        cls = self.control_classes[self.node_controls[node]]
+        if cls is None:
+            return None
+        control = cls.__new__(cls)
+        begin, end = self.control_offsets.range(node, node + 2)
+        control.__dict__['machine'] = None
+        if end > begin:
+            control.__dict__.update(
+                cPickle.loads(self.control_data.bytes(begin, end)))
+        return control
+
+    def machine(self, node):
+        """Returns the machine of @p node, without its partitions and
+        parents."""
+        if node not in self.machines:
+            self.machines[node] = SnapshotMachine.from_snapshot(self, node)
+        return self.machines[node]
+
+    def partitions(self, node):
+        partitions = [[] for _ in xrange(self.node_part_nums[node])]
+        begin, end = self.edge_offsets.range(node, node + 2)
+        if end > begin:
+            for target, part in zip(self.edge_targets.range(begin, end),
+                                    self.edge_parts.range(begin, end)):
+                partitions[part].append(self.machine(target))
+        return partitions
+
+    def parents(self, node):
+        begin, end = self.parent_offsets.range(node, node + 2)
+        if end == begin:
+            return set()
+        return set((self.machine(source), part) for source, part in zip(
+            self.parent_sources.range(begin, end),
+            self.parent_parts.range(begin, end)))
+
+    def static(self):
+        static = {}
+        for i in xrange(len(self.static_names)):
+            begin, end = self.static_offsets.range(i, i + 2)
+            static[self.string(self.static_names[i])] = [
+                self.machine(node)
+                for node in self.static_nodes.range(begin, end)]
+        return static
+
+    def static_disambig(self):
+        static_disambig = {}
+        for i in xrange(len(self.disambig_names)):
+            begin, end = self.disambig_offsets.range(i, i + 2)
+            static_disambig[self.string(self.disambig_names[i])] = set(
+                self.string(s)
+                for s in self.disambig_values.range(begin, end))
+        return static_disambig
+
+
+class SnapshotMachine(Machine):
+    """
+    A machine loaded from a snapshot. Its partitions and parents are read
+    from the snapshot the first time either of them is accessed; after
+    that it behaves as any other machine.
+    """
+    __slots__ = ('snapshot', 'node', '_parents')
+
+    def __init__(self, name, control=None, part_num=3):
+        self.snapshot = None
+        Machine.__init__(self, name, control, part_num)
+
+    @staticmethod
+    def from_snapshot(snapshot, node):
+        machine = SnapshotMachine.__new__(SnapshotMachine)
+        machine.snapshot = snapshot
+        machine.node = node
+        machine.printname_ = snapshot.string(snapshot.node_names[node])
+        machine._partitions = None
+        machine._parents = None
+        machine.set_control(snapshot.control(node))
+        return machine
+
+    def _materialize(self):
+        snapshot, self.snapshot = self.snapshot, None
+        self._partitions = Partitions(snapshot.partitions(self.node))
+        self._parents = snapshot.parents(self.node)
+
+    def _get_partitions(self):
+        if self.snapshot is not None:
+            self._materialize()
+        return self._partitions
+
+    def _set_partitions(self, partitions):
+        # materialized first, so that it does not overwrite them later
+        if self.snapshot is not None:
+            self._materialize()
+        Machine._set_partitions(self, partitions)
+
+    partitions = property(_get_partitions, _set_partitions)
+
+    def _get_parents(self):
+        if self.snapshot is not None:
+            self._materialize()
+        return self._parents
+
+    def _set_parents(self, parents):
+        if self.snapshot is not None:
+            self._materialize()
+        self._parents = parents
+
+    parents = property(_get_parents, _set_parents)
+
+    def __getstate__(self):
+        return (self.printname_, self.partitions, self.control, self.parents)
+
+    def __setstate__(self, state):
+        self.snapshot = None
+        self.printname_, self._partitions, self.control, self._parents = \
+            state
+
+
+def load_lexicon(file_name):
+    """
+    Returns a lexicon with the static graph in the snapshot @p file_name,
+    and no constructions.
+    """
+    snapshot = Snapshot(file_name)
+    lexicon = Lexicon()
+    lexicon.static = snapshot.static()
+    lexicon.static_disambig = snapshot.static_disambig()
+    logging.info('loaded {0} static printnames from {1}'.format(
+        len(lexicon.static), file_name))
+    return lexicon
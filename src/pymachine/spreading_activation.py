@@ -1,9 +1,9 @@
-from math import factorial as fac
 import logging
 import itertools
 
 from control import PluginControl
 from construction import Construction
+from fst import MatchMemo
 from pymachine.control import ConceptControl
 from np_parser import parse_chunk
 
@@ -56,6 +56,9 @@ class SpreadingActivation(object):
             "\n\nSEMANTIC CONSTRUCTIONS:" + ' ' + semantic_dbg_str + "\n\n")
 
         avm_constructions = set()
+        # matcher outcomes, shared by the constructions until one of them
+        # changes the machines
+        memo = MatchMemo()
 
         # Chunk constructions are run here to form the phrase machines.
         for chunk in filter(lambda c: len(c) > 1, chunks):
@@ -91,46 +94,26 @@ class SpreadingActivation(object):
                 logging.debug("EXPANDING: " + unicode(machine).encode('utf-8'))
 
                 self.lexicon.expand(machine)
+            memo.clear()
 
             logging.debug("\n\nACTIVE DICT: {}".format(self.lexicon.active))
             logging.debug("\n\nACTIVE MACHINES: {}".format(
                 self.lexicon.active_machines()))
             # Step 2a: semantic constructions:
             for c in semantic_constructions:
-                # The machines that can take part in constructions
                 logging.info("CONST " + c.name)
-                accepted = []
-                # Find the sequences that match the construction
-                # TODO: combinatorial explosion alert!
-                no_active = len(self.lexicon.active_machines())
+                # The machines that can take part in constructions; sequences
+                # with concepts (words not in the sentence) are never tried
+                active_machines = self.lexicon.active_machines()
+                candidates = [m for m in active_machines
+                              if not isinstance(m.control, ConceptControl)]
                 max_length = 3
-                no_all_combinations = sum((fac(no_active)/fac(no_active-i-1)
-                                          for i in range(max_length)))
                 logging.info((
-                    '# of active machines: {0}, ' +
-                    'trying all sequences of at most {1} machines, ' +
-                    'total # of sequences: {2}').format(
-                    no_active, max_length, no_all_combinations))
-                """
-                for i, seq in enumerate(powerset(
-                        self.lexicon.active_machines())):
-                """
-                count = 0
-                for elems in xrange(
-                        min(len(self.lexicon.active_machines()), max_length)):
-                #for elems in xrange(len(constable)):
-                    for i, seq in enumerate(itertools.permutations(
-                            self.lexicon.active_machines(), elems + 1)):
-                        if any(isinstance(machine.control, ConceptControl)
-                               for machine in seq):
-                            continue
-                        #logging.info('trying this: {0}'.format(seq))
-                        count += 1
-                        if count % 10000 == 0:
-                            logging.info("{0}".format(count))
-
-                        if c.check(seq):
-                            accepted.append(seq)
+                    '# of active machines: {0}, candidates: {1}, ' +
+                    'trying sequences of at most {2} machines').format(
+                    len(active_machines), len(candidates), max_length))
+                # Find the sequences that match the construction
+                accepted = c.matching_sequences(candidates, max_length, memo)
 
                 # The sequence preference order is longer first
                 # TODO: obviously this won't work for every imaginable
@@ -152,6 +135,7 @@ class SpreadingActivation(object):
                     seq = accepted[-1]
                     logging.debug('trying to make construction act')
                     c_res = c.act(seq)
+                    memo.clear()
                     if c_res is not None:
                         logging.info("SUCCESS: " + u" ".join(unicode(m)
                                      for m in seq).encode("utf-8"))
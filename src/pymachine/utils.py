@@ -49,6 +49,11 @@ class MachineTraverser():
                 yield node
 
 
+def _set_bits(bits):
+    """The indices of the 1 bits of the integer @p bits, in order."""
+    return [i for i, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+
 class MachineGraph:
     @staticmethod
     def create_from_machines(iterable, max_depth=None, whitelist=None,
@@ -124,6 +129,13 @@ class MachineGraph:
         self.G = nx.MultiDiGraph()
 
     def do_closure(self):
+        """
+        Adds the transitive closure of the edges of color 0, then copies
+        every other edge along the 0-edges leaving its endpoints.
+        Reachability is computed for all nodes at once on the condensation
+        of the 0-graph, as bitsets (bit j of a node's integer stands for
+        the j-th node of the 0-graph).
+        """
         g0 = nx.DiGraph()
         curr_edges = [
             (n1, n2, d['color']) for n1, n2, d in self.G.edges(data=True)]
@@ -131,20 +143,23 @@ class MachineGraph:
             if c == 0:
                 g0.add_edge(n1, n2, color=0)
 
-        g0_edges = g0.edges()
-        for n1 in g0.nodes():
-            for n2 in g0.nodes():
-                if n1 == n2:
+        nodes = list(g0.nodes())
+        reachable = MachineGraph._reachable(g0, nodes)
+        edge_set = set(curr_edges)
+        for i, n1 in enumerate(nodes):
+            for j in _set_bits(reachable[i]):
+                if j == i:
                     continue
-                if nx.has_path(g0, n1, n2):
-                    # print 'adding edge:', n1, n2
-                    if (n1, n2) not in g0_edges:
-                        g0.add_edge(n1, n2)
-                    if (n1, n2, 0) not in curr_edges:
-                        self.G.add_edge(n1, n2, color=0)
+                n2 = nodes[j]
+                # g0 gets the closure too, for the neighbors below
+                if n2 not in g0[n1]:
+                    g0.add_edge(n1, n2)
+                if (n1, n2, 0) not in edge_set:
+                    self.G.add_edge(n1, n2, color=0)
 
         curr_edges = [
             (n1, n2, d['color']) for n1, n2, d in self.G.edges(data=True)]
+        edge_set = set(curr_edges)
 
         for n1, n2, c in curr_edges:
             if c != 0:
@@ -152,15 +167,40 @@ class MachineGraph:
                     for n3 in g0.neighbors(n1):
                         if n3 == n2:
                             continue
-                        if (n3, n2, c) not in curr_edges:
+                        if (n3, n2, c) not in edge_set:
                             self.G.add_edge(n3, n2, color=c)
                 if n2 in g0:
                     for n3 in g0.neighbors(n2):
                         if n3 == n1:
                             continue
-                        if (n1, n3, c) not in curr_edges:
+                        if (n1, n3, c) not in edge_set:
                             self.G.add_edge(n1, n3, color=c)
 
+    @staticmethod
+    def _reachable(graph, nodes):
+        """
+        Returns a bitset for each of @p nodes, with the bits of the nodes
+        reachable from it (and of those in its strongly connected
+        component).
+        """
+        index = dict((node, i) for i, node in enumerate(nodes))
+        condensed = nx.condensation(graph)
+        members = {}
+        for component, data in condensed.nodes(data=True):
+            bits = 0
+            for node in data['members']:
+                bits |= 1 << index[node]
+            members[component] = bits
+        below = {}
+        for component in reversed(list(nx.topological_sort(condensed))):
+            bits = 0
+            for component2 in condensed.successors(component):
+                bits |= members[component2] | below[component2]
+            below[component] = bits
+        mapping = condensed.graph['mapping']
+        return [members[mapping[node]] | below[mapping[node]]
+                for node in nodes]
+
     def add_edge(self, machine1, machine2, color,
                  machinegraph_options, orig_machines=[]):
         # logging.debug(u'adding edge: {} -> {}'.format(node1, node2))
@@ -1,13 +1,19 @@
 #!/usr/bin/env python
+from collections import deque
 from copy import deepcopy
 import cPickle
+from itertools import islice
 import logging
+from multiprocessing import Pool
 import os
 import re
 import sys
 
+from pymachine import artifacts
 from pymachine.construction import VerbConstruction
+from pymachine.feature_store import FeatureStore
 from pymachine.sentence_parser import SentenceParser
+from pymachine import snapshot
 from pymachine.lexicon import Lexicon
 from pymachine.utils import ensure_dir, MachineGraph, MachineTraverser
 from pymachine.machine import Machine
@@ -26,6 +32,36 @@ def jaccard(s1, s2):
     except ZeroDivisionError:
         return 0.0
 
+# the Wrapper of the pool worker processes of Wrapper.run_many(); set before
+# the pool is forked, so the workers share its lexicon copy-on-write
+_pool_wrapper = None
+
+def _run_sentences(sentences, flush=False):
+    """
+    Runs a chunk of sentences in a pool worker process. Returns a
+    (results, error) pair for each: an exception does not stop the batch,
+    its message is returned instead.
+    @param flush whether to wait for the artifacts of the chunk to be
+           written; pool workers are terminated without closing their sink.
+    """
+    ret = []
+    for sentence in sentences:
+        try:
+            ret.append((_pool_wrapper.run(sentence), None))
+        except Exception, e:
+            ret.append((None, u'{0}: {1}'.format(type(e).__name__, e)))
+    if flush:
+        _pool_wrapper.artifacts.flush()
+    return ret
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 class Wrapper:
 
     num_re = re.compile(r'^[0-9.,]+$', re.UNICODE)
@@ -41,15 +77,42 @@ class Wrapper:
         self.__read_supp_dict()
         self.reset_lexicon()
 
+    def close(self):
+        """Writes the debug artifacts not written yet; the wrapper is not to
+        be used afterwards."""
+        self.artifacts.close()
+
     def reset_lexicon(self, load_from=None, save_to=None):
-        if load_from:
+        """
+        Builds the lexicon from the definitions, or loads it from
+        @p load_from, and saves it to @p save_to. Files ending in .snapshot
+        are lexicon snapshots (see pymachine.snapshot), anything else is a
+        pickle. The FeatureStore of the definitions is saved along with it
+        (as @p save_to.features), and loaded if there is one; otherwise it
+        is left to WordSimilarity to build.
+        """
+        self.features = None
+        if load_from and os.path.exists(load_from + '.features'):
+            self.features = FeatureStore.load(
+                load_from + '.features', self.definitions)
+        if load_from and load_from.endswith('.snapshot'):
+            # constructions are not part of the snapshot
+            self.lexicon = snapshot.load_lexicon(load_from)
+            self.__add_constructions()
+        elif load_from:
             self.lexicon = cPickle.load(open(load_from))
         else:
             self.lexicon = Lexicon()
             self.__add_definitions()
             self.__add_constructions()
-        if save_to:
+        if save_to and save_to.endswith('.snapshot'):
+            snapshot.save_lexicon(self.lexicon, save_to)
+        elif save_to:
             cPickle.dump(self.lexicon, open(save_to, 'w'))
+        if save_to:
+            if self.features is None:
+                self.features = FeatureStore.build(self.definitions)
+            self.features.save(save_to + '.features')
 
     def __read_config(self):
         items = dict(self.cfg.items("machine"))
@@ -60,9 +123,31 @@ class Wrapper:
         self.ext_defs_path = items.get("ext_definitions")
         self.supp_dict_fn = items.get("supp_dict")
         self.plural_fn = items.get("plurals")
+        # definition files are parsed by a pool of this many processes
+        self.processes = int(items.get("processes", 1))
+        # debug artifacts (dot files): disabled, sync or background
+        self.artifacts = artifacts.create_sink(
+            items.get("artifacts", artifacts.DISABLED),
+            items.get("artifact_dir", "."),
+            int(items.get("artifact_queue_size", 1000)))
 
     def __read_definitions(self):
         self.definitions = {}
+        # the pool parses the definition files that are not pickled yet
+        to_parse = any(not file_name.endswith('pickle')
+                       for file_name, _ in self.def_files)
+        pool = Pool(self.processes) if (
+            self.processes > 1 and to_parse) else None
+        try:
+            self.__merge_definitions(pool)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def __merge_definitions(self, pool):
+        # all files are submitted to the pool before the first is merged
+        file_definitions = []
         for file_name, printname_index in self.def_files:
             # TODO HACK makefile needed
             if (file_name.endswith("generated") and
@@ -79,9 +164,13 @@ class Wrapper:
             else:
                 logging.info('parsing 4lang definitions...')
                 definitions = read_defs(
-                    file(file_name), printname_index=printname_index,
-                    three_parts=True)
+                    file(file_name), language_index=printname_index,
+                    pool=pool)
+            file_definitions.append((file_name, definitions))
 
+        for file_name, definitions in file_definitions:
+            if not file_name.endswith('pickle'):
+                definitions = dict(definitions)
                 logging.info('dumping 4lang definitions to file...')
                 f = open('{0}.pickle'.format(file_name), 'w')
                 cPickle.dump(definitions, f)
@@ -157,10 +246,14 @@ class Wrapper:
 
     def run(self, sentence):
         """Parses a sentence, runs the spreading activation and returns the
-        messages that have to be sent to the active plugins."""
+        messages that have to be sent to the active plugins. The shared
+        lexicon is not changed: the sentence is processed in a
+        LexiconSession of its own, so several sentences can be run at the
+        same time."""
         try:
+            lexicon = self.lexicon.session()
             sp = SentenceParser()
-            sa = SpreadingActivation(self.lexicon)
+            sa = SpreadingActivation(lexicon)
             machines = sp.parse(sentence)
             logging.debug('machines: {}'.format(machines))
             logging.debug('machines: {}'.format(
@@ -170,22 +263,19 @@ class Wrapper:
                     if machine.control.kr['CAT'] == 'VERB':
                         logging.debug('adding verb construction for {}'.format(
                             machine))
-                        self.lexicon.add_construction(VerbConstruction(
-                            machine.printname(), self.lexicon, self.supp_dict))
-            logging.info('constructions: {}'.format(
-                self.lexicon.constructions))
+                        lexicon.add_construction(VerbConstruction(
+                            machine.printname(), lexicon, self.supp_dict,
+                            artifacts=self.artifacts))
+            logging.info('constructions: {}'.format(lexicon.constructions))
 
             # results is a list of (url, data) tuples
             results = sa.activation_loop(machines)
-            print 'results:', results
-            print 'machines:', machines
-
-            graph = MachineGraph.create_from_machines(
-                [m[0] for m in machines], max_depth=1)
-            f = open('machines.dot', 'w')
-            f.write(graph.to_dot().encode('utf-8'))
+            logging.debug('results: {0}'.format(results))
 
-            self.lexicon.clear_active()
+            self.artifacts.write(
+                'machines.dot', lambda: MachineGraph.create_from_machines(
+                    [m[0] for m in machines],
+                    max_depth=1).to_dot().encode('utf-8'))
         except Exception, e:
             import traceback
             traceback.print_exc(e)
@@ -193,6 +283,57 @@ class Wrapper:
 
         return results
 
+    def run_many(self, sentences, processes=None, chunk_size=10,
+                 max_pending=None):
+        """
+        Runs a stream of sentences, yielding a (results, error) pair for each,
+        in order: the return value of run(), or the message of the exception
+        it raised.
+
+        The sentences are run by a pool of worker processes forked after the
+        lexicon has been built, so that the static graph is not copied.
+        Sentences are read from @p sentences only as the workers need them,
+        so memory use does not depend on the length of the stream.
+        @param processes the number of worker processes; the processes
+               option of the config by default. With one, the sentences are
+               run in this process.
+        @param chunk_size the number of sentences sent to a worker at a time.
+        @param max_pending the number of chunks read ahead; twice the number
+               of processes by default.
+        """
+        global _pool_wrapper
+        if processes is None:
+            processes = self.processes
+        if processes <= 1:
+            _pool_wrapper = self
+            for chunk in _chunks(sentences, chunk_size):
+                for result in _run_sentences(chunk):
+                    yield result
+            return
+
+        if max_pending is None:
+            max_pending = 2 * processes
+        # the activation index is built on the first session; before the
+        # fork, so that it is shared, too
+        self.lexicon.session()
+        _pool_wrapper = self
+        pool = Pool(processes)
+        try:
+            pending = deque()
+            for chunk in _chunks(sentences, chunk_size):
+                pending.append(
+                    pool.apply_async(_run_sentences, (chunk, True)))
+                if len(pending) >= max_pending:
+                    for result in pending.popleft().get():
+                        yield result
+            while pending:
+                for result in pending.popleft().get():
+                    yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
 def test_plain():
     print 'building wrapper...'
     w = Wrapper(sys.argv[1])
@@ -0,0 +1,172 @@
+"""
+AVM.satisfied() with the compiled satisfaction expression against the old
+one that parsed the expression on every call, on the ticket AVMs of the
+MAV demo (demo_misc): the AVM step of the activation loop is run on a
+stream of machines. The two must give the same values (and exceptions),
+also on random expressions.
+
+Usage: python bench_avm.py [number of machines] [number of random tests]
+"""
+import random
+import sys
+import time
+
+from pyparsing import Word, alphas, oneOf, operatorPrecedence, opAssoc
+
+from pymachine.avm import AVM
+from pymachine.construction import AVMConstruction
+from pymachine.control import ConceptControl
+from pymachine.machine import Machine
+from pymachine.matcher import PrintnameMatcher
+
+
+class ParsingAVM(AVM):
+    """The old satisfied(), which parsed bool_str on every call."""
+    def set_satisfaction(self, bool_str):
+        self.bool_str = bool_str
+        boolOperand = Word(alphas + '_') | oneOf("True False")
+        self.bool_expr = operatorPrecedence(boolOperand, [
+            ("not", 1, opAssoc.RIGHT, self.old_notop),
+            ("or", 2, opAssoc.LEFT, self.old_orop),
+            ("and", 2, opAssoc.LEFT, self.old_andop),
+        ])
+
+    def satisfied(self):
+        if self.bool_expr is not None:
+            return self.bool_expr.parseString(self.bool_str)[0]
+        return AVM.satisfied(self)
+
+    def old_andop(self, t):
+        for a in t[0][0::2]:
+            if isinstance(a, basestring):
+                if a in set(['True', 'False']):
+                    v = bool(a)
+                else:
+                    v = self[a] is not None
+            else:
+                v = bool(a)
+            if not v:
+                return False
+        return True
+
+    def old_orop(self, t):
+        for a in t[0][0::2]:
+            if isinstance(a, basestring):
+                if a in set(['True', 'False']):
+                    v = bool(a)
+                else:
+                    v = self[a] is not None
+            else:
+                v = bool(a)
+            if v:
+                return True
+        return False
+
+    def old_notop(self, t):
+        arg = t[0][1]
+        if isinstance(arg, basestring):
+            if arg in set(['True', 'False']):
+                v = bool(arg)
+            else:
+                v = self[arg] is not None
+        else:
+            v = bool(arg)
+        return not v
+
+
+# the ticket AVMs of demo_misc, with printname matchers for the lexicon
+# based ones; TIME is not an attribute, as there
+TICKETS = [
+    ('PlainTicketAvm',
+     ['BKSZ', 'CLASS', 'DEST', 'INV', 'RED', 'RET', 'SRC', 'ELVIRA',
+      'SEAT_TICKET', 'JEGY', 'HELYJEGY', 'IC'],
+     'SRC and CLASS and RED and RET and (IC or DEST) and not ELVIRA and '
+     'not SEAT_TICKET and not (HELYJEGY and not JEGY)'),
+    ('ICTicketAvm', ['CLASS', 'DEST', 'INV', 'PLACE', 'SRC', 'IC'],
+     'SRC and CLASS and (IC or (TIME and DEST))'),
+    ('ElviraAVM', ['vonat', 'menetrend', 'src', 'tgt'],
+     'vonat and menetrend and tgt'),
+]
+
+
+def ticket_avm(avm_class, name, attributes, bool_str):
+    avm = avm_class(name)
+    for attribute in attributes:
+        avm.add_attribute(attribute, PrintnameMatcher(
+            '^{0}$'.format(attribute.lower())), AVM.ROPT, None)
+    avm.set_satisfaction(bool_str)
+    return avm
+
+
+def outcome(avm):
+    try:
+        return avm.satisfied()
+    except KeyError, e:
+        return 'KeyError', e.args
+
+
+def activation(avm_class, machines):
+    """The AVM step of SpreadingActivation.activation_loop() on each
+    machine; returns the satisfaction values."""
+    constructions = [AVMConstruction(ticket_avm(avm_class, *ticket))
+                     for ticket in TICKETS]
+    values = []
+    for m in machines:
+        for c in constructions:
+            if c.check([m]):
+                c.act([m])
+                values.append(outcome(c.avm))
+    return values
+
+
+def random_expression(rnd, names, depth=0):
+    if depth > 3 or rnd.random() < 0.3:
+        return rnd.choice(names + ['True', 'False'])
+    kind = rnd.choice(('not', 'and', 'or', 'paren'))
+    if kind == 'not':
+        return 'not ' + random_expression(rnd, names, depth + 1)
+    elif kind == 'paren':
+        return '(' + random_expression(rnd, names, depth + 1) + ')'
+    return ' {0} '.format(kind).join(
+        random_expression(rnd, names, depth + 1)
+        for _ in xrange(rnd.randint(2, 4)))
+
+
+def random_tests(n, seed=0):
+    rnd = random.Random(seed)
+    names = ['A', 'B', 'C', 'D']
+    for _ in xrange(n):
+        bool_str = random_expression(rnd, names + ['MISSING'])
+        avms = [ticket_avm(avm_class, 'X', names, bool_str)
+                for avm_class in (ParsingAVM, AVM)]
+        for _ in xrange(4):
+            for name in names:
+                value = rnd.choice((None, 'x'))
+                for avm in avms:
+                    avm[name] = value
+            old, new = [outcome(avm) for avm in avms]
+            assert old == new, (bool_str, old, new)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_tests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    random_tests(n_tests)
+    print "{0} random expressions: same values".format(n_tests)
+
+    rnd = random.Random(0)
+    names = [a.lower() for _, attributes, _ in TICKETS for a in attributes]
+    names += ['vonat_{0}'.format(i) for i in xrange(len(names))]
+    machines = [Machine(rnd.choice(names), ConceptControl())
+                for _ in xrange(n)]
+    results = []
+    for avm_class in (ParsingAVM, AVM):
+        start = time.time()
+        results.append(activation(avm_class, machines))
+        print "{0:>10}: {1} satisfied() calls, {2:.3f}s".format(
+            avm_class.__name__, len(results[-1]), time.time() - start)
+    assert results[0] == results[1], "different values"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+MachineGraph.do_closure() against the has_path() version it replaced, on
+graphs of random machines built by MachineGraph.create_from_machines(). The
+two must add the same edges.
+
+Usage: python bench_closure.py [number of machines] [children per machine]
+"""
+import random
+import sys
+import time
+
+import networkx as nx
+
+from pymachine.machine import Machine
+from pymachine.utils import MachineGraph
+
+
+def has_path_closure(graph):
+    """The old do_closure()."""
+    g0 = nx.DiGraph()
+    curr_edges = [
+        (n1, n2, d['color']) for n1, n2, d in graph.G.edges(data=True)]
+    for n1, n2, c in curr_edges:
+        if c == 0:
+            g0.add_edge(n1, n2, color=0)
+
+    g0_edges = g0.edges()
+    for n1 in g0.nodes():
+        for n2 in g0.nodes():
+            if n1 == n2:
+                continue
+            if nx.has_path(g0, n1, n2):
+                if (n1, n2) not in g0_edges:
+                    g0.add_edge(n1, n2)
+                if (n1, n2, 0) not in curr_edges:
+                    graph.G.add_edge(n1, n2, color=0)
+
+    curr_edges = [
+        (n1, n2, d['color']) for n1, n2, d in graph.G.edges(data=True)]
+
+    for n1, n2, c in curr_edges:
+        if c != 0:
+            if n1 in g0:
+                for n3 in g0.neighbors(n1):
+                    if n3 == n2:
+                        continue
+                    if (n3, n2, c) not in curr_edges:
+                        graph.G.add_edge(n3, n2, color=c)
+            if n2 in g0:
+                for n3 in g0.neighbors(n2):
+                    if n3 == n1:
+                        continue
+                    if (n1, n3, c) not in curr_edges:
+                        graph.G.add_edge(n1, n3, color=c)
+
+
+def random_machines(n, width, seed=0):
+    """Machines with random children, 0-edges (IS_A) being the most
+    common, as in definitions."""
+    rnd = random.Random(seed)
+    machines = [Machine(u'm{0}'.format(i)) for i in xrange(n)]
+    for m in machines:
+        for _ in xrange(width):
+            m.append(rnd.choice(machines), rnd.choice((0, 0, 1, 2)))
+    return machines
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    machines = random_machines(n, width)
+    results = []
+    for closure in (has_path_closure, MachineGraph.do_closure):
+        graph = MachineGraph.create_from_machines(machines)
+        edges = graph.G.number_of_edges()
+        start = time.time()
+        closure(graph)
+        print "{0:>16}: {1} nodes, {2} -> {3} edges, {4:.2f}s".format(
+            closure.__name__, graph.G.number_of_nodes(), edges,
+            graph.G.number_of_edges(), time.time() - start)
+        results.append(list(graph.G.edges(keys=True, data=True)))
+    assert results[0] == results[1], "different edges"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Memory and throughput of Machine against the layout it had before
+Partition: a __dict__ per machine and plain lists as partitions.
+
+Usage: python bench_machine.py [number of machines] [children per machine]
+"""
+import random
+import sys
+import time
+
+from pymachine.machine import Machine
+
+
+class ListMachine(object):
+    """The old storage layout, with the old append() and remove()."""
+    def __init__(self, name, control=None, part_num=3):
+        self.printname_ = name
+        self.partitions = [[] for i in range(part_num)]
+        self.control = control
+        self.parents = set()
+
+    def append(self, what, which_partition=0):
+        if what in self.partitions[which_partition]:
+            return
+        self.partitions[which_partition].append(what)
+        what.parents.add((self, which_partition))
+
+    def remove(self, what, which_partition):
+        self.partitions[which_partition].remove(what)
+        what.parents.remove((self, which_partition))
+
+
+def deep_size(machines):
+    """The bytes taken by the machines, their partitions and parent sets."""
+    total = 0
+    for m in machines:
+        total += sys.getsizeof(m)
+        if hasattr(m, '__dict__'):
+            total += sys.getsizeof(m.__dict__)
+        total += sys.getsizeof(m.partitions)
+        for p in m.partitions:
+            total += sys.getsizeof(p)
+            positions = getattr(p, 'positions', None)
+            if positions is not None:
+                total += sys.getsizeof(positions)
+        total += sys.getsizeof(m.parents)
+        total += sum(sys.getsizeof(link) for link in m.parents)
+    return total
+
+
+def build(cls, n, width, hubs=10):
+    """A random graph of @p n machines with @p width children each, and
+    @p hubs machines with n / 10 children each (like IS_A or HAS)."""
+    rnd = random.Random(0)
+    machines = [cls(u'm{0}'.format(i)) for i in xrange(n)]
+    for m in machines:
+        for _ in xrange(width):
+            m.append(machines[rnd.randrange(n)], rnd.randrange(3))
+    for hub in machines[:hubs]:
+        for _ in xrange(n / 10):
+            hub.append(machines[rnd.randrange(n)], 0)
+    return machines
+
+
+def unlink(machines, hubs=10):
+    """Removes the children of the hubs, in a random order."""
+    rnd = random.Random(1)
+    for hub in machines[:hubs]:
+        children = list(hub.partitions[0])
+        rnd.shuffle(children)
+        for child in children:
+            hub.remove(child, 0)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print "{0} machines, {1} children each".format(n, width)
+    for cls in (ListMachine, Machine):
+        start = time.time()
+        machines = build(cls, n, width)
+        built = time.time()
+        size = deep_size(machines)
+        unlink(machines)
+        print "{0:>12}: build {1:.2f}s, unlink {2:.2f}s, {3:.1f} MB".format(
+            cls.__name__, built - start, time.time() - built,
+            size / 1024.0 ** 2)
+
+
+if __name__ == "__main__":
+    main()
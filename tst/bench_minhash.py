@@ -0,0 +1,91 @@
+"""
+Top-k queries of the MinHashIndex against brute force (the exact similarity
+of the queried lemma and every other lemma), on random definitions whose
+lemmas are defined by the concepts of a few topics, for a few band sizes.
+The recall is the ratio of the results that are as similar as the k-th
+most similar lemma (of those with a nonzero similarity).
+
+Usage: python bench_minhash.py [number of lemmas] [k] [number of queries]
+"""
+import logging
+import random
+import sys
+import time
+
+from pymachine.machine import Machine
+from pymachine.minhash import MinHashIndex
+from pymachine.sim_cache import SimCache
+from pymachine.similarity import WordSimilarity
+
+
+class Wrapper(object):
+    batch = True
+    features = None
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+
+
+def topic_definitions(n_lemmas, n_topics=50, seed=0):
+    rnd = random.Random(seed)
+    # the concepts of a topic, and others; each definition has its own
+    # machines of them, as get_nodes() also follows the parents
+    topics = [[u't{0}_{1}'.format(t, i) for i in xrange(12)]
+              for t in xrange(n_topics)]
+    noise = [u'c{0}'.format(i) for i in xrange(500)]
+    definitions = {}
+    for i in xrange(n_lemmas):
+        lemma = u'w{0}'.format(i)
+        topic = rnd.choice(topics)
+        machine = Machine(lemma)
+        for concept in rnd.sample(topic, rnd.randint(2, 5)):
+            machine.append(Machine(concept), 0)
+        for concept in rnd.sample(noise, rnd.randint(0, 2)):
+            machine.append(Machine(concept), 0)
+        definitions[lemma] = set([machine])
+    return definitions
+
+
+def recall(result, exact, k):
+    exact = sorted((sim for sim in exact if sim > 0), reverse=True)[:k]
+    if not exact:
+        return 1.0
+    return float(sum(1 for sim, _ in result if sim >= exact[-1])) / len(exact)
+
+
+def main():
+    logging.disable(logging.INFO)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    definitions = topic_definitions(n)
+    word_sim = WordSimilarity(Wrapper(definitions), SimCache())
+    lemmas = sorted(definitions)
+    queries = random.Random(1).sample(lemmas, n_queries)
+
+    index = MinHashIndex(word_sim)
+    start = time.time()
+    exact = [[index.similarity(query, lemma)
+              for lemma in lemmas if lemma != query] for query in queries]
+    print "brute force: {0:.3f}s per query".format(
+        (time.time() - start) / n_queries)
+
+    for n_hashes, band_size in ((64, 4), (64, 2), (128, 2), (256, 2)):
+        start = time.time()
+        index = MinHashIndex(word_sim, n_hashes=n_hashes, band_size=band_size)
+        index_time = time.time() - start
+        start = time.time()
+        results = [index.query(query, k) for query in queries]
+        query_time = (time.time() - start) / n_queries
+        mean_recall = sum(recall(result, sims, k) for result, sims in zip(
+            results, exact)) / n_queries
+        candidates = sum(len(index.candidates(query))
+                         for query in queries) / n_queries
+        print ("{0} hashes, bands of {1}: index {2:.3f}s, " +
+               "{3:.4f}s per query, {4} candidates, recall@{5} {6:.3f}"
+               ).format(n_hashes, band_size, index_time, query_time,
+                        candidates, k, mean_recall)
+
+
+if __name__ == "__main__":
+    main()
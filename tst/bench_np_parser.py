@@ -0,0 +1,85 @@
+"""
+Throughput of np_parser.parse_chunk against the restart loop it replaced,
+on random chunks of KR coded words. The two must give the same chunks.
+
+Usage: python bench_np_parser.py [chunk length] [number of chunks]
+"""
+import logging
+import random
+import sys
+import time
+
+from pymachine.control import KRPosControl
+from pymachine.machine import Machine
+from pymachine.np_grammar import np_rules
+from pymachine.np_parser import parse_chunk
+
+# no NUM: the rules adding PLUR to numerals fail (Machine.append() only
+# takes machines)
+codes = ['ADJ', 'ADV', 'ART', 'ART<DEF<1>>', 'NOUN', 'NOUN<BAR<0>>',
+         'NOUN<CAS<ACC>>', 'NOUN<CAS<DAT>>', 'NOUN<BAR<0>><DEF<1>>',
+         'VERB[PERF_PART]/ADJ', '[PRON<DEM>]/NOUN<BAR<0>>', 'DET<DEF<1>>',
+         'VERB']
+
+
+def restart_parse_chunk(chunk):
+    """The old parse_chunk(): rescan everything after each rewrite."""
+    change = True
+    while change:
+        change = False
+        try:
+            for length in xrange(len(chunk), 0, -1):
+                for begin in xrange(len(chunk) - length, -1, -1):
+                    end = begin + length
+                    part = chunk[begin:end]
+                    for c in np_rules:
+                        if c.check(part):
+                            c_res = c.act(part)
+                            if c_res is not None:
+                                change = True
+                                chunk[begin:end] = c_res
+                                raise ValueError  # == break outer
+        except ValueError:
+            pass
+    return chunk
+
+
+def random_chunks(length, number, seed=0):
+    rnd = random.Random(seed)
+    return [[Machine(u'w{0}'.format(i), KRPosControl(rnd.choice(codes)))
+             for i in xrange(length)] for _ in xrange(number)]
+
+
+def signature(machine, seen=None):
+    """The printnames and KR codes of @p machine and its partitions."""
+    if not isinstance(machine, Machine):
+        return machine
+    if seen is None:
+        seen = set()
+    if machine in seen:
+        return machine.printname()
+    seen.add(machine)
+    return (machine.printname(), sorted(machine.control.kr.items()),
+            [[signature(m, seen) for m in p] for p in machine.partitions])
+
+
+def main():
+    logging.disable(logging.INFO)
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print "{0} chunks of {1} words".format(number, length)
+    results = []
+    for parse in (restart_parse_chunk, parse_chunk):
+        chunks = random_chunks(length, number)
+        start = time.time()
+        for chunk in chunks:
+            parse(chunk)
+        elapsed = time.time() - start
+        print "{0:>20}: {1:.3f}s, {2:.1f} words/s".format(
+            parse.__name__, elapsed, length * number / elapsed)
+        results.append([[signature(m) for m in chunk] for chunk in chunks])
+    assert results[0] == results[1], "different chunks"
+
+
+if __name__ == "__main__":
+    main()
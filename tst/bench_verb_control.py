@@ -0,0 +1,86 @@
+"""
+VerbFrame.generate_transitions() against the permutation walk it replaced,
+on verbs with 5 to 8 argument slots (deep cases and supplementary regexps).
+The two must give the same transitions.
+
+Usage: python bench_verb_control.py [min arguments] [max arguments]
+"""
+from collections import defaultdict
+from itertools import permutations
+import logging
+import sys
+import time
+
+from pymachine.construction import VerbConstruction, VerbFrame
+from pymachine.constants import deep_cases
+from pymachine.control import ConceptControl
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+from pymachine.matcher import KRPosMatcher
+
+
+def permutation_transitions(frame):
+    """The old generate_control() loop, into the frame's format."""
+    arguments = frame.arguments
+    transitions = defaultdict(dict)
+    transitions["0"][KRPosMatcher("VERB")] = ("1", None)
+    for path in permutations(arguments):
+        actual_state = 1
+        for arg in path:
+            increase = pow(2, arguments.index(arg))
+            new_state = actual_state + increase
+            transitions[str(actual_state)][frame.matchers[arg]] = (
+                str(new_state), arg)
+            actual_state = new_state
+    return dict(
+        (state, [(matcher, out_state, arg)
+                 for matcher, (out_state, arg) in edges.iteritems()])
+        for state, edges in transitions.iteritems())
+
+
+def verb_lexicon(n):
+    """A verb with n arguments: deep cases first, then regexps."""
+    names = (deep_cases + ['${0}'.format(i) for i in xrange(n)])[:n]
+    supp_dict = dict((name, KRPosMatcher('NOUN<CAS<{0}>>'.format(name[1:])))
+                     for name in names if name.startswith('$'))
+    verb = Machine(u'verb{0}'.format(n), ConceptControl())
+    for name in names:
+        verb.append(Machine(name, ConceptControl()), 0)
+    lexicon = Lexicon()
+    lexicon.add_static([verb])
+    lexicon.finalize_static()
+    return lexicon, verb.printname(), supp_dict
+
+
+def normalized(transitions):
+    """The transitions with the matchers of the arguments by id; the verb
+    matcher is created anew each time."""
+    return dict((state, sorted((None if arg is None else id(m), out, arg)
+                               for m, out, arg in edges))
+                for state, edges in transitions.iteritems())
+
+
+def main():
+    logging.disable(logging.INFO)
+    low = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    high = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    for n in xrange(low, high + 1):
+        lexicon, name, supp_dict = verb_lexicon(n)
+        start = time.time()
+        frame = VerbFrame.get(lexicon, name, supp_dict)
+        direct_time = time.time() - start
+        start = time.time()
+        old_transitions = permutation_transitions(frame)
+        old_time = time.time() - start
+        assert normalized(old_transitions) == normalized(frame.transitions), \
+            "different transitions"
+        start = time.time()
+        VerbConstruction(name, lexicon, supp_dict)
+        construction_time = time.time() - start
+        print ("{0} arguments, {1} states: permutations {2:.4f}s, " +
+               "direct {3:.4f}s, construction from cache {4:.4f}s").format(
+            n, len(frame.states), old_time, direct_time, construction_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+
+from pymachine.artifacts import create_sink
+
+
+def render_count():
+    calls = []
+
+    def render():
+        calls.append(1)
+        return 'digraph {}'
+    return render, calls
+
+
+def test_disabled_sink_does_not_render():
+    render, calls = render_count()
+    sink = create_sink()
+    sink.write('machines.dot', render)
+    sink.close()
+    assert calls == []
+
+
+def test_sinks_write_files():
+    path = tempfile.mkdtemp()
+    try:
+        for mode in ('sync', 'background'):
+            sink = create_sink(mode, os.path.join(path, mode), queue_size=5)
+            for i in xrange(3):
+                sink.write('graphs/{0}.dot'.format(i), lambda: 'digraph {}')
+            sink.close()
+            assert sorted(os.listdir(os.path.join(path, mode, 'graphs'))) == [
+                '0.dot', '1.dot', '2.dot']
+    finally:
+        shutil.rmtree(path)
+
+
+def test_flush():
+    path = tempfile.mkdtemp()
+    try:
+        sink = create_sink('background', path)
+        for i in xrange(20):
+            sink.write('{0}.dot'.format(i), lambda: 'digraph {}')
+        sink.flush()
+        assert len(os.listdir(path)) == 20
+        assert sink.thread.is_alive()
+        sink.close()
+        assert not sink.thread.is_alive()
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,44 @@
+import pytest
+
+from pymachine.avm import AVM
+from pymachine.matcher import PrintnameMatcher
+
+
+def avm(bool_str, **values):
+    a = AVM('Test')
+    for name in 'ABC':
+        a.add_attribute(name, PrintnameMatcher(name), AVM.ROPT, None)
+        a[name] = values.get(name)
+    a.set_satisfaction(bool_str)
+    return a
+
+
+def test_satisfaction():
+    assert avm('A and B', A=1, B=1).satisfied() is True
+    assert avm('A and B', A=1).satisfied() is False
+    assert avm('A or not B').satisfied() is True
+    assert avm('not (A or B)', B=1).satisfied() is False
+    # or binds tighter than and
+    assert avm('A and B or C', A=1, C=1).satisfied() is True
+    assert avm('C or B and A', C=1).satisfied() is False
+    # the strings True and False are both true
+    assert avm('False and A', A=1).satisfied() is True
+    assert avm('not False').satisfied() is False
+    # a single operand is returned as it is
+    assert avm('A').satisfied() == 'A'
+
+
+def test_evaluation_order():
+    # operands are looked up until the result is decided...
+    assert avm('A or MISSING', A=1).satisfied() is True
+    # ...but nested operations are all evaluated first
+    with pytest.raises(KeyError):
+        avm('A or (MISSING and B)', A=1).satisfied()
+
+
+def test_copy_has_own_values():
+    a = avm('A and B', A=1)
+    b = a.copy()
+    b['B'] = 1
+    assert b.satisfied() is True
+    assert a.satisfied() is False
@@ -0,0 +1,154 @@
+from ConfigParser import ConfigParser
+import os
+import random
+
+import numpy
+import pytest
+
+from pymachine.artifacts import ArtifactSink
+from pymachine.batch_similarity import BatchSimilarity, format_sim
+from pymachine.machine import Machine
+from pymachine.sim_cache import SimCache
+from pymachine.sim_matrix import SimMatrix, WordPairs
+from pymachine.similarity import SimComparer, WordSimilarity
+
+
+class Wrapper(object):
+    batch = True
+    artifacts = ArtifactSink()
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+
+    def get_lemma(self, word, existing_only=True, stem_first=True):
+        return word if word in self.definitions else None
+
+
+class RandomWordSimilarity(WordSimilarity):
+    """Random link and node sets instead of those of real definitions."""
+    def __init__(self, n_lemmas=30, seed=0):
+        rnd = random.Random(seed)
+        names = [u'w{0}'.format(i) for i in xrange(40)]
+        entities = [u'@e1', u'@e2']
+        definitions = {}
+        self.sim_cache = SimCache()
+        self.links_nodes_cache = {}
+        for lemma in names[:n_lemmas]:
+            definitions[lemma] = set()
+            for _ in xrange(rnd.choice([1, 1, 1, 2, 3])):
+                machine = Machine(
+                    lemma if rnd.random() < 0.8 else rnd.choice(names))
+                links = set(rnd.sample(names, rnd.randrange(4)))
+                links |= set((rnd.choice(names), rnd.choice(names))
+                             for _ in xrange(rnd.randrange(3)))
+                if rnd.random() < 0.2:
+                    links.add(rnd.choice(entities))
+                nodes = set(rnd.sample(names, rnd.randrange(6)))
+                self.links_nodes_cache[machine] = (links, nodes)
+                definitions[lemma].add(machine)
+        self.wrapper = Wrapper(definitions)
+
+
+def test_batch_similarity():
+    word_sim = RandomWordSimilarity()
+    batch = BatchSimilarity(word_sim, word_sim.wrapper.definitions,
+                            block_size=7)
+    for first, sims, zero_paths in batch.blocks():
+        for row in xrange(len(sims)):
+            lemma1 = batch.lemmas[first + row]
+            for j, lemma2 in enumerate(batch.lemmas):
+                sim = word_sim.lemma_similarity(lemma1, lemma2, 'default')
+                assert format_sim(sims[row, j], zero_paths[row, j]) == \
+                    u"{0}".format(sim), (lemma1, lemma2)
+
+
+def test_candidates():
+    word_sim = RandomWordSimilarity(n_lemmas=40, seed=1)
+    batch = BatchSimilarity(word_sim, word_sim.wrapper.definitions,
+                            block_size=7)
+    n_candidates = 0
+    for first, candidates in batch.candidates():
+        for row, row_candidates in enumerate(candidates):
+            lemma1 = batch.lemmas[first + row]
+            row_candidates = set(row_candidates)
+            n_candidates += len(row_candidates)
+            for j, lemma2 in enumerate(batch.lemmas):
+                if j not in row_candidates and lemma1 != lemma2:
+                    assert word_sim.lemma_similarity(
+                        lemma1, lemma2, 'default') == 0, (lemma1, lemma2)
+    assert n_candidates < len(batch.lemmas) ** 2
+
+
+class Comparer(SimComparer):
+    """A SimComparer without vectors, of a RandomWordSimilarity."""
+    def __init__(self):
+        pass
+
+
+def sim_file(tmpdir, engine, sim=None, word_pairs=False, n_words=None,
+             **options):
+    """The lines of the sim file and the machine_sims of a Comparer with
+    @p engine and the machine @p options, calling @p sim(comparer, w1, w2)
+    instead of sim() if given, with the pairs as WordPairs if
+    @p word_pairs, and of the first @p n_words words only if given."""
+    comparer = Comparer()
+    comparer.config = ConfigParser()
+    comparer.config.add_section('machine')
+    file_name = str(tmpdir.join(engine))
+    comparer.config.set('machine', 'sim_file', file_name)
+    comparer.config.set('machine', 'sim_engine', engine)
+    for option, value in options.iteritems():
+        comparer.config.set('machine', option, str(value))
+    if sim is not None:
+        comparer.sim = lambda w1, w2: sim(comparer, w1, w2)
+    comparer.sim_wrapper = RandomWordSimilarity(n_lemmas=40, seed=2)
+    words = sorted(comparer.sim_wrapper.wrapper.definitions) + [u'oov']
+    words = words[:n_words]
+    comparer.non_oov = set(words)
+    if word_pairs:
+        comparer.sorted_word_pairs = WordPairs(words)
+    else:
+        comparer.sorted_word_pairs = set(
+            (w1, w2) for w1 in words for w2 in words if w1 < w2)
+    comparer.get_machine_sims()
+    if not os.path.exists(file_name):
+        # the similarities are in a sim_matrix
+        return [], comparer.machine_sims
+    # 1 and 1.0 are the same, lemma_similarity() takes either when tied
+    lines = sorted(line.rstrip('\n').split('\t') for line in open(file_name))
+    return ([(pair, None if sim == 'None' else float(sim))
+             for pair, sim in lines], comparer.machine_sims)
+
+
+def test_join_engine(tmpdir):
+    assert sim_file(tmpdir, 'join') == sim_file(tmpdir, 'scalar')
+
+
+@pytest.mark.parametrize('options', [
+    dict(sim_engine='scalar'), dict(sim_engine='batch'),
+    dict(sim_engine='join'), dict(sim_shards=2, sim_processes=1),
+    dict(sim_shards=3, sim_processes=1, word_pairs=True)])
+def test_sim_matrix(tmpdir, options):
+    _, expected = sim_file(tmpdir, 'scalar')
+    file_name = str(tmpdir.join('machine_sims.npy'))
+    _, matrix = sim_file(tmpdir, 'matrix', sim_matrix=file_name, **options)
+    assert isinstance(matrix, SimMatrix)
+    assert len(matrix.sims) == len(expected)
+    for pair, sim in expected.iteritems():
+        assert abs(matrix[pair] - sim) < 1e-6
+
+
+@pytest.mark.parametrize('engine', ['batch', 'join'])
+def test_sim_matrix_by_row(tmpdir, monkeypatch, engine):
+    """The batch and join engines write a matrix of all pairs a row at a
+    time, without the pairs by row."""
+    def no_pairs(comparer, out):
+        raise AssertionError('pairs by row')
+    monkeypatch.setattr(SimComparer, 'get_batch_pairs', no_pairs)
+    _, expected = sim_file(tmpdir, 'scalar')
+    file_name = str(tmpdir.join('machine_sims.npy'))
+    _, matrix = sim_file(tmpdir, 'matrix', sim_matrix=file_name,
+                         sim_engine=engine, word_pairs=True)
+    assert not numpy.isnan(matrix.sims).any()
+    for pair, sim in expected.iteritems():
+        assert abs(matrix[pair] - sim) < 1e-6
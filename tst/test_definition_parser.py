@@ -0,0 +1,43 @@
+import glob
+import os
+
+import pyparsing
+
+from pymachine.definition_parser import DefinitionParser, FastDefinitionParser
+
+dat_dir = os.path.join(os.path.dirname(__file__), '..', 'dat')
+
+formulas = [
+    "animal",
+    "animal[wild], EAT grass",
+    "[vet] HEAL [animal], [vet] HAS [hair]",
+    "=AGT CAUSE[=PAT[healthy]]",
+    "=AGT =REL =PAT",
+    "$HUN_GO_SRC, #ElviraAVM, @Budapest-Nyugati",
+    "<big>, <=AGT> HAS <hair>",
+    "in/2758, IN/13 house, 'ER, ER'",
+    "color(red), want(=AGT HAS =PAT)",
+    "-not, IS_A class",
+    "animal[",
+    "HAS HAS",
+]
+
+
+def parse(parser, s):
+    try:
+        return parser.parse(s)
+    except pyparsing.ParseException:
+        return None
+
+
+def definition_lines():
+    for fn in sorted(glob.glob(os.path.join(dat_dir, '*_definitions'))):
+        for line in open(fn):
+            # id headword pos translations: definition
+            yield line.split(':', 1)[-1].strip()
+
+
+def test_fast_parser_conformance():
+    parser, fast_parser = DefinitionParser(), FastDefinitionParser()
+    for s in formulas + list(definition_lines()):
+        assert parse(fast_parser, s) == parse(parser, s), s
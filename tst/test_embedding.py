@@ -0,0 +1,74 @@
+from ConfigParser import ConfigParser
+import struct
+
+import numpy
+
+from pymachine.embedding import Embedding
+from pymachine.similarity import SimComparer
+
+WORD = u'\xe1rv\xedzt\u0171r\u0151'
+
+
+def write_word2vec(file_name, vectors):
+    """A binary word2vec model of (word, vector) pairs."""
+    with open(file_name, 'wb') as f:
+        f.write('{0} {1}\n'.format(len(vectors), len(vectors[0][1])))
+        for word, vector in vectors:
+            f.write(word.encode('utf-8') + ' ')
+            f.write(struct.pack('{0}f'.format(len(vector)), *vector))
+            f.write('\n')
+
+
+def model(tmpdir):
+    rnd = numpy.random.RandomState(0)
+    vectors = [(u'w{0}'.format(i), rnd.randn(5).astype(numpy.float32))
+               for i in xrange(50)]
+    vectors.append((WORD, numpy.ones(5, numpy.float32)))
+    file_name = str(tmpdir.join('model.bin'))
+    write_word2vec(file_name, vectors)
+    return file_name, dict(vectors)
+
+
+def test_read_word2vec(tmpdir):
+    file_name, vectors = model(tmpdir)
+    words = set([u'w3', u'w49', u'oov', WORD])
+    embedding = Embedding.read_word2vec(file_name, words)
+    assert sorted(embedding.words) == sorted(words - set([u'oov']))
+    assert u'oov' not in embedding
+    for word in embedding.words:
+        assert (embedding[word] == vectors[word]).all()
+
+
+class Comparer(SimComparer):
+    def __init__(self, tmpdir, words):
+        self.config = ConfigParser()
+        self.config.add_section('vectors')
+        self.config.add_section('words')
+        self.config.set('vectors', 'model', str(tmpdir.join('model.bin')))
+        self.config.set('vectors', 'model_type', 'word2vec')
+        self.config.set('vectors', 'cache', str(tmpdir.join('vectors')))
+        word_file = str(tmpdir.join('words'))
+        with open(word_file, 'w') as f:
+            f.write(u'\n'.join(words).encode('utf-8'))
+        self.config.set('words', 'word_file', word_file)
+        self.reads = 0
+        self.get_vec_sim()
+
+    def read_vectors(self, model_fn, model_type):
+        self.reads += 1
+        return SimComparer.read_vectors(self, model_fn, model_type)
+
+
+def test_cache(tmpdir):
+    model(tmpdir)
+    comparer = Comparer(tmpdir, [u'w1', u'w2', u'w3'])
+    assert comparer.reads == 1
+    sim = comparer.vec_model.similarity(u'w1', u'w2')
+    comparer = Comparer(tmpdir, [u'w1', u'w2', u'w3'])
+    assert comparer.reads == 0
+    assert isinstance(comparer.vec_model.vectors, numpy.memmap)
+    assert comparer.vec_model.similarity(u'w1', u'w2') == sim
+    # other words
+    comparer = Comparer(tmpdir, [u'w1', u'w2'])
+    assert comparer.reads == 1
+    assert len(comparer.vec_model) == 2
@@ -0,0 +1,106 @@
+from ConfigParser import ConfigParser
+import random
+
+from pymachine import feature_store, similarity
+from pymachine.feature_store import FeatureStore
+from pymachine.machine import Machine
+from pymachine.sim_cache import SimCache, definitions_fingerprint
+from pymachine.similarity import SimComparer, WordSimilarity
+
+SIM_TYPES = ('default', 'links', 'strict_links', 'strict_links_and_nodes')
+
+
+class Wrapper(object):
+    batch = True
+    features = None
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+
+
+def random_definitions(n_lemmas=25, seed=0):
+    """Definitions with hypernyms, binary relations and entities, sharing
+    their concepts."""
+    rnd = random.Random(seed)
+    names = [u'w{0}'.format(i) for i in xrange(n_lemmas)]
+    concepts = [Machine(name) for name in names + [u'@e', u'=AGT', u'IS']]
+    definitions = {}
+    for lemma in names:
+        definitions[lemma] = set()
+        for _ in xrange(rnd.choice([1, 1, 2])):
+            machine = Machine(lemma)
+            for _ in xrange(rnd.randrange(3)):
+                machine.append(rnd.choice(concepts), 0)
+            if rnd.random() < 0.5:
+                relation = Machine(rnd.choice([u'HAS', u'in']))
+                relation.append(machine, 1)
+                relation.append(rnd.choice(concepts), 2)
+            definitions[lemma].add(machine)
+    for _ in xrange(n_lemmas):
+        rnd.choice(concepts).append(rnd.choice(concepts), 0)
+    return definitions
+
+
+def similarities(word_sim):
+    definitions = word_sim.wrapper.definitions
+    return [word_sim.machine_similarity(m1, m2, sim_type)
+            for sim_type in SIM_TYPES
+            for lemma1 in sorted(definitions)
+            for lemma2 in sorted(definitions)
+            for m1 in definitions[lemma1] for m2 in definitions[lemma2]]
+
+
+def test_same_as_scanning_the_sets():
+    definitions = random_definitions()
+    word_sim = WordSimilarity(Wrapper(definitions), SimCache())
+    assert len(word_sim.features) == sum(map(len, definitions.values()))
+    old_sim = WordSimilarity(Wrapper(definitions), SimCache())
+    old_sim.features = None
+    assert similarities(word_sim) == similarities(old_sim)
+    for machines in definitions.itervalues():
+        for machine in machines:
+            assert (word_sim.get_links_nodes(machine) ==
+                    old_sim.get_links_nodes(machine))
+
+
+def test_save_and_load(tmpdir):
+    file_name = str(tmpdir.join('lexicon.features'))
+    store = FeatureStore.build(random_definitions())
+    store.save(file_name)
+    definitions = random_definitions()
+    loaded = FeatureStore.load(file_name, definitions)
+    assert len(loaded.rows) == len(loaded)
+    wrapper = Wrapper(definitions)
+    wrapper.features = loaded
+    word_sim = WordSimilarity(wrapper, SimCache())
+    old_sim = WordSimilarity(Wrapper(definitions), SimCache())
+    old_sim.features = None
+    assert similarities(word_sim) == similarities(old_sim)
+    assert FeatureStore.load(file_name, random_definitions(seed=1)) is None
+
+
+class Comparer(SimComparer):
+    def __init__(self, tmpdir):
+        self.config = ConfigParser()
+        self.config_file = str(tmpdir.join('sims.cfg'))
+
+
+def test_fingerprint_once(tmpdir, monkeypatch):
+    """On a cold start, the definitions are fingerprinted once, for both
+    the feature store and the sim cache."""
+    calls = []
+
+    def fingerprint(definitions):
+        calls.append(definitions)
+        return definitions_fingerprint(definitions)
+    for module in (feature_store, similarity):
+        monkeypatch.setattr(module, 'definitions_fingerprint', fingerprint,
+                            raising=False)
+    definitions = random_definitions()
+    wrapper = Wrapper(definitions)
+    sim_cache = Comparer(tmpdir).get_sim_cache(wrapper)
+    word_sim = WordSimilarity(wrapper, sim_cache)
+    assert len(calls) == 1
+    assert sim_cache.fingerprint == word_sim.features.fingerprint == \
+        definitions_fingerprint(definitions)
+    sim_cache.close()
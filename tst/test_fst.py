@@ -0,0 +1,76 @@
+from itertools import permutations
+
+from pymachine.construction import VerbConstruction
+from pymachine.control import ConceptControl, KRPosControl
+from pymachine.fst import FSA, MatchMemo
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+from pymachine.matcher import KRPosMatcher, PrintnameMatcher
+
+
+class CountingMatcher(PrintnameMatcher):
+    calls = 0
+
+    def _match(self, machine):
+        CountingMatcher.calls += 1
+        return PrintnameMatcher._match(self, machine)
+
+
+def test_nondeterministic_fsa():
+    fsa = FSA()
+    for state in 'abcd':
+        fsa.add_state(state, is_init=(state == 'a'), is_final=(state == 'd'))
+    fsa.add_transition(PrintnameMatcher('x'), 'a', 'b')
+    fsa.add_transition(PrintnameMatcher('x|y'), 'a', 'c')
+    fsa.add_transition(PrintnameMatcher('y'), 'b', 'd')
+    fsa.add_transition(PrintnameMatcher('z'), 'c', 'd')
+    x, y, z = [Machine(name, ConceptControl()) for name in 'xyz']
+    fsa.reset()
+    fsa.read(x)
+    assert fsa.active_states == set(['b', 'c'])
+    for seq, accepted in (([x, y], True), ([x, z], True), ([y, z], True),
+                          ([y, y], False), ([x], False)):
+        fsa.reset()
+        fsa.read(seq)
+        assert fsa.in_final() == accepted
+    fsa.read(x)
+    assert fsa.active_states == set()
+
+
+def test_memo_runs_each_matcher_once():
+    fsa = FSA()
+    fsa.add_state('0', is_init=True)
+    fsa.add_state('1', is_final=True)
+    fsa.add_transition(CountingMatcher('x'), '0', '1')
+    fsa.add_transition(CountingMatcher('x'), '1', '1')
+    x = Machine('x', ConceptControl())
+    memo = MatchMemo()
+    CountingMatcher.calls = 0
+    for _ in xrange(3):
+        fsa.reset()
+        fsa.read([x, x, x], dry_run=True, memo=memo)
+        assert fsa.in_final()
+    assert CountingMatcher.calls == 2
+
+
+def test_matching_sequences_equal_permutations():
+    verb = Machine(u'megy', ConceptControl())
+    for argument in ('=AGT', '=TO', '$SRC'):
+        verb.append(Machine(argument, ConceptControl()), 0)
+    lexicon = Lexicon()
+    lexicon.add_static([verb])
+    lexicon.finalize_static()
+    supp_dict = {'$SRC': KRPosMatcher('NOUN<CAS<ELA>>')}
+    construction = VerbConstruction(u'megy', lexicon, supp_dict)
+    analyses = ('megy/VERB', 'vonat/NOUN<CAS<NOM>>', 'haz/NOUN<CAS<ELA>>',
+                'szeged/NOUN<CAS<NOM>>', 'gyorsan/ADV')
+    machines = [Machine(analysis.split('/')[0], KRPosControl(analysis))
+                for analysis in analyses]
+    expected = [seq for length in xrange(1, 5)
+                for seq in permutations(machines, length)
+                if construction.check(seq)]
+    assert len(expected) > 1
+    memo = MatchMemo()
+    assert construction.matching_sequences(machines, 4) == expected
+    assert construction.matching_sequences(machines, 4, memo) == expected
+    assert construction.matching_sequences(machines, 4, memo) == expected
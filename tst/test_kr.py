@@ -0,0 +1,70 @@
+import copy
+import cPickle
+import random
+
+from pymachine.control import KRPosControl
+from pymachine.kr import FeatStruct, compile_pattern, freeze, match_pattern
+from pymachine.operators import FeatChangeOperator
+from pymachine.machine import Machine
+
+
+def subset(small, large):
+    """KRPosMatcher._subset() before patterns were compiled."""
+    for key in small:
+        if key not in large:
+            return False
+        else:
+            if type(small[key]) == dict:
+                return subset(small[key], large[key])
+            else:
+                if small[key] != large[key]:
+                    if len(small[key]) == 0 or small[key][0] != '@':
+                        return False
+    return True
+
+
+def old_match(small, large):
+    try:
+        return subset(small, large)
+    except Exception:
+        return False
+
+
+def random_features(rnd, depth=0):
+    features = {}
+    for key in rnd.sample(['CAT', 'CAS', 'BAR', 'DEF', 'POSS'],
+                          rnd.randrange(4)):
+        if depth < 2 and rnd.random() < 0.3:
+            features[key] = random_features(rnd, depth + 1)
+        else:
+            features[key] = rnd.choice(['NOUN', 'ACC', '1', '0', '@a', ''])
+    return features
+
+
+def test_compiled_patterns():
+    rnd = random.Random(0)
+    for _ in xrange(5000):
+        pattern, features = random_features(rnd), random_features(rnd)
+        assert (match_pattern(compile_pattern(pattern), features) ==
+                old_match(pattern, features)), (pattern, features)
+
+
+def test_feat_struct():
+    features = freeze({'CAT': 'NOUN', 'CAS': {'ACC': '1'}})
+    assert isinstance(features['CAS'], FeatStruct)
+    try:
+        features['CAT'] = 'VERB'
+        assert False
+    except TypeError:
+        pass
+    assert copy.deepcopy(features) is features
+    assert cPickle.loads(cPickle.dumps(features, 2)) == features
+
+
+def test_copy_on_write():
+    m1 = Machine('kockat', KRPosControl('kocka/NOUN<CAS<ACC>>'))
+    m2 = Machine('kockat', KRPosControl('kocka/NOUN<CAS<ACC>>'))
+    assert m1.control.kr is m2.control.kr
+    FeatChangeOperator('BAR', '1').act([m1])
+    assert m1.control.kr['BAR'] == '1'
+    assert 'BAR' not in m2.control.kr
@@ -0,0 +1,83 @@
+import copy
+from itertools import chain
+import random
+
+from pymachine.control import ConceptControl
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+
+
+def definition(name, *children):
+    m = Machine(name, ConceptControl())
+    for child in children:
+        m.append(Machine(child, ConceptControl()), 0)
+    return m
+
+
+def baseline_activate(lexicon):
+    """Lexicon.activate() as it was before the activation index."""
+    activated = []
+    for printname, static_machines in lexicon.static.iteritems():
+        for static_machine in static_machines:
+            if printname in lexicon.active:
+                continue
+            has_machine = False
+            for machine in chain(*static_machine.partitions):
+                has_machine = True
+                if (not unicode(machine).startswith(u'#') and
+                        unicode(machine) not in lexicon.active):
+                    break
+            else:
+                if has_machine:
+                    m = Machine(printname, copy.copy(static_machine.control))
+                    lexicon.add_active(m)
+                    activated.append(m)
+    return activated
+
+
+def names(machines):
+    return [m.printname() for m in machines]
+
+
+def test_activate():
+    lexicon = Lexicon()
+    lexicon.add_static([
+        definition(u'dog', u'animal', u'bark'),
+        definition(u'pet', u'animal'),
+        definition(u'fur', u'#COLOR'),
+        definition(u'coat', u'#COLOR', u'#SIZE'),
+        definition(u'mane', u'#COLOR', u'hair'),
+        definition(u'thing')])
+    lexicon.finalize_static()
+    lexicon.add_active([Machine(w, ConceptControl())
+                        for w in (u'dog', u'animal', u'bark', u'fur')])
+    activated = lexicon.activate()
+    assert sorted(names(activated)) == [u'coat']
+    assert activated[0].control is not lexicon.static[u'coat'][0].control
+    assert isinstance(activated[0].control, ConceptControl)
+    assert sorted(lexicon.active) == [
+        u'animal', u'bark', u'coat', u'dog', u'fur']
+    assert lexicon.activate() == []
+    lexicon.clear_active()
+    assert sorted(names(lexicon.activate())) == [u'coat', u'fur']
+
+
+def test_activate_same_as_baseline():
+    rnd = random.Random(0)
+    words = [u'w{0}'.format(i) for i in xrange(30)]
+    avms = [u'#A{0}'.format(i) for i in xrange(3)]
+    expected, lexicon = Lexicon(), Lexicon()
+    for name in words:
+        children = rnd.sample(words + avms, rnd.randint(0, 3))
+        expected.add_static(definition(name, *children))
+        lexicon.add_static(definition(name, *children))
+    for rounds in xrange(3):
+        active = [Machine(w, ConceptControl()) for w in rnd.sample(words, 5)]
+        expected.add_active(active)
+        lexicon.add_active(active)
+        for _ in xrange(2):
+            assert names(lexicon.activate()) == names(
+                baseline_activate(expected))
+            assert lexicon.active.keys() == expected.active.keys()
+        expected.clear_active()
+        lexicon.clear_active()
@@ -0,0 +1,116 @@
+from itertools import permutations
+import sys
+import threading
+
+from pymachine import np_grammar
+from pymachine.control import ConceptControl, KRPosControl
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+
+
+def definition(name, *children):
+    m = Machine(name, ConceptControl())
+    for child in children:
+        m.append(Machine(child, ConceptControl()), 0)
+    return m
+
+
+def small_lexicon():
+    lexicon = Lexicon()
+    lexicon.add_static([
+        definition(u'dog', u'animal', u'bark'),
+        definition(u'cat', u'animal', u'meow'),
+        definition(u'pet', u'animal'),
+        definition(u'animal', u'live'),
+        definition(u'fur', u'#COLOR')])
+    lexicon.finalize_static()
+    return lexicon
+
+
+def names(machines):
+    return sorted(m.printname() for m in machines)
+
+
+def run(lexicon, words):
+    lexicon.add_active([Machine(w, ConceptControl()) for w in words])
+    for m in lexicon.get_unexpanded():
+        lexicon.expand(m)
+    return names(lexicon.activate()), sorted(lexicon.active)
+
+
+def test_session_matches_lexicon():
+    lexicon = small_lexicon()
+    expected = run(lexicon, [u'dog', u'bark'])
+    lexicon.clear_active()
+
+    session = small_lexicon().session()
+    assert run(session, [u'dog', u'bark']) == expected
+    assert expected[0] == [u'fur']
+
+
+def test_sessions_are_independent():
+    lexicon = small_lexicon()
+    static = dict((k, list(v)) for k, v in lexicon.static.iteritems())
+    dog, cat = lexicon.session(), lexicon.session()
+    run(dog, [u'dog'])
+    assert u'meow' not in dog.active
+    assert run(cat, [u'meow']) == ([u'fur'], [u'fur', u'meow'])
+    assert lexicon.active == {}
+    assert dict((k, list(v)) for k, v in lexicon.static.iteritems()) == static
+
+    unknown = dog.get_machine(u'unicorn')
+    assert dog.get_machine(u'unicorn') is unknown
+    assert u'unicorn' not in lexicon.static
+
+
+def chunk_machines():
+    return [Machine(name, KRPosControl(kr)) for name, kr in (
+        (u'piros', 'ADJ'), (u'kocka', 'NOUN<BAR<0>>'), (u'harom', 'NUM'),
+        (u'kis', 'NOUN<BAR<1>>'))]
+
+
+def test_check_keeps_control_state():
+    """check() does not use the active states of the shared control, that
+    other threads would change meanwhile."""
+    piros, kocka = chunk_machines()[:2]
+    rule = np_grammar.np_rules[0]
+    rule.control.reset()
+    rule.control.read(piros)
+    active = rule.control.active
+    assert rule.check([piros, kocka])
+    assert not rule.check([kocka])
+    assert rule.control.active == active
+
+
+def test_shared_constructions_in_threads():
+    """The chunk constructions are shared by the sessions: checking them
+    in several threads at the same time gives the same results as one by
+    one."""
+    seqs = [list(seq) for length in (1, 2)
+            for seq in permutations(chunk_machines(), length)]
+    rules = np_grammar.np_rules
+
+    def check_all():
+        return [[rule.check(seq) for seq in seqs] for rule in rules]
+
+    expected = check_all()
+    assert any(any(checks) for checks in expected)
+    results = []
+
+    def work():
+        for _ in xrange(20):
+            results.append(check_all())
+
+    interval = sys.getcheckinterval()
+    # switch threads as often as possible
+    sys.setcheckinterval(1)
+    try:
+        threads = [threading.Thread(target=work) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setcheckinterval(interval)
+    assert len(results) == 80
+    assert all(result == expected for result in results)
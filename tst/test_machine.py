@@ -0,0 +1,111 @@
+import cPickle
+import pickle
+import random
+
+import pytest
+
+from pymachine.control import ConceptControl
+from pymachine.machine import Machine, Partition
+
+
+class BaselineMachine(object):
+    """A machine as pickled before Machine had __slots__: with a __dict__
+    of its attributes and lists as partitions."""
+    def __init__(self, name, control=None, part_num=3):
+        self.printname_ = name
+        self.partitions = [[] for i in range(part_num)]
+        self.control = control
+        if control is not None:
+            control.machine = self
+        self.parents = set()
+
+    def append(self, what, which_partition=0):
+        self.partitions[which_partition].append(what)
+        what.parents.add((self, which_partition))
+
+
+def baseline_pickle(machine, protocol):
+    """@p machine pickled as a baseline Machine."""
+    return pickle.dumps(machine, protocol).replace(
+        '{0}\nBaselineMachine\n'.format(BaselineMachine.__module__),
+        'pymachine.machine\nMachine\n')
+
+
+@pytest.mark.parametrize('protocol', [0, 2])
+@pytest.mark.parametrize('loads', [pickle.loads, cPickle.loads])
+def test_load_baseline_pickle(protocol, loads):
+    dog = BaselineMachine(u'dog', ConceptControl())
+    animal = BaselineMachine(u'animal', ConceptControl())
+    bark = BaselineMachine(u'bark')
+    dog.append(animal, 0)
+    bark.append(dog, 1)
+    dog.append(bark, 0)
+
+    loaded = loads(baseline_pickle(dog, protocol))
+    assert type(loaded) is Machine
+    assert loaded.printname_ == u'dog'
+    assert isinstance(loaded.control, ConceptControl)
+    assert loaded.control.machine is loaded
+    animal, bark = loaded.partitions[0]
+    assert (type(animal), type(bark)) == (Machine, Machine)
+    assert animal.printname() == u'animal'
+    assert loaded.partitions[1:] == [[], []]
+    assert bark.partitions[1] == [loaded]
+    assert loaded.parents == set([(bark, 1)])
+    assert animal.parents == set([(loaded, 0)])
+    # the partitions work as the ones of new machines
+    loaded.remove(animal, 0)
+    assert loaded.partitions[0] == [bark] and animal.parents == set()
+
+
+def test_pickle_round_trip():
+    dog = Machine(u'dog', ConceptControl())
+    dog.append(Machine(u'animal'), 0)
+    loaded = pickle.loads(pickle.dumps(dog, 2))
+    assert loaded.printname_ == u'dog'
+    assert [m.printname() for m in loaded.partitions[0]] == [u'animal']
+    assert loaded.partitions[0][0].parents == set([(loaded, 0)])
+
+
+def test_partition_same_as_list():
+    """Random changes to a Partition and a list, with holes left in the
+    Partition by remove()."""
+    rnd = random.Random(0)
+    for _ in xrange(100):
+        partition, expected = Partition(), []
+        for _ in xrange(300):
+            what, op = rnd.randrange(30), rnd.random()
+            if op < 0.45:
+                partition.append(what)
+                expected.append(what)
+            elif op < 0.8:
+                if what in expected:
+                    expected.remove(what)
+                    partition.remove(what)
+                else:
+                    with pytest.raises(ValueError):
+                        partition.remove(what)
+            elif op < 0.85 and expected:
+                i = rnd.randrange(len(expected))
+                assert partition[i] == expected[i]
+                partition[i] = expected[i] = what
+            elif op < 0.9:
+                partition.insert(3, what)
+                expected.insert(3, what)
+            elif op < 0.93 and expected:
+                assert partition.pop() == expected.pop()
+            assert (what in partition) == (what in expected)
+            assert list(partition) == expected
+            assert len(partition) == len(expected)
+        assert partition == expected and expected == partition
+        assert [] + partition == expected and partition[1:] == expected[1:]
+        assert repr(partition) == repr(expected)
+
+
+def test_partition_remove_keeps_order():
+    partition = Partition(range(20))
+    for what in (3, 0, 19, 7):
+        partition.remove(what)
+    assert partition.holes == 3
+    assert list(partition) == [1, 2, 4, 5, 6] + range(8, 19)
+    assert partition[0] == 1 and partition.holes == 0
@@ -0,0 +1,35 @@
+from pymachine.minhash import MinHashIndex
+from pymachine.sim_cache import SimCache
+from pymachine.similarity import WordSimilarity
+
+from test_feature_store import Wrapper, random_definitions
+
+
+def test_query():
+    definitions = random_definitions(40)
+    word_sim = WordSimilarity(Wrapper(definitions), SimCache())
+    index = MinHashIndex(word_sim, n_hashes=32, band_size=2)
+    for lemma in sorted(definitions):
+        exact = dict(
+            (other, word_sim.lemma_similarity(lemma, other, 'default'))
+            for other in definitions if other != lemma)
+        result = index.query(lemma, k=5)
+        assert len(result) <= 5
+        assert result == sorted(result, reverse=True)
+        for sim, other in result:
+            assert sim == exact[other]
+        # the lemmas of 0-paths and of the contains() rules are always
+        # found
+        found = set(other for _, other in index.query(lemma, k=100))
+        for other, sim in exact.iteritems():
+            if sim in (1, 0.35, 0.25):
+                assert other in found, (lemma, other)
+
+
+def test_most_similar_builds_index_once():
+    word_sim = WordSimilarity(Wrapper(random_definitions()), SimCache())
+    result = word_sim.most_similar(u'w0', k=3, band_size=8)
+    index = word_sim.minhash_index
+    assert index.band_size == 8
+    assert word_sim.most_similar(u'w0', k=3) == result
+    assert word_sim.minhash_index is index
@@ -0,0 +1,70 @@
+import json
+import os
+from StringIO import StringIO
+import time
+
+from pymachine.artifacts import BackgroundArtifactSink, create_sink
+from pymachine.batch_run import run_corpus
+from pymachine.lexicon import Lexicon
+from pymachine.wrapper import Wrapper
+
+
+class CountingWrapper(Wrapper):
+    """Returns the number of tokens instead of running the activation, and
+    writes them as an artifact."""
+    def __init__(self, artifacts=None):
+        self.lexicon = Lexicon()
+        self.processes = 1
+        self.artifacts = artifacts or create_sink()
+
+    def run(self, sentence):
+        if not sentence:
+            raise ValueError('empty sentence')
+        self.artifacts.write(
+            '{0}.txt'.format(len(sentence)), lambda: str(len(sentence)))
+        return [{'tokens': len(sentence)}]
+
+
+def test_run_many_keeps_order():
+    sentences = [[['a', 'a/NOUN']] * (i % 7) for i in xrange(50)]
+    expected = [([{'tokens': len(s)}], None) if s else
+                (None, u'ValueError: empty sentence') for s in sentences]
+    wrapper = CountingWrapper()
+    assert list(wrapper.run_many(iter(sentences))) == expected
+    assert list(wrapper.run_many(
+        iter(sentences), processes=3, chunk_size=4)) == expected
+
+
+def test_json_lines():
+    sentences = StringIO(
+        '[["ate", "eat/VERB"]]\n\n[]\n'
+        '[[[["the", "the/ART"], ["dog", "dog/NOUN"]], "NP"]]\n')
+    out = StringIO()
+    run_corpus(CountingWrapper(), sentences, out, processes=2)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    # the indices are the ones of the lines, with the empty one
+    assert lines == [
+        {'sentence': 0, 'avms': [{'tokens': 1}]},
+        {'sentence': 2, 'error': 'ValueError: empty sentence'},
+        {'sentence': 3, 'avms': [{'tokens': 1}]}]
+
+
+class SlowSink(BackgroundArtifactSink):
+    def _write_file(self, file_name, contents):
+        time.sleep(0.02)
+        BackgroundArtifactSink._write_file(self, file_name, contents)
+
+
+def test_artifacts_of_workers(tmpdir):
+    """The workers are terminated in the end: the artifacts they queued
+    are written before."""
+    path = str(tmpdir)
+    wrapper = CountingWrapper(SlowSink(path))
+    sentences = [[['a', 'a/NOUN']] * i for i in xrange(1, 20)]
+    results = list(wrapper.run_many(iter(sentences), processes=3,
+                                    chunk_size=2))
+    assert all(error is None for _, error in results)
+    assert sorted(os.listdir(path)) == sorted(
+        '{0}.txt'.format(i) for i in xrange(1, 20))
+    wrapper.close()
+    assert not wrapper.artifacts.thread.is_alive()
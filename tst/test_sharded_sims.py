@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from test_batch_similarity import sim_file
+
+
+class Crash(Exception):
+    pass
+
+
+def same(result, expected):
+    """The same lines, and machine_sims up to the precision of the file
+    they are read from."""
+    (lines, sims), (expected_lines, expected_sims) = result, expected
+    return lines == expected_lines and sorted(sims) == sorted(
+        expected_sims) and all(abs(sims[pair] - expected_sims[pair]) < 1e-9
+                               for pair in sims)
+
+
+def test_shards_same_as_scalar(tmpdir):
+    expected = sim_file(tmpdir, 'scalar')
+    assert same(sim_file(tmpdir, 'scalar', sim_shards=3, sim_processes=1),
+                expected)
+    assert same(sim_file(tmpdir, 'scalar', sim_shards=4, sim_processes=2),
+                expected)
+    assert os.path.exists(str(tmpdir.join('scalar.3.checkpoint')))
+
+
+def test_resume(tmpdir):
+    expected = sim_file(tmpdir, 'scalar')
+    calls = []
+
+    def crash_at(n):
+        def sim(comparer, w1, w2):
+            calls.append((w1, w2))
+            if len(calls) == n:
+                raise Crash()
+            return comparer.sim_wrapper.word_similarity(w1, w2, -1, -1)
+        return sim
+
+    options = dict(sim_shards=3, sim_processes=1, sim_checkpoint=7)
+    with pytest.raises(Crash):
+        sim_file(tmpdir, 'scalar', sim=crash_at(500), **options)
+    del calls[:]
+    assert same(sim_file(tmpdir, 'scalar', sim=crash_at(0), **options),
+                expected)
+    n_pairs = len(expected[0])
+    # the first shard was done, the second went on from its checkpoint
+    assert n_pairs - 500 < len(calls) < n_pairs - 500 + 7
+    del calls[:]
+    assert same(sim_file(tmpdir, 'scalar', sim=crash_at(0), **options),
+                expected)
+    assert calls == []
+
+
+def test_short_shard_file(tmpdir):
+    """A shard file shorter than its checkpoint says is run again."""
+    expected = sim_file(tmpdir, 'scalar')
+    calls = []
+
+    def sim(comparer, w1, w2):
+        calls.append((w1, w2))
+        return comparer.sim_wrapper.word_similarity(w1, w2, -1, -1)
+
+    options = dict(sim_shards=3, sim_processes=1)
+    assert same(sim_file(tmpdir, 'scalar', sim=sim, **options), expected)
+    shard_file = str(tmpdir.join('scalar.1'))
+    with open(shard_file) as f:
+        lines = f.readlines()
+    with open(shard_file, 'w') as f:
+        f.writelines(lines[:-5])
+    del calls[:]
+    assert same(sim_file(tmpdir, 'scalar', sim=sim, **options), expected)
+    assert len(calls) == len(lines)
+
+
+def test_more_shards_than_pairs(tmpdir):
+    """Empty shards have empty files."""
+    expected = sim_file(tmpdir, 'scalar', n_words=3)
+    assert len(expected[0]) == 3
+    assert same(sim_file(tmpdir, 'scalar', n_words=3, sim_shards=4,
+                         sim_processes=1), expected)
+    # an empty shard whose file is left from a run of other pairs
+    with open(str(tmpdir.join('scalar.0')), 'w') as f:
+        f.write('a_b\t0.5\n')
+    assert same(sim_file(tmpdir, 'scalar', n_words=1, sim_shards=2,
+                         sim_processes=1), ([], {}))
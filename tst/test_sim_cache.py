@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+from pymachine.machine import Machine
+from pymachine.sim_cache import LRUCache, SimCache, definitions_fingerprint
+
+
+def test_lru_cache():
+    lru = LRUCache(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    lru.get('a')
+    lru.put('c', 3)
+    assert 'a' in lru and 'c' in lru and 'b' not in lru
+
+
+def test_sim_cache():
+    fd, file_name = tempfile.mkstemp(suffix='.simcache')
+    os.close(fd)
+    try:
+        cache = SimCache(file_name, 'f1', max_size=1)
+        cache.put(u'dog', u'cat', 'default', 0.5)
+        cache.put('dog', 'bird', 'default', 1)
+        cache.close()
+
+        cache = SimCache(file_name, 'f1')
+        assert cache.get(u'cat', u'dog', 'default') == 0.5
+        sim = cache.get(u'bird', u'dog', 'default')
+        assert sim == 1 and isinstance(sim, int)
+        assert cache.get(u'cat', u'dog', 'links') is None
+        cache.close()
+
+        assert SimCache(file_name, 'f2').get(
+            u'cat', u'dog', 'default') is None
+    finally:
+        os.remove(file_name)
+
+
+def test_definitions_fingerprint():
+    def definitions(child):
+        dog = Machine(u'dog')
+        dog.append(Machine(child), 0)
+        return {u'dog': set([dog])}
+    assert (definitions_fingerprint(definitions(u'animal')) ==
+            definitions_fingerprint(definitions(u'animal')))
+    assert (definitions_fingerprint(definitions(u'animal')) !=
+            definitions_fingerprint(definitions(u'plant')))
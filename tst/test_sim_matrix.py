@@ -0,0 +1,91 @@
+import re
+
+import numpy
+import pytest
+from scipy.stats.stats import pearsonr
+
+from pymachine.sim_matrix import SimMatrix, WordPairs, pearson
+from pymachine.similarity import SimComparer
+
+
+def test_pairs_in_matrix_order(tmpdir):
+    words = [u'b', u'a', u'd', u'c', u'e']
+    matrix = SimMatrix.create(str(tmpdir.join('sims.npy')), sorted(words))
+    pairs = WordPairs(words)
+    assert len(pairs) == len(matrix.sims) == 10
+    assert (u'a', u'b') in pairs and (u'b', u'a') not in pairs
+    for i, pair in enumerate(pairs):
+        assert matrix.offset(*pair) == i
+        matrix[pair] = i
+    matrix.flush()
+    matrix = SimMatrix.open(str(tmpdir.join('sims.npy')))
+    assert matrix[u'e', u'c'] == matrix[u'c', u'e'] == 8
+    assert list(matrix.row(3)) == [9]
+
+
+def test_word_pairs_slice():
+    for n in xrange(7):
+        pairs = WordPairs(u'w{0}'.format(i) for i in xrange(n))
+        for begin in xrange(len(pairs) + 1):
+            for end in xrange(begin, len(pairs) + 2):
+                assert list(pairs.slice(begin, end)) == \
+                    list(pairs)[begin:end]
+
+
+def test_no_pairs(tmpdir):
+    for words in ([], [u'a']):
+        file_name = str(tmpdir.join('sims{0}.npy'.format(len(words))))
+        matrix = SimMatrix.create(file_name, words)
+        assert len(matrix.sims) == 0
+        matrix.flush()
+        matrix = SimMatrix.open(file_name)
+        assert matrix.words == words and len(matrix.sims) == 0
+
+
+def test_pearson():
+    rnd = numpy.random.RandomState(0)
+    x = rnd.rand(1000).astype(numpy.float32)
+    y = (x + rnd.rand(1000)).astype(numpy.float32)
+    y[[3, 500]] = numpy.nan
+    valid = ~numpy.isnan(y)
+    n, (r, p) = pearson(x, y, chunk_size=77)
+    expected_r, expected_p = pearsonr(x[valid].astype(float),
+                                      y[valid].astype(float))
+    assert n == 998
+    assert abs(r - expected_r) < 1e-9
+    assert abs(p - expected_p) < 1e-9 * max(expected_p, 1e-300)
+
+
+def test_pearson_undefined():
+    empty = numpy.zeros(0, numpy.float32)
+    assert pearson(empty, empty)[0] == 0
+    assert all(numpy.isnan(pearson(empty, empty)[1]))
+    x = numpy.array([1, 2, numpy.nan, 3], numpy.float32)
+    constant = numpy.ones(4, numpy.float32)
+    n, (r, p) = pearson(x, constant)
+    assert n == 3 and numpy.isnan(r) and numpy.isnan(p)
+
+
+class Comparer(SimComparer):
+    def __init__(self, machine_sims, vec_sims, pairs):
+        self.machine_sims = machine_sims
+        self.vec_sims = vec_sims
+        self.sorted_word_pairs = pairs
+
+
+@pytest.mark.parametrize('matrix', [True, False])
+def test_compare_prints_pearsonr(tmpdir, capsys, matrix):
+    words = [u'w{0}'.format(i) for i in xrange(6)]
+    pairs = WordPairs(words)
+    rnd = numpy.random.RandomState(0)
+    sims = []
+    for name in ('machine', 'vec'):
+        sim_matrix = SimMatrix.create(str(tmpdir.join(name + '.npy')), words)
+        sim_matrix.sims[:] = rnd.rand(len(pairs))
+        sims.append(sim_matrix if matrix else
+                    dict((pair, float(sim_matrix[pair])) for pair in pairs))
+    Comparer(sims[0], sims[1], pairs).compare()
+    out = capsys.readouterr()[0].splitlines()
+    assert out[0] == 'compared 15 distance pairs.'
+    assert re.match(r'^Pearson-correlation: \(-?[0-9.e-]+, [0-9.e-]+\)$',
+                    out[1])
@@ -0,0 +1,82 @@
+import os
+import random
+import tempfile
+
+from pymachine.control import ConceptControl, KRPosControl
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+from pymachine.snapshot import load_lexicon, save_lexicon
+
+
+def random_lexicon(n=200, width=3):
+    rnd = random.Random(0)
+    machines = [Machine(u'm{0}'.format(i), ConceptControl())
+                for i in xrange(n)]
+    for m in machines:
+        for _ in xrange(width):
+            m.append(machines[rnd.randrange(n)], rnd.randrange(3))
+    lexicon = Lexicon()
+    for m in machines[:n / 2]:
+        lexicon.static[m.printname_] = [m]
+    dog = Machine(u'kuty\xe1t', KRPosControl('NOUN<CAS<ACC>>'))
+    dog.append(machines[0], 1)
+    lexicon.static[u'kuty\xe1t'] = [dog]
+    lexicon.static_disambig = {'m1': set(['m1', u'm2'])}
+    return lexicon
+
+
+def graph(lexicon):
+    """The static graph with the machines numbered in traversal order."""
+    ids, machines = {}, []
+
+    def node_id(m):
+        if m not in ids:
+            ids[m] = len(machines)
+            machines.append(m)
+        return ids[m]
+
+    static = [(name, [node_id(m) for m in lexicon.static[name]])
+              for name in sorted(lexicon.static)]
+    nodes = []
+    for m in machines:
+        attrs = dict((k, v) for k, v in m.control.__dict__.iteritems()
+                     if k != 'machine')
+        nodes.append((m.printname_, type(m.control), attrs,
+                      [[node_id(c) for c in p] for p in m.partitions]))
+    parents = [sorted((p.printname_, i) for p, i in m.parents)
+               for m in machines]
+    return static, nodes, parents, lexicon.static_disambig
+
+
+def test_snapshot_round_trip():
+    lexicon = random_lexicon()
+    fd, file_name = tempfile.mkstemp(suffix='.snapshot')
+    os.close(fd)
+    try:
+        save_lexicon(lexicon, file_name)
+        loaded = load_lexicon(file_name)
+        assert graph(loaded) == graph(lexicon)
+        dog = loaded.static[u'kuty\xe1t'][0]
+        assert dog.control.machine is dog
+    finally:
+        os.remove(file_name)
+
+
+def test_assign_before_read():
+    """Partitions and parents assigned to a machine that was not read yet
+    are kept, not overwritten from the snapshot."""
+    lexicon = random_lexicon()
+    fd, file_name = tempfile.mkstemp(suffix='.snapshot')
+    os.close(fd)
+    try:
+        save_lexicon(lexicon, file_name)
+        loaded = load_lexicon(file_name)
+        m0, m1 = loaded.static[u'm0'][0], loaded.static[u'm1'][0]
+        m0.partitions = [[], [], []]
+        assert m0.partitions == [[], [], []]
+        m1.parents = set()
+        assert m1.parents == set()
+        assert len(m1.partitions[0]) + len(m1.partitions[1]) + \
+            len(m1.partitions[2]) == 3
+    finally:
+        os.remove(file_name)
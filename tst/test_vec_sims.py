@@ -0,0 +1,80 @@
+from ConfigParser import ConfigParser
+
+import numpy
+import pytest
+
+from pymachine.sim_matrix import SimMatrix
+from pymachine.similarity import SimComparer
+
+
+class VectorModel(dict):
+    """Random vectors, with the similarity() of gensim's Word2Vec."""
+    def __init__(self, words, seed=0):
+        rnd = numpy.random.RandomState(seed)
+        for word in words:
+            self[word] = rnd.randn(20).astype(numpy.float32)
+        self[words[0]][:] = 0
+
+    def similarity(self, w1, w2):
+        def unitvec(v):
+            norm = numpy.sqrt(numpy.dot(v, v))
+            return v / norm if norm else v
+        return numpy.dot(unitvec(self[w1]), unitvec(self[w2]))
+
+
+class Comparer(SimComparer):
+    def __init__(self, tmpdir, n_words=30, oov=True, **options):
+        self.config = ConfigParser()
+        self.config.add_section('vectors')
+        self.config.set('vectors', 'sim_file', str(tmpdir.join('vec_sims')))
+        for option, value in options.iteritems():
+            self.config.set('vectors', option, str(value))
+        words = [u'w{0}'.format(i) for i in xrange(n_words)]
+        self.vec_model = VectorModel(words)
+        # words missing from the model are None
+        self.non_oov = set(words + ([u'oov'] if oov else []))
+        self.sorted_word_pairs = set(
+            (w1, w2) for w1 in self.non_oov for w2 in self.non_oov if w1 < w2)
+
+
+def lines(tmpdir):
+    with open(str(tmpdir.join('vec_sims'))) as f:
+        return sorted(line.rstrip('\n').split('\t') for line in f)
+
+
+def close(sims1, sims2):
+    return sorted(sims1) == sorted(sims2) and all(
+        (sims1[pair] is None and sims2[pair] is None) or
+        abs(sims1[pair] - sims2[pair]) < 1e-6 for pair in sims1)
+
+
+def test_batch_same_as_scalar(tmpdir):
+    scalar = Comparer(tmpdir, sim_engine='scalar')
+    scalar.get_vec_sims()
+    scalar_lines = lines(tmpdir)
+    batch = Comparer(tmpdir, sim_block_size=7)
+    batch.get_vec_sims()
+    assert close(batch.vec_sims, scalar.vec_sims)
+    assert [pair for pair, _ in lines(tmpdir)] == \
+        [pair for pair, _ in scalar_lines]
+    for (_, sim), (_, scalar_sim) in zip(lines(tmpdir), scalar_lines):
+        assert sim == scalar_sim or abs(float(sim) - float(scalar_sim)) < 1e-6
+
+
+@pytest.mark.parametrize('oov', [True, False])
+def test_sim_matrix(tmpdir, oov):
+    expected = Comparer(tmpdir, oov=oov)
+    expected.get_vec_sims()
+    file_name = str(tmpdir.join('vec_sims.npy'))
+    comparer = Comparer(tmpdir, oov=oov, sim_matrix=file_name,
+                        sim_block_size=4)
+    comparer.get_vec_sims()
+    assert isinstance(comparer.vec_sims, SimMatrix)
+    matrix = SimMatrix.open(file_name)
+    assert len(matrix) == len(comparer.non_oov)
+    assert len(matrix.sims) == len(comparer.sorted_word_pairs)
+    for (w1, w2), sim in expected.vec_sims.iteritems():
+        if sim is None:
+            assert numpy.isnan(matrix[w2, w1])
+        else:
+            assert abs(matrix[w2, w1] - sim) < 1e-6
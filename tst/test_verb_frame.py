@@ -0,0 +1,37 @@
+from pymachine.construction import VerbConstruction
+from pymachine.control import ConceptControl
+from pymachine.lexicon import Lexicon
+from pymachine.machine import Machine
+from pymachine.matcher import KRPosMatcher
+
+
+def verb_lexicon(name, arguments):
+    verb = Machine(name, ConceptControl())
+    for argument in arguments:
+        verb.append(Machine(argument, ConceptControl()), 0)
+    lexicon = Lexicon()
+    lexicon.add_static([verb])
+    lexicon.finalize_static()
+    return lexicon
+
+
+def test_frame_is_shared():
+    supp_dict = {'$SRC': KRPosMatcher('NOUN<CAS<ELA>>')}
+    lexicon = verb_lexicon(u'megy', ['=AGT', '=TO', '$SRC'])
+    c1 = VerbConstruction(u'megy', lexicon.session(), supp_dict)
+    c2 = VerbConstruction(u'megy', lexicon.session(), supp_dict)
+    assert c1.frame is c2.frame
+    assert sorted(c1.matchers) == ['$SRC', '=AGT', '=TO']
+    assert c1.working_area is not c2.working_area
+    assert c1.control is not c2.control
+    assert c1.control.final_states == set(['8'])
+    # every state but the last has a transition per missing argument
+    for state in xrange(1, 8):
+        edges = c1.control.transitions[str(state)]
+        assert len(edges) == 3 - bin(state - 1).count('1')
+        for out_state, operators in edges.itervalues():
+            assert operators[0].working_area is c1.working_area
+
+    lexicon.add_static([Machine(u'fut', ConceptControl())])
+    c3 = VerbConstruction(u'megy', lexicon, supp_dict)
+    assert c3.frame is not c1.frame